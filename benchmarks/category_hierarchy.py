@@ -0,0 +1,90 @@
+"""
+Compares the /categories/{id}/children/ and /parents/ queries before and after parent_id/depth were added,
+on a generated tree of 100k categories in TEST_DB_URL (the schema is created and dropped by the script).
+
+    python -m benchmarks.category_hierarchy [categories] [branching]
+"""
+import random
+import statistics
+import sys
+import time
+from uuid import uuid4
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy_utils import Ltree
+
+from config import TEST_DB_URL
+from crud.category import category_list_query
+from db.models import BaseModel, Category
+
+ROUNDS = 200
+
+# the queries the endpoints ran before parent_id/depth existed
+PREVIOUS_QUERIES = {
+    "children": """
+        SELECT c.id, c.name, pc.id AS parent, nlevel(c.hierarchy) AS level
+        FROM category AS c
+        LEFT OUTER JOIN category pc ON pc.hierarchy = subpath(c.hierarchy, 0, -1)
+        WHERE c.deactivated IS false
+          AND c.hierarchy <@ (SELECT hierarchy FROM category WHERE id = :category_id LIMIT 1)
+          AND c.id != :category_id
+    """,
+    "parents": """
+        SELECT c.id, c.name, pc.id AS parent, nlevel(c.hierarchy) AS level
+        FROM category AS c
+        LEFT OUTER JOIN category pc ON pc.hierarchy = subpath(c.hierarchy, 0, -1)
+        WHERE c.deactivated IS false
+          AND c.hierarchy @> (SELECT hierarchy FROM category WHERE id = :category_id LIMIT 1)
+          AND c.id != :category_id
+    """,
+}
+
+
+def generate_tree(size: int, branching: int) -> list[dict]:
+    rows = []
+    for i in range(size):
+        category_id = uuid4()
+        parent = rows[(i - branching) // branching] if i >= branching else None
+        hierarchy = Ltree(category_id.hex) if parent is None else parent["hierarchy"] + Ltree(category_id.hex)
+        rows.append({"id": category_id, "name": "category %s" % i, "hierarchy": hierarchy})
+    return rows
+
+
+def timed(connection, statement, params: dict = None) -> float:
+    started_at = time.perf_counter()
+    connection.execute(statement, params or {}).all()
+    return (time.perf_counter() - started_at) * 1000
+
+
+def summary(timings: list[float]) -> str:
+    return "median %.2fms p95 %.2fms" % (statistics.median(timings), statistics.quantiles(timings, n=20)[-1])
+
+
+def main(size: int = 100_000, branching: int = 10):
+    engine = create_engine(TEST_DB_URL)
+    BaseModel.metadata.create_all(bind=engine)
+    try:
+        rows = generate_tree(size, branching)
+        with engine.begin() as connection:
+            for start in range(0, len(rows), 10_000):
+                connection.execute(insert(Category), rows[start:start + 10_000])
+            connection.execute(text("ANALYZE category"))
+
+        samples = random.sample(rows, ROUNDS)
+        print("%s categories, branching %s" % (size, branching))
+        with engine.connect() as connection:
+            for endpoint, descendants in (("children", True), ("parents", False)):
+                previous, current = [], []
+                for sample in samples:
+                    previous.append(timed(connection, text(PREVIOUS_QUERIES[endpoint]), {"category_id": sample["id"]}))
+                    current.append(timed(connection, category_list_query(filters={
+                        "deactivated": False,
+                        "hierarchy": {"category_id": str(sample["id"]), "descendants": descendants}
+                    })))
+                print("%-9s previous: %s | current: %s" % (endpoint, summary(previous), summary(current)))
+    finally:
+        BaseModel.metadata.drop_all(bind=engine)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
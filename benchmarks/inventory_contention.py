@@ -0,0 +1,80 @@
+"""
+Throughput of single-unit reservations on one hot SKU under concurrent checkouts, comparing a plain
+read-modify-write, the same with SELECT ... FOR UPDATE, and the conditional UPDATE reserve_inventory uses.
+Runs against TEST_DB_URL (the schema is created and dropped by the script).
+
+    python -m benchmarks.inventory_contention [workers] [attempts_per_worker] [stock]
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.orm import Session
+
+from config import TEST_DB_URL
+from crud.inventory import inventory_reserve_query
+from db.models import BaseModel, Category, Product, ProductInventory
+
+
+def read_modify_write(connection, inventory_id, lock: bool) -> bool:
+    query = select(ProductInventory.quantity).where(ProductInventory.id == inventory_id)
+    quantity = connection.execute(query.with_for_update() if lock else query).scalar_one()
+    if quantity < 1:
+        return False
+    connection.execute(update(ProductInventory).where(ProductInventory.id == inventory_id).values(quantity=quantity - 1))
+    return True
+
+
+def conditional_update(connection, inventory_id) -> bool:
+    return connection.execute(inventory_reserve_query({inventory_id: 1})).first() is not None
+
+
+STRATEGIES = {
+    "read-modify-write": lambda connection, inventory_id: read_modify_write(connection, inventory_id, lock=False),
+    "select for update": lambda connection, inventory_id: read_modify_write(connection, inventory_id, lock=True),
+    "conditional update": conditional_update,
+}
+
+
+def run(engine, strategy, inventory_id, workers: int, attempts: int) -> tuple[int, float]:
+    def worker():
+        reserved = 0
+        for _ in range(attempts):
+            with engine.begin() as connection:
+                reserved += strategy(connection, inventory_id)
+        return reserved
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        reserved = sum(future.result() for future in [executor.submit(worker) for _ in range(workers)])
+    return reserved, time.perf_counter() - started_at
+
+
+def main(workers: int = 32, attempts: int = 100, stock: int = 1000):
+    engine = create_engine(TEST_DB_URL, pool_size=workers, max_overflow=0)
+    BaseModel.metadata.create_all(bind=engine)
+    try:
+        print("%s workers x %s attempts on one SKU with %s units" % (workers, attempts, stock))
+        with Session(engine) as session:
+            category = Category(name="Hot category")
+            inventory = ProductInventory(product=Product(name="Hot SKU", category=category), unit_price=1)
+            session.add_all([category, inventory])
+            session.commit()
+            inventory_id = inventory.id
+
+        for name, strategy in STRATEGIES.items():
+            with engine.begin() as connection:
+                connection.execute(update(ProductInventory).values(quantity=stock))
+            reserved, elapsed = run(engine, strategy, inventory_id, workers, attempts)
+            with engine.connect() as connection:
+                left = connection.execute(select(ProductInventory.quantity)).scalar_one()
+            print("%-18s %8.0f attempts/s, %s reserved, %s units left, oversold %s" % (
+                name, workers * attempts / elapsed, reserved, left, max(0, reserved - (stock - left))
+            ))
+    finally:
+        BaseModel.metadata.drop_all(bind=engine)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,286 @@
+"""
+Closed-loop load test of main.app with a realistic request mix: a synthetic mix of /products, /detail, /reviews
+and /categories built from ids in DATABASE_URL, or a recorded one replayed in order. Reports throughput, latency
+percentiles, error and shed (503) rates and DB statements per request, either in-process over ASGI or against
+local uvicorn servers, sweeping worker counts and pool sizes to find where throughput saturates.
+
+    python -m benchmarks.load_test --duration 30 --concurrency 32
+    python -m benchmarks.load_test --replay traffic.jsonl
+    python -m benchmarks.load_test --uvicorn --workers 1,2,4 --pool-sizes 5,10,20
+
+A recorded mix is a file of JSON lines like {"method": "GET", "path": "/products?limit=10"} or plain paths.
+Over uvicorn, statements are counted through pg_stat_statements when the extension is installed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from itertools import cycle, product
+
+import httpx
+
+DEFAULT_WEIGHTS = {"products": 50, "detail": 25, "reviews": 15, "categories": 10}
+ORDERINGS = ["id", "-new", "price", "-popular", "-discount"]
+ROUTE_CLASSES = [
+    ("detail", re.compile(r"^/products/[^/]+/detail")),
+    ("reviews", re.compile(r"^/products/[^/]+/reviews")),
+    ("products", re.compile(r"^/products")),
+    ("categories", re.compile(r"^/categories")),
+]
+
+
+def route_class(path: str) -> str:
+    return next((name for name, pattern in ROUTE_CLASSES if pattern.match(path)), "other")
+
+
+class RequestMix:
+    def __init__(self, requests: list[tuple[str, str]], weights: dict[str, int] = None):
+        self.requests = requests
+        self._replay = cycle(requests) if weights is None else None
+        self._by_class = defaultdict(list)
+        for request in requests:
+            self._by_class[route_class(request[1])].append(request)
+        self._weights = {name: weight for name, weight in (weights or {}).items() if self._by_class[name]}
+
+    def next(self) -> tuple[str, str]:
+        if self._replay is not None:
+            return next(self._replay)
+        name = random.choices(list(self._weights), weights=list(self._weights.values()))[0]
+        return random.choice(self._by_class[name])
+
+    @classmethod
+    def recorded(cls, path: str) -> "RequestMix":
+        requests = []
+        with open(path) as recorded_file:
+            for line in filter(str.strip, recorded_file):
+                if line.lstrip().startswith("{"):
+                    request = json.loads(line)
+                    requests.append((request.get("method", "GET"), request["path"]))
+                else:
+                    requests.append(("GET", line.strip()))
+        return cls(requests)
+
+    @classmethod
+    async def synthetic(cls, session_manager, weights: dict[str, int] = None, sample: int = 1000) -> "RequestMix":
+        from sqlalchemy import select, func
+
+        from db.models import Category, Product
+
+        async with session_manager.session() as session:
+            product_ids = (await session.execute(
+                select(Product.id).where(Product.is_active.is_(True)).order_by(func.random()).limit(sample)
+            )).scalars().all()
+            category_ids = (await session.execute(
+                select(Category.id).where(Category.effectively_active.is_(True)).order_by(func.random()).limit(sample)
+            )).scalars().all()
+
+        requests = [("GET", "/categories"), ("GET", "/products?limit=10")]
+        for ordering in ORDERINGS:
+            for skip in (0, 10, 20, 100):
+                requests.append(("GET", "/products?limit=10&skip=%s&ordering=%s" % (skip, ordering)))
+        for category_id in category_ids:
+            requests.append(("GET", "/categories/%s/children/" % category_id))
+            requests.append(("GET", "/products?limit=10&category_id=%s&ordering=%s" % (
+                category_id, random.choice(ORDERINGS)
+            )))
+        for product_id in product_ids:
+            requests.append(("GET", "/products/%s/detail" % product_id))
+            requests.append(("GET", "/products/%s/reviews?limit=10" % product_id))
+        return cls(requests, weights or DEFAULT_WEIGHTS)
+
+
+class Results:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.statuses: dict[str, Counter] = defaultdict(Counter)
+        self.elapsed = 0.0
+        self.statements: int | None = None
+
+    def add(self, path: str, status: int, latency: float) -> None:
+        name = route_class(path)
+        self.latencies[name].append(latency)
+        self.statuses[name][status] += 1
+
+    @property
+    def total(self) -> int:
+        return sum(map(len, self.latencies.values()))
+
+    @property
+    def throughput(self) -> float:
+        return self.total / self.elapsed if self.elapsed else 0.0
+
+    @staticmethod
+    def _percentiles(latencies: list[float]) -> str:
+        if len(latencies) < 2:
+            return "-"
+        cuts = statistics.quantiles(latencies, n=100)
+        return "p50 %.1fms p95 %.1fms p99 %.1fms" % (cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000)
+
+    def report(self) -> str:
+        lines = []
+        for name in sorted(self.latencies):
+            statuses, count = self.statuses[name], len(self.latencies[name])
+            errors = sum(value for status, value in statuses.items() if status >= 500 and status != 503)
+            lines.append("  %-10s %7s req  %s  errors %.2f%%  shed %.2f%%" % (
+                name, count, self._percentiles(self.latencies[name]),
+                100 * errors / count, 100 * statuses[503] / count
+            ))
+        all_latencies = [latency for latencies in self.latencies.values() for latency in latencies]
+        statements = "-" if self.statements is None else "%.1f" % (self.statements / max(self.total, 1))
+        lines.insert(0, "  %.0f req/s, %s  statements/request %s" % (
+            self.throughput, self._percentiles(all_latencies), statements
+        ))
+        return "\n".join(lines)
+
+
+async def run_load(client: httpx.AsyncClient, mix: RequestMix, concurrency: int, duration: float) -> Results:
+    results = Results()
+    deadline = time.perf_counter() + duration
+
+    async def user():
+        while time.perf_counter() < deadline:
+            method, path = mix.next()
+            started_at = time.perf_counter()
+            try:
+                status = (await client.request(method, path)).status_code
+            except httpx.HTTPError:
+                status = 599
+            results.add(path, status, time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    results.elapsed = time.perf_counter() - started_at
+    return results
+
+
+async def in_process(args) -> None:
+    os.environ.setdefault("DB_ECHO", "false")
+    from sqlalchemy import event
+
+    from db.connections import db_session_manager
+    from main import app
+
+    statements = 0
+
+    def count_statement(*_):
+        nonlocal statements
+        statements += 1
+
+    async with app.router.lifespan_context(app):
+        mix = RequestMix.recorded(args.replay) if args.replay else await RequestMix.synthetic(db_session_manager)
+        event.listen(db_session_manager.engine.sync_engine, "before_cursor_execute", count_statement)
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=60) as client:
+            await run_load(client, mix, args.concurrency, args.warmup)
+            statements = 0
+            results = await run_load(client, mix, args.concurrency, args.duration)
+        results.statements = statements
+    print("in-process, concurrency %s" % args.concurrency)
+    print(results.report())
+
+
+async def _statement_total(engine) -> int | None:
+    from sqlalchemy import text
+
+    try:
+        async with engine.connect() as connection:
+            return (await connection.execute(text("SELECT sum(calls) FROM pg_stat_statements"))).scalar()
+    except Exception:
+        return None
+
+
+async def _wait_until_ready(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("uvicorn exited with %s" % server.returncode)
+        try:
+            if (await client.get("/readyz")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("uvicorn did not get ready within %ss" % timeout)
+
+
+async def over_uvicorn(args) -> None:
+    from config import DB_URL
+    from db.connections import DatabaseSessionManager
+
+    probe = DatabaseSessionManager(DB_URL)
+    mix = RequestMix.recorded(args.replay) if args.replay else await RequestMix.synthetic(probe)
+
+    sweep = []
+    for workers, pool_size in product(args.workers, args.pool_sizes):
+        env = dict(os.environ, DB_ECHO="false", DB_POOL_SIZE=str(pool_size))
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--workers", str(workers),
+             "--log-level", "warning"],
+            env=env
+        )
+        try:
+            limits = httpx.Limits(max_connections=args.concurrency)
+            base_url = "http://127.0.0.1:%s" % args.port
+            async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+                await _wait_until_ready(client, server)
+                await run_load(client, mix, args.concurrency, args.warmup)
+                statements_before = await _statement_total(probe.engine)
+                results = await run_load(client, mix, args.concurrency, args.duration)
+                statements_after = await _statement_total(probe.engine)
+            if statements_before is not None and statements_after is not None:
+                results.statements = statements_after - statements_before
+        finally:
+            server.terminate()
+            server.wait()
+
+        sweep.append((workers, pool_size, results.throughput))
+        print("uvicorn, %s workers, pool size %s, concurrency %s" % (workers, pool_size, args.concurrency))
+        print(results.report())
+    await probe.close()
+
+    best = max(sweep, key=lambda row: row[2])
+    print("\nbest: %s workers, pool size %s at %.0f req/s" % best)
+    throughput = {(workers, pool_size): value for workers, pool_size, value in sweep}
+    worker_counts, pool_sizes = sorted(set(args.workers)), sorted(set(args.pool_sizes))
+    # one dimension at a time, a step that also changed the other setting says nothing about either
+    for pool_size in pool_sizes:
+        _report_saturation("workers", worker_counts, lambda workers: throughput[workers, pool_size],
+                           "pool size %s" % pool_size)
+    for workers in worker_counts:
+        _report_saturation("pool size", pool_sizes, lambda size: throughput[workers, size], "%s workers" % workers)
+
+
+def _report_saturation(dimension: str, steps: list[int], throughput, fixed: str) -> None:
+    """the first step along `steps` that gains less than 5% throughput over the previous one"""
+    for previous, current in zip(steps, steps[1:]):
+        if throughput(current) < throughput(previous) * 1.05:
+            print("%s saturates after %s at %s (+%.1f%% for %s)" % (
+                dimension, previous, fixed, 100 * (throughput(current) / throughput(previous) - 1), current
+            ))
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--replay", help="file with the recorded requests to replay in order")
+    parser.add_argument("--uvicorn", action="store_true", help="load local uvicorn servers instead of ASGI calls")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=lambda value: list(map(int, value.split(","))), default=[1])
+    parser.add_argument("--pool-sizes", type=lambda value: list(map(int, value.split(","))), default=[5])
+    args = parser.parse_args()
+
+    asyncio.run(over_uvicorn(args) if args.uvicorn else in_process(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Compares the /products/{id}/detail query before and after every child collection got its own subquery, on
+products with 50 images and 100 variants each in TEST_DB_URL (the schema is created and dropped by the script).
+
+    python -m benchmarks.product_detail [products] [images] [variants]
+"""
+import random
+import sys
+from uuid import uuid4
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import aliased
+from sqlalchemy_utils import Ltree
+
+from benchmarks.category_hierarchy import ROUNDS, timed, summary
+from config import TEST_DB_URL
+from db.models import BaseModel, Category, Product, ProductImage, ProductInventory
+from db.strategies import common, products
+from db.strategies.context import QueryContext
+
+# the query the endpoint ran before, with images and variants joined side by side
+PREVIOUS_QUERY = """
+    SELECT p.id, p.name, p.category_id, p.made_in, p.description,
+           coalesce(array_agg(distinct(product_image.image)), '{}') AS images,
+           coalesce(array_agg(distinct(jsonb_build_object(
+               'id', product_inventory.id,
+               'meta', product_inventory.meta,
+               'availability', CASE WHEN product_inventory.quantity > 0 THEN true ELSE false END,
+               'unit_price', product_inventory.unit_price,
+               'discount', product_inventory.discount
+           ))), '{}') AS inventories
+    FROM product AS p
+    LEFT OUTER JOIN product_image ON p.id = product_image.product_id
+    LEFT OUTER JOIN product_inventory ON p.id = product_inventory.product_id
+    WHERE p.id = :product_id
+    GROUP BY p.id
+    LIMIT 1
+"""
+
+
+def detail_query(product_id):
+    query_context = QueryContext(
+        select_strategy=products.ProductDetailSelectStrategy(alias=aliased(Product, name="p")),
+        filtering_strategies={"id": common.IDFilteringStrategy}
+    )
+    query_context.filtering(id=product_id)
+    return query_context.query.limit(1)
+
+
+def main(size: int = 1000, images: int = 50, variants: int = 100):
+    engine = create_engine(TEST_DB_URL)
+    BaseModel.metadata.create_all(bind=engine)
+    try:
+        category_id = uuid4()
+        product_ids = [uuid4() for _ in range(size)]
+        with engine.begin() as connection:
+            connection.execute(
+                insert(Category).values(id=category_id, name="Benchmark", hierarchy=Ltree(category_id.hex))
+            )
+            connection.execute(insert(Product), [
+                {"id": product_id, "name": "product %s" % i, "category_id": category_id}
+                for i, product_id in enumerate(product_ids)
+            ])
+            for product_id in product_ids:
+                connection.execute(insert(ProductImage), [
+                    {"product_id": product_id, "image": "images/%s/%s.jpg" % (product_id, i)} for i in range(images)
+                ])
+                connection.execute(insert(ProductInventory), [
+                    {
+                        "product_id": product_id,
+                        "quantity": random.randint(0, 10),
+                        "unit_price": random.randint(1, 1000),
+                        "meta": {"color": random.choice(["Blue", "Red", "Gray"]), "size": str(i)}
+                    }
+                    for i in range(variants)
+                ])
+            connection.execute(text("ANALYZE"))
+
+        samples = random.sample(product_ids, min(ROUNDS, size))
+        print("%s products with %s images and %s variants each" % (size, images, variants))
+        with engine.connect() as connection:
+            previous = [timed(connection, text(PREVIOUS_QUERY), {"product_id": sample}) for sample in samples]
+            current = [timed(connection, detail_query(sample)) for sample in samples]
+        print("detail previous: %s | current: %s" % (summary(previous), summary(current)))
+    finally:
+        BaseModel.metadata.drop_all(bind=engine)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,147 @@
+"""
+Compares three ways of putting the author's name on a page of /products/{id}/reviews, at 1M customers in
+TEST_DB_URL (the schema is created and dropped by the script): the join to customer the endpoint used to run,
+the denormalized product_reviews.author_name it reads now, and a bounded LRU cache of customer names filled by
+one batched lookup per page for the misses. Pages are drawn with a skewed popularity, like real traffic.
+
+    python -m benchmarks.review_authors [customers] [products] [reviews per product] [cache size]
+"""
+import random
+import sys
+import time
+from collections import OrderedDict
+from uuid import uuid4
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import aliased
+from sqlalchemy_utils import Ltree
+
+from benchmarks.category_hierarchy import ROUNDS, timed, summary
+from config import TEST_DB_URL
+from db.models import BaseModel, Category, Product, ProductReview
+from db.strategies.context import QueryContext
+from db.strategies.reviews import ReviewListSelectStrategy, ReviewProductIDFilteringStrategy
+
+PAGE_SIZE = 20
+
+# the query the endpoint ran before author_name existed
+PREVIOUS_QUERY = """
+    SELECT pr.id, u.fullname AS fullname, pr.rating, pr.comment, pr.created_at
+    FROM product_reviews AS pr
+    JOIN customer AS u ON u.id = pr.customer_id
+    WHERE pr.product_id = :product_id
+    LIMIT :limit
+"""
+CACHED_PAGE_QUERY = """
+    SELECT pr.id, pr.customer_id, pr.rating, pr.comment, pr.created_at
+    FROM product_reviews AS pr
+    WHERE pr.product_id = :product_id
+    LIMIT :limit
+"""
+CUSTOMER_NAMES_QUERY = "SELECT id, fullname FROM customer WHERE id = ANY(:ids)"
+
+
+class CustomerNameCache:
+    """bounded LRU of customer names; the misses of one page are looked up together, DataLoader style"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.names: OrderedDict = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get_many(self, connection, customer_ids: list) -> dict:
+        missing = [customer_id for customer_id in set(customer_ids) if customer_id not in self.names]
+        self.misses += len(missing)
+        self.hits += len(customer_ids) - len(missing)
+        if missing:
+            for customer_id, fullname in connection.execute(text(CUSTOMER_NAMES_QUERY), {"ids": missing}):
+                self.names[customer_id] = fullname
+        names = {}
+        for customer_id in customer_ids:
+            if customer_id in self.names:
+                self.names.move_to_end(customer_id)
+                names[customer_id] = self.names[customer_id]
+        while len(self.names) > self.capacity:
+            self.names.popitem(last=False)
+        return names
+
+
+def reviews_query(product_id):
+    query_context = QueryContext(
+        select_strategy=ReviewListSelectStrategy(alias=aliased(ProductReview, name="pr")),
+        filtering_strategies={"product_id": ReviewProductIDFilteringStrategy}
+    )
+    query_context.filtering(product_id=product_id)
+    return query_context.query.limit(PAGE_SIZE)
+
+
+def cached_page(connection, cache: CustomerNameCache, product_id) -> float:
+    started_at = time.perf_counter()
+    rows = connection.execute(text(CACHED_PAGE_QUERY), {"product_id": product_id, "limit": PAGE_SIZE}).all()
+    names = cache.get_many(connection, [row.customer_id for row in rows])
+    [{**row._asdict(), "fullname": names.get(row.customer_id, "")} for row in rows]
+    return (time.perf_counter() - started_at) * 1000
+
+
+def main(customers: int = 1_000_000, size: int = 10_000, reviews: int = 100, cache_size: int = 100_000):
+    engine = create_engine(TEST_DB_URL)
+    BaseModel.metadata.create_all(bind=engine)
+    try:
+        category_id = uuid4()
+        product_ids = [uuid4() for _ in range(size)]
+        with engine.begin() as connection:
+            connection.execute(
+                insert(Category).values(id=category_id, name="Benchmark", hierarchy=Ltree(category_id.hex))
+            )
+            connection.execute(insert(Product), [
+                {"id": product_id, "name": "product %s" % i, "category_id": category_id}
+                for i, product_id in enumerate(product_ids)
+            ])
+            connection.execute(text(
+                "INSERT INTO customer (email, fullname) "
+                "SELECT 'customer' || i || '@example.com', 'Customer ' || i FROM generate_series(1, :customers) AS i"
+            ), {"customers": customers})
+            connection.execute(text(
+                "CREATE TEMPORARY TABLE customer_number AS "
+                "SELECT id, row_number() OVER () AS n FROM customer"
+            ))
+            connection.execute(text("CREATE INDEX ON customer_number (n)"))
+            # the random customer numbers are drawn in a subquery, a volatile join condition would be re-evaluated
+            connection.execute(text(
+                """
+                INSERT INTO product_reviews (product_id, customer_id, rating)
+                SELECT drawn.product_id, customer_number.id, drawn.rating
+                FROM (
+                    SELECT product.id AS product_id, 1 + floor(random() * :customers)::bigint AS n,
+                           1 + floor(random() * 5) AS rating
+                    FROM product, generate_series(1, :reviews)
+                ) AS drawn
+                JOIN customer_number ON customer_number.n = drawn.n
+                """
+            ), {"customers": customers, "reviews": reviews})
+            connection.execute(text("ANALYZE"))
+
+        # a few products get most of the traffic
+        samples = random.choices(product_ids, weights=[1 / rank for rank in range(1, size + 1)], k=ROUNDS * 5)
+        cache = CustomerNameCache(cache_size)
+        print("%s customers, %s products with %s reviews each, cache of %s names" % (
+            customers, size, reviews, cache_size
+        ))
+        with engine.connect() as connection:
+            joined = [
+                timed(connection, text(PREVIOUS_QUERY), {"product_id": sample, "limit": PAGE_SIZE})
+                for sample in samples
+            ]
+            denormalized = [timed(connection, reviews_query(sample)) for sample in samples]
+            cached = [cached_page(connection, cache, sample) for sample in samples]
+        print("join to customer:        %s" % summary(joined))
+        print("denormalized author:     %s" % summary(denormalized))
+        print("LRU cache, batched miss: %s (hit rate %.1f%%)" % (
+            summary(cached), 100 * cache.hits / max(cache.hits + cache.misses, 1)
+        ))
+    finally:
+        BaseModel.metadata.drop_all(bind=engine)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
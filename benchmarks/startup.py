@@ -0,0 +1,117 @@
+"""
+Measures how fast a new worker gets going: an import-time profile of main (python -X importtime, grouped by
+top-level package, with the slowest modules) and the cold start of a uvicorn worker from spawning the process
+to its first served request. The startup runs the lifespan, so DATABASE_URL has to point at a live database.
+
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --json --max-import-seconds 1.5 --max-start-seconds 3
+
+With --json the results are printed as one JSON object for CI to track; with a budget the script exits with 1
+when the median goes over it.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def import_profile(module: str = "main") -> tuple[float, Counter, list[tuple[str, float]]]:
+    """seconds to import `module` in a fresh interpreter, self time per top-level package and per module"""
+    env = dict(os.environ, DB_ECHO="false")
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import %s" % module],
+        env=env, capture_output=True, text=True, check=True
+    ).stderr
+
+    total, packages, modules = 0.0, Counter(), []
+    for line in output.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        packages[name.split(".")[0]] += int(self_us) / 1e6
+        modules.append((name, int(cumulative_us) / 1e6))
+        if name == module and not indent:
+            total = int(cumulative_us) / 1e6
+    return total, packages, modules
+
+
+def cold_start(port: int, path: str = "/readyz", timeout: float = 60) -> float:
+    """seconds from spawning a uvicorn worker until it answers `path`"""
+    env = dict(os.environ, DB_ECHO="false")
+    started_at = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"], env=env
+    )
+    try:
+        with httpx.Client(base_url="http://127.0.0.1:%s" % port, timeout=1) as client:
+            while time.perf_counter() - started_at < timeout:
+                if server.poll() is not None:
+                    raise RuntimeError("uvicorn exited with %s" % server.returncode)
+                try:
+                    if client.get(path).status_code == 200:
+                        return time.perf_counter() - started_at
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+        raise RuntimeError("uvicorn did not answer %s within %ss" % (path, timeout))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--path", default="/readyz", help="the first request a started worker has to serve")
+    parser.add_argument("--top", type=int, default=15, help="how many of the slowest imports to list")
+    parser.add_argument("--no-server", action="store_true", help="only profile the imports")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--max-import-seconds", type=float)
+    parser.add_argument("--max-start-seconds", type=float)
+    args = parser.parse_args()
+
+    profiles = [import_profile() for _ in range(args.runs)]
+    import_seconds = statistics.median(total for total, _, _ in profiles)
+    _, packages, modules = min(profiles, key=lambda profile: profile[0])
+    starts = [] if args.no_server else [cold_start(args.port, args.path) for _ in range(args.runs)]
+    start_seconds = statistics.median(starts) if starts else None
+
+    if args.json:
+        print(json.dumps({
+            "import_seconds": round(import_seconds, 4),
+            "cold_start_seconds": None if start_seconds is None else round(start_seconds, 4),
+            "packages": {name: round(seconds, 4) for name, seconds in packages.most_common(args.top)},
+        }))
+    else:
+        print("import main: median %.0fms over %s runs" % (import_seconds * 1000, args.runs))
+        print("  by package (self time):")
+        for name, seconds in packages.most_common(args.top):
+            print("    %-30s %7.1fms" % (name, seconds * 1000))
+        print("  slowest modules (cumulative):")
+        for name, seconds in sorted(modules, key=lambda module: -module[1])[:args.top]:
+            print("    %-50s %7.1fms" % (name, seconds * 1000))
+        if starts:
+            print("cold start to first %s: median %.0fms, max %.0fms" % (
+                args.path, start_seconds * 1000, max(starts) * 1000
+            ))
+
+    over_budget = (
+        (args.max_import_seconds is not None and import_seconds > args.max_import_seconds)
+        or (args.max_start_seconds is not None and start_seconds is not None and start_seconds > args.max_start_seconds)
+    )
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Latency of the in-memory PrefixIndex behind /products/suggest at 1M names, against the target of a p99 under
+1ms per keystroke. Keystrokes are the 1 to 6 character prefixes of random names, the shortest ones matching
+most of the index; every `refresh_every` searches a new product is added, as the refresher does. No database.
+
+    python -m benchmarks.suggest [names] [searches] [refresh_every]
+"""
+import random
+import statistics
+import sys
+import time
+from uuid import uuid4
+
+from services.suggest import PrefixIndex, Suggestion
+
+WORDS = [
+    "red", "blue", "black", "white", "green", "leather", "cotton", "wool", "summer", "winter", "classic", "sport",
+    "slim", "oversized", "kids", "sneakers", "shoes", "boots", "sandals", "jacket", "shirt", "sweater", "scarf",
+    "socks", "jeans", "shorts", "dress", "skirt", "hat", "bag", "backpack", "belt", "gloves", "coat", "hoodie",
+]
+
+
+def random_name(rng: random.Random) -> str:
+    return "%s %s" % (" ".join(rng.choices(WORDS, k=rng.randint(1, 3))), rng.randint(1, 100_000))
+
+
+def random_suggestion(rng: random.Random) -> Suggestion:
+    return Suggestion(id=uuid4(), name=random_name(rng), kind="product", weight=rng.randint(0, 1000))
+
+
+def main(size: int = 1_000_000, searches: int = 10_000, refresh_every: int = 100):
+    rng = random.Random(0)
+    index = PrefixIndex()
+    started_at = time.perf_counter()
+    index.build(random_suggestion(rng) for _ in range(size))
+    print("built %s names in %.1fs" % (size, time.perf_counter() - started_at))
+
+    timings, adds = [], []
+    for i in range(searches):
+        if i % refresh_every == 0:
+            started_at = time.perf_counter()
+            index.add(random_suggestion(rng))
+            adds.append((time.perf_counter() - started_at) * 1000)
+        name = random_name(rng)
+        prefix = name[:rng.randint(1, 6)]
+        started_at = time.perf_counter()
+        index.search(prefix)
+        timings.append((time.perf_counter() - started_at) * 1000)
+    print("%s searches: median %.3fms p99 %.3fms max %.3fms" % (
+        searches, statistics.median(timings), statistics.quantiles(timings, n=100)[-1], max(timings)
+    ))
+    print("%s adds: median %.3fms max %.3fms" % (len(adds), statistics.median(adds), max(adds)))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -3,19 +3,91 @@ from pathlib import Path
 
 from dotenv import load_dotenv
 
-load_dotenv()
+BASE_DIR = Path(__file__).parent
+# an explicit path spares find_dotenv's walk through the call stack and the parent directories
+load_dotenv(BASE_DIR / ".env")
 
 DB_URL = os.getenv("DATABASE_URL")
 TEST_DB_URL = os.getenv("TEST_DB_URL")
-DB_ECHO = True
-
+DB_ECHO = os.getenv("DB_ECHO", "true").lower() == "true"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+# statements every connection keeps prepared, enough for all shapes of the hot list, detail and review queries
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", 500))
+# pool connections opened and primed with the hot queries before the worker reports ready
+DB_WARMUP_CONNECTIONS = int(os.getenv("DB_WARMUP_CONNECTIONS", DB_POOL_SIZE))
+# how long shutdown waits for in-flight requests before the engine is closed anyway
+DRAIN_TIMEOUT_SECONDS = float(os.getenv("DRAIN_TIMEOUT_SECONDS", 30))
+# the operational and back-office endpoints (those depending on dependencies.depends.OpsAccess) only answer requests
+# sent with the header "X-Ops-Token: <OPS_TOKEN>"; with no token set they answer 404 to everyone
+OPS_TOKEN = os.getenv("OPS_TOKEN") or None
+# most pg_stat_statements rows /metrics/statements returns
+STATEMENT_METRICS_MAX_LIMIT = 100
 
-BASE_DIR = Path(__file__).parent
-MEDIA_DIR = BASE_DIR / "media"
 
-if not os.path.exists(MEDIA_DIR):
-    os.mkdir(MEDIA_DIR)
+# created at startup by the lifespan in main
+MEDIA_DIR = Path(os.getenv("MEDIA_DIR", BASE_DIR / "media"))
+MEDIA_URL = "/media"
+MEDIA_MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+MEDIA_PROCESS_WORKERS = int(os.getenv("MEDIA_PROCESS_WORKERS", 2))
+# variant name: bounding box the image is scaled down into, stored as WebP next to the original
+MEDIA_VARIANTS = {
+    "thumbnail": (160, 160),
+    "list": (480, 480),
+    "detail": (1200, 1200),
+}
+MEDIA_CACHE_MAX_AGE = 365 * 24 * 60 * 60
 
 MAX_PRODUCTS_PER_PAGE = 20
 MAX_REVIEWS_PER_PAGE = 20
+# ?total=auto counts up to this many rows exactly and falls back to the planner's estimate above it
+PAGINATION_EXACT_COUNT_THRESHOLD = 1000
+STREAM_BATCH_SIZE = 5000
+# text search configuration of product.search_document and the queries on it
+SEARCH_TEXT_CONFIG = "english"
+
+SUGGEST_MAX_RESULTS = 10
+SUGGEST_REFRESH_SECONDS = 60
+SUGGEST_REBUILD_SECONDS = 60 * 60
+
+CATALOG_ENGINE_ENABLED = os.getenv("CATALOG_ENGINE_ENABLED", "false").lower() == "true"
+CATALOG_REFRESH_SECONDS = 5 * 60
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH")
+CATALOG_SNAPSHOT_WATCH_SECONDS = 5
+
+# static JSON copies of the hottest pages for the CDN, see services.static_pages
+STATIC_SNAPSHOT_DIR = Path(os.getenv("STATIC_SNAPSHOT_DIR", BASE_DIR / "static_snapshot"))
+STATIC_SNAPSHOT_TOP_PRODUCTS = 10_000
+# the default limit of a list request, what a plain /products?category_id=... returns
+STATIC_SNAPSHOT_PAGE_SIZE = 10
+# sessions rendering at the same time, within DB_POOL_SIZE + DB_MAX_OVERFLOW
+STATIC_SNAPSHOT_CONCURRENCY = 8
+STATIC_SNAPSHOT_CHUNK_SIZE = 500
+
+# route class: (max concurrent requests per worker, max seconds a request may wait for a slot)
+ADMISSION_LIMITS = {
+    "categories": (10, 1.0),
+    "detail": (20, 1.0),
+    "reviews": (10, 0.5),
+    "list": (10, 0.5),
+    "expensive_list": (3, 0.25),
+}
+ADMISSION_RETRY_AFTER = 1
+# when set, list queries are classified by the planner's total cost instead of by the strategies they use
+ADMISSION_EXPLAIN_COST_THRESHOLD = float(os.getenv("ADMISSION_EXPLAIN_COST_THRESHOLD", 0)) or None
+# filter/ordering shapes whose EXPLAINed cost a worker remembers, the least recently used are dropped
+ADMISSION_COST_CACHE_SIZE = 256
+
+REVIEW_BATCH_MAX_SIZE = 50_000
+
+# a request sent with the header "X-Profile: <PROFILING_TOKEN>" gets a stage breakdown in its Server-Timing header
+# and a sampled stack profile in PROFILING_DIR; with no token set the header is ignored
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN") or None
+# share of all requests that get the stage breakdown (logged, no stack profile), 0 turns sampling off
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+PROFILING_INTERVAL_SECONDS = 0.001
+PROFILING_DIR = Path(os.getenv("PROFILING_DIR", BASE_DIR / "profiles"))
 
+RESERVATION_TTL_SECONDS = 15 * 60
+RESERVATION_SWEEP_SECONDS = 30
+RESERVATION_SWEEP_BATCH_SIZE = 500
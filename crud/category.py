@@ -1,29 +1,185 @@
 from typing import Literal
 
+from uuid import UUID
+
+from sqlalchemy import select, update, insert, delete, exists, literal, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import aliased
+from sqlalchemy_utils import LtreeType
+
+from config import STREAM_BATCH_SIZE
 
-from db.models import Category
+from db.models import Category, CategoryProductCount, Product
 from db.strategies import categories
 from db.strategies.context import QueryContext
 
 
 hierarchy_depends = dict[Literal["descendants", "category_id"], None | bool | str]
-category_filters = Literal["hierarchy", "level", "deactivated"]
+category_filters = Literal["hierarchy", "level", "deactivated", "effectively_active"]
 
 
-async def category_list(
-    async_db: AsyncSession,
-    filters: dict[category_filters, hierarchy_depends | None | bool | int] = None
+def category_list_query(
+    filters: dict[category_filters, hierarchy_depends | None | bool | int] = None,
+    with_counts: bool = False
 ):
+    select_strategy = categories.CategoryWithCountsSelectStrategy if with_counts else categories.CategorySelectStrategy
     query_context = QueryContext(
-        select_strategy=categories.CategorySelectStrategy(alias=aliased(Category, name="c")),
+        select_strategy=select_strategy(alias=aliased(Category, name="c")),
         filtering_strategies={
             "deactivated": categories.CategoryDeactivatedFilteringStrategy,
+            "effectively_active": categories.CategoryEffectivelyActiveFilteringStrategy,
             "hierarchy": categories.CategoryHierarchyFilteringStrategy,
             "level": categories.CategoryLevelFilteringStrategy
         }
     )
     if filters:
         query_context.filtering(**filters)
-    return await async_db.execute(query_context.query)
+    return query_context.query
+
+
+async def category_list(
+    async_db: AsyncSession,
+    filters: dict[category_filters, hierarchy_depends | None | bool | int] = None,
+    with_counts: bool = False
+):
+    return await async_db.execute(category_list_query(filters, with_counts=with_counts))
+
+
+async def category_suggestions(async_db: AsyncSession):
+    query_context = QueryContext(
+        select_strategy=categories.CategorySuggestSelectStrategy(alias=aliased(Category, name="c")),
+        filtering_strategies={"effectively_active": categories.CategoryEffectivelyActiveFilteringStrategy}
+    )
+    query_context.filtering(effectively_active=True)
+    return await async_db.stream(query_context.query.execution_options(yield_per=STREAM_BATCH_SIZE))
+
+
+async def _category_hierarchy(async_db: AsyncSession, category_id: UUID | str):
+    hierarchy = (await async_db.execute(select(Category.hierarchy).where(Category.id == category_id))).scalar()
+    if hierarchy is None:
+        raise ValueError("Category %s does not exist" % category_id)
+    return hierarchy
+
+
+async def _sync_subtree_activity(async_db: AsyncSession, hierarchy):
+    """
+    recomputes effectively_active for a subtree and copies it to the products of the subtree; only rows whose
+    value changes are written, every product row written fires the product_count_sync trigger
+    """
+    ancestor = aliased(Category, name="a")
+    effectively_active = ~exists().where(
+        ancestor.hierarchy.ancestor_of(Category.hierarchy),
+        ancestor.deactivated.is_(True)
+    )
+    await async_db.execute(
+        update(Category)
+        .where(
+            Category.hierarchy.descendant_of(hierarchy),
+            Category.effectively_active.is_distinct_from(effectively_active)
+        )
+        .values(effectively_active=effectively_active)
+        .execution_options(synchronize_session=False)
+    )
+    await async_db.execute(
+        update(Product)
+        .where(
+            Product.category_id == Category.id,
+            Category.hierarchy.descendant_of(hierarchy),
+            Product.category_active.is_distinct_from(Category.effectively_active)
+        )
+        .values(category_active=Category.effectively_active)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _add_ancestors_product_count(async_db: AsyncSession, category_id: UUID | str, delta: int):
+    """shifts the subtree counts of the strict ancestors of a category, used when its subtree changes place"""
+    if not delta:
+        return
+
+    await async_db.execute(
+        update(CategoryProductCount)
+        .where(
+            CategoryProductCount.category_id == func.any(categories.path_ids(category_id)),
+            CategoryProductCount.category_id != category_id
+        )
+        .values(subtree_count=CategoryProductCount.subtree_count + delta)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def move_category(async_db: AsyncSession, category_id: UUID | str, new_parent_id: UUID | str | None):
+    """
+    Re-roots the whole subtree with one UPDATE: every path keeps its labels from the moved category down and
+    gets the new parent's path as prefix. parent_id/depth follow through the category_sync_hierarchy trigger.
+    """
+    hierarchy = await _category_hierarchy(async_db, category_id)
+    subtree_path = func.subpath(Category.hierarchy, len(hierarchy) - 1)
+    moved_products = (
+        await async_db.execute(
+            select(CategoryProductCount.subtree_count).where(CategoryProductCount.category_id == category_id)
+        )
+    ).scalar() or 0
+
+    if new_parent_id is None:
+        new_path = subtree_path
+    else:
+        parent_hierarchy = await _category_hierarchy(async_db, new_parent_id)
+        if parent_hierarchy.descendant_of(hierarchy):
+            raise ValueError("Category %s can not be moved into its own subtree" % category_id)
+        new_path = literal(parent_hierarchy, LtreeType).op("||")(subtree_path)
+
+    await _add_ancestors_product_count(async_db, category_id, -moved_products)
+    await async_db.execute(
+        update(Category)
+        .where(Category.hierarchy.descendant_of(hierarchy))
+        .values(hierarchy=new_path)
+        .execution_options(synchronize_session=False)
+    )
+    await _add_ancestors_product_count(async_db, category_id, moved_products)
+    await _sync_subtree_activity(async_db, await _category_hierarchy(async_db, category_id))
+    await async_db.commit()
+
+
+async def set_category_deactivated(async_db: AsyncSession, category_id: UUID | str, deactivated: bool):
+    """(de)activates a category together with everything under it, products included"""
+    assert isinstance(deactivated, bool)
+    hierarchy = await _category_hierarchy(async_db, category_id)
+    await async_db.execute(
+        update(Category)
+        .where(Category.id == category_id)
+        .values(deactivated=deactivated)
+        .execution_options(synchronize_session=False)
+    )
+    await _sync_subtree_activity(async_db, hierarchy)
+    await async_db.commit()
+
+
+async def rebuild_category_product_counts(async_db: AsyncSession):
+    """recounts every category from scratch; the triggers keep the counts current after that"""
+    active_products = (
+        select(Product.category_id, func.count().label("total"))
+        .where(Product.is_active.is_(True), Product.category_active.is_(True))
+        .group_by(Product.category_id)
+        .subquery()
+    )
+    descendant = aliased(Category, name="d")
+    subtree_count = (
+        select(func.coalesce(func.sum(active_products.c.total), 0))
+        .select_from(descendant)
+        .join(active_products, active_products.c.category_id == descendant.id)
+        .where(descendant.hierarchy.descendant_of(Category.hierarchy))
+        .scalar_subquery()
+    )
+    direct_count = (
+        select(func.coalesce(func.sum(active_products.c.total), 0))
+        .where(active_products.c.category_id == Category.id)
+        .scalar_subquery()
+    )
+    counts = select(Category.id, direct_count, subtree_count)
+
+    await async_db.execute(delete(CategoryProductCount))
+    await async_db.execute(
+        insert(CategoryProductCount).from_select(["category_id", "direct_count", "subtree_count"], counts)
+    )
+    await async_db.commit()
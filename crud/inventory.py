@@ -0,0 +1,161 @@
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+
+from sqlalchemy import select, update, insert, bindparam, func, Uuid, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import RESERVATION_TTL_SECONDS, RESERVATION_SWEEP_BATCH_SIZE
+from db.models import InventoryReservation, InventoryReservationItem, ProductInventory
+
+
+class InsufficientStock(ValueError):
+    def __init__(self, inventory_ids: list[UUID]):
+        super().__init__("Not enough stock for inventory %s" % ", ".join(map(str, inventory_ids)))
+        self.inventory_ids = inventory_ids
+
+
+def _requested(items: dict[UUID, int]):
+    inventory_ids, quantities = zip(*sorted(items.items()))
+    return func.unnest(
+        bindparam("inventory_ids", value=list(inventory_ids), type_=ARRAY(Uuid)),
+        bindparam("quantities", value=list(quantities), type_=ARRAY(Integer)),
+    ).table_valued("inventory_id", "quantity")
+
+
+def inventory_reserve_query(items: dict[UUID, int]):
+    """
+    Takes every requested quantity off in one conditional UPDATE: a row without enough stock is simply not
+    matched, so concurrent checkouts never oversell and never read a quantity they then write back
+    """
+    requested = _requested(items)
+    return (
+        update(ProductInventory)
+        .where(ProductInventory.id == requested.c.inventory_id, ProductInventory.quantity >= requested.c.quantity)
+        .values(quantity=ProductInventory.quantity - requested.c.quantity)
+        .returning(ProductInventory.id)
+    )
+
+
+def _locked_in_order(inventory_ids):
+    """
+    SELECT ... FOR UPDATE in id order. Every statement that touches several inventory rows takes their locks
+    this way first, so two of them sharing rows queue up instead of deadlocking
+    """
+    return select(ProductInventory.id).where(ProductInventory.id.in_(inventory_ids)).order_by(ProductInventory.id)\
+        .with_for_update()
+
+
+def _reservation_result(reservation: InventoryReservation, items: dict[UUID, int]) -> dict:
+    return {
+        "id": reservation.id,
+        "status": reservation.status,
+        "expires_at": reservation.expires_at,
+        "items": [{"inventory_id": inventory_id, "quantity": quantity} for inventory_id, quantity in items.items()],
+    }
+
+
+def inventory_restock_query(reservation_ids: list[UUID]):
+    """gives the units of the given reservations back, one UPDATE per batch however many reservations it holds"""
+    reserved = (
+        select(InventoryReservationItem.inventory_id, func.sum(InventoryReservationItem.quantity).label("quantity"))
+        .where(InventoryReservationItem.reservation_id.in_(reservation_ids))
+        .group_by(InventoryReservationItem.inventory_id)
+        .subquery()
+    )
+    return (
+        update(ProductInventory)
+        .where(ProductInventory.id == reserved.c.inventory_id)
+        .values(quantity=ProductInventory.quantity + reserved.c.quantity)
+    )
+
+
+async def reserve_inventory(
+    async_db: AsyncSession,
+    items: dict[UUID, int],
+    ttl_seconds: int = RESERVATION_TTL_SECONDS
+) -> dict:
+    """all or nothing: when any item is short the whole cart is rolled back and InsufficientStock names them"""
+    assert items and all(quantity > 0 for quantity in items.values())
+
+    if len(items) > 1:
+        await async_db.execute(_locked_in_order(list(items)))
+    reserved = set((await async_db.execute(inventory_reserve_query(items))).scalars())
+    if len(reserved) < len(items):
+        await async_db.rollback()
+        raise InsufficientStock(sorted(set(items) - reserved))
+
+    reservation = InventoryReservation(
+        status="held",
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+    )
+    async_db.add(reservation)
+    await async_db.flush()
+    await async_db.execute(insert(InventoryReservationItem), [
+        {"reservation_id": reservation.id, "inventory_id": inventory_id, "quantity": quantity}
+        for inventory_id, quantity in items.items()
+    ])
+    result = _reservation_result(reservation, items)
+    await async_db.commit()
+    return result
+
+
+async def _held_reservation(async_db: AsyncSession, reservation_id: UUID | str) -> tuple[InventoryReservation, dict]:
+    # waits for the sweeper if it holds the row; the sweeper itself skips rows locked here
+    reservation = (await async_db.execute(
+        select(InventoryReservation).where(InventoryReservation.id == reservation_id).with_for_update()
+    )).scalar_one_or_none()
+    if reservation is None:
+        raise ValueError("Reservation %s does not exist" % reservation_id)
+    if reservation.status != "held":
+        raise ValueError("Reservation %s is already %s" % (reservation_id, reservation.status))
+    items = dict((await async_db.execute(
+        select(InventoryReservationItem.inventory_id, InventoryReservationItem.quantity)
+        .where(InventoryReservationItem.reservation_id == reservation.id)
+    )).all())
+    return reservation, items
+
+
+async def commit_reservation(async_db: AsyncSession, reservation_id: UUID | str) -> dict:
+    """the units were taken at reservation time, so committing only closes the reservation"""
+    reservation, items = await _held_reservation(async_db, reservation_id)
+    if reservation.expires_at <= datetime.now(timezone.utc):
+        raise ValueError("Reservation %s has expired" % reservation_id)
+    reservation.status = "committed"
+    result = _reservation_result(reservation, items)
+    await async_db.commit()
+    return result
+
+
+async def release_reservation(async_db: AsyncSession, reservation_id: UUID | str) -> dict:
+    reservation, items = await _held_reservation(async_db, reservation_id)
+    await async_db.execute(_locked_in_order(list(items)))
+    await async_db.execute(inventory_restock_query([reservation.id]))
+    reservation.status = "released"
+    result = _reservation_result(reservation, items)
+    await async_db.commit()
+    return result
+
+
+async def release_expired_reservations(async_db: AsyncSession, batch_size: int = RESERVATION_SWEEP_BATCH_SIZE) -> int:
+    """
+    Releases one batch of expired reservations. SKIP LOCKED lets several workers sweep side by side and keeps
+    the sweep from waiting on a reservation that is being committed right now.
+    """
+    expired_ids = list((await async_db.execute(
+        select(InventoryReservation.id)
+        .where(InventoryReservation.status == "held", InventoryReservation.expires_at <= func.now())
+        .order_by(InventoryReservation.expires_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )).scalars())
+    if expired_ids:
+        reserved_ids = select(InventoryReservationItem.inventory_id)\
+            .where(InventoryReservationItem.reservation_id.in_(expired_ids))
+        await async_db.execute(_locked_in_order(reserved_ids))
+        await async_db.execute(inventory_restock_query(expired_ids))
+        await async_db.execute(
+            update(InventoryReservation).where(InventoryReservation.id.in_(expired_ids)).values(status="released")
+        )
+    await async_db.commit()
+    return len(expired_ids)
@@ -0,0 +1,71 @@
+from uuid import UUID
+
+from sqlalchemy import select, func, update, bindparam, Integer, Uuid
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import MediaAsset, Product, ProductImage
+from services import media
+
+
+async def add_product_image(async_db: AsyncSession, product_id: UUID | str, content: bytes) -> dict:
+    """
+    Stores an uploaded image once per content: a digest already on disk is only linked to the product again,
+    a new one is decoded and resized into its variants in the media process pool first.
+    """
+    product = (await async_db.execute(select(Product.id).where(Product.id == product_id))).scalar()
+    if product is None:
+        raise ValueError("Product %s does not exist" % product_id)
+
+    digest = media.digest_of(content)
+    known = (await async_db.execute(select(MediaAsset.digest).where(MediaAsset.digest == digest))).scalar()
+    if known is None or not media.original_path(digest).exists():
+        width, height, content_type = await media.process_image(content, digest)
+        await async_db.execute(
+            insert(MediaAsset)
+            .values(digest=digest, content_type=content_type, width=width, height=height, size=len(content))
+            .on_conflict_do_nothing(index_elements=[MediaAsset.digest])
+        )
+
+    # a new image goes after the existing ones, so uploading never replaces the primary image
+    position = (await async_db.execute(
+        select(func.coalesce(func.max(ProductImage.position) + 1, 0)).where(ProductImage.product_id == product)
+    )).scalar()
+    image = ProductImage(product_id=product, image=media.media_key(digest), position=position)
+    async_db.add(image)
+    await async_db.flush()
+    result = {"id": image.id, "image": image.image, "position": image.position}
+    await async_db.commit()
+    return result
+
+
+async def reorder_product_images(async_db: AsyncSession, product_id: UUID | str, image_ids: list[UUID]) -> list[dict]:
+    """
+    Gives the product's images the positions of their ids in `image_ids`, which has to list every image of the
+    product exactly once; the first one becomes the primary image. All positions change in one statement, so the
+    product_image_sync_primary trigger updates the product once.
+    """
+    current = set((await async_db.execute(
+        select(ProductImage.id).where(ProductImage.product_id == product_id).with_for_update()
+    )).scalars())
+    if len(image_ids) != len(set(image_ids)) or set(image_ids) != current:
+        raise ValueError("image_ids must list every image of product %s exactly once" % product_id)
+
+    ordered = func.unnest(
+        bindparam("image_ids", value=list(image_ids), type_=ARRAY(Uuid)),
+        bindparam("positions", value=list(range(len(image_ids))), type_=ARRAY(Integer)),
+    ).table_valued("id", "position")
+    await async_db.execute(
+        update(ProductImage)
+        .where(ProductImage.id == ordered.c.id)
+        .values(position=ordered.c.position)
+        .execution_options(synchronize_session=False)
+    )
+    rows = (await async_db.execute(
+        select(ProductImage.id, ProductImage.image, ProductImage.position)
+        .where(ProductImage.product_id == product_id)
+        .order_by(ProductImage.position, ProductImage.id)
+    )).mappings().all()
+    result = [dict(row) for row in rows]
+    await async_db.commit()
+    return result
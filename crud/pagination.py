@@ -0,0 +1,82 @@
+from typing import Literal
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.selectable import Select
+
+from config import PAGINATION_EXACT_COUNT_THRESHOLD
+from db.utils import explain
+
+TotalMode = Literal["auto", "exact", "estimated"]
+
+
+async def estimated_total(async_db: AsyncSession, query: Select) -> int:
+    """the planner's row estimate for `query`: one EXPLAIN, no rows are read"""
+    return int((await explain(async_db, query.order_by(None)))["Plan Rows"])
+
+
+async def exact_total(async_db: AsyncSession, query: Select, at_most: int = None) -> int:
+    """count(*) over `query`, which stops reading after `at_most` rows when given"""
+    counted = query.order_by(None)
+    if at_most is not None:
+        counted = counted.limit(at_most)
+    return (await async_db.execute(select(func.count()).select_from(counted.subquery()))).scalar()
+
+
+async def page_total(
+    async_db: AsyncSession,
+    query: Select,
+    mode: TotalMode,
+    threshold: int = PAGINATION_EXACT_COUNT_THRESHOLD
+) -> tuple[int, bool]:
+    """
+    (total, estimated) of `query`. "auto" counts at most threshold + 1 rows: the count is exact when it stays
+    within the threshold, otherwise the planner's estimate (never below what was counted) is returned instead.
+    """
+    if mode == "exact":
+        return await exact_total(async_db, query), False
+    if mode == "estimated":
+        return await estimated_total(async_db, query), True
+
+    counted = await exact_total(async_db, query, at_most=threshold + 1)
+    if counted <= threshold:
+        return counted, False
+    return max(await estimated_total(async_db, query), counted), True
+
+
+async def fetch_page(
+    async_db: AsyncSession,
+    query: Select,
+    limit: int,
+    offset: int = 0,
+    total: TotalMode = None,
+    count_query: Select = None
+) -> dict:
+    """
+    One page of `query` as {"rows", "has_more", "total", "total_estimated"}. has_more comes from fetching one row
+    more than the page; the total is only computed on request, and is free when the page turns out to be the last.
+    A `count_query` selecting less than `query` (but the same rows) makes counting cheaper.
+    """
+    rows = (await async_db.execute(query.limit(limit + 1).offset(offset))).all()
+    return await paginate(async_db, query if count_query is None else count_query, rows, limit, offset, total)
+
+
+async def paginate(
+    async_db: AsyncSession,
+    query: Select,
+    rows: list,
+    limit: int,
+    offset: int = 0,
+    total: TotalMode = None
+) -> dict:
+    """the page of `rows` fetched with limit + 1, `query` being the unpaginated query the total is counted on"""
+    has_more = len(rows) > limit
+    page = {"rows": rows[:limit], "has_more": has_more, "total": None, "total_estimated": False}
+    if total is None:
+        return page
+
+    if not has_more and (rows or offset == 0):
+        page["total"] = offset + len(rows)
+    else:
+        page["total"], page["total_estimated"] = await page_total(async_db, query, total)
+    return page
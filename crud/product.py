@@ -1,61 +1,216 @@
-from typing import Literal
+from datetime import datetime, timedelta
+from typing import Iterable, Literal
 
+from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import aliased
 
-from config import MAX_PRODUCTS_PER_PAGE, MAX_REVIEWS_PER_PAGE
+from config import MAX_PRODUCTS_PER_PAGE, MAX_REVIEWS_PER_PAGE, STREAM_BATCH_SIZE, CATALOG_ENGINE_ENABLED
 
-from db.models import Product, ProductReview
+from crud.pagination import TotalMode, fetch_page, paginate
+from db.models import Product, ProductRating, ProductReview
 from db.strategies import common, reviews, products
 from db.strategies.context import QueryContext
+from services.profiling import stage
+
+
+ProductListFilter = Literal[
+    "activity", "category_active", "category", "search", "attributes", "popular", "discount", "created_within",
+    "arrived_before"
+]
+ProductListOrdering = Literal["id", "-id", "discount", "-discount", "popular", "-popular", "new", "-new"]
+
+list_filtering_strategies = {
+    "activity": products.ProductActivityFilteringStrategy,
+    "category_active": products.ProductCategoryActiveFilteringStrategy,
+    "category": products.ProductCategoryFilteringStrategy,
+    "search": products.ProductSearchFilteringStrategy,
+    "attributes": products.ProductAttributesFilteringStrategy,
+    "popular": products.ProductPopularFilteringStrategy,
+    "discount": products.ProductDiscountFilteringStrategy,
+    "created_within": common.CreatedWithinFilteringStrategy,
+    "arrived_before": products.ProductArrivedBeforeFilteringStrategy
+}
+list_ordering_strategies = {
+    "id": common.IDOrderingStrategy,
+    "popular": products.ProductPopularOrderingStrategy,
+    "new": common.CreatedOrderingStrategy,
+    "discount": products.ProductDiscountOrderingStrategy,
+    "price": products.ProductPriceOrderingStrategy
+}
+
+
+def list_joins(filters: dict = None, ordering: list[str] = None) -> set[str]:
+    """the joins aggregate filters and orderings work on, whether or not their columns are selected"""
+    used_strategies = [
+        list_filtering_strategies.get(name) for name, value in (filters or {}).items() if value is not None
+    ]
+    used_strategies += [list_ordering_strategies.get(field.split("-")[-1]) for field in ordering or []]
+    return {join for strategy in used_strategies if strategy is not None for join in strategy.required_joins}
+
+
+def is_new_arrivals(filters: dict = None, ordering: list[str] = None) -> bool:
+    """newest first with nothing to aggregate before the limit: ix_product_new_arrivals alone picks the page"""
+    return bool(ordering) and ordering[0].split("-")[-1] == "new" and not list_joins(filters, ordering)
+
+
+def products_list_query(
+    filters: dict[ProductListFilter, str | bool | dict | timedelta | None] = None,
+    ordering: list[ProductListOrdering] = None,
+    fields: Iterable[str] = None,
+):
+    query_context = QueryContext(
+        select_strategy=products.ProductListSelectStrategy(
+            alias=aliased(Product, name="p"), fields=fields, joins=list_joins(filters, ordering)
+        ),
+        filtering_strategies=list_filtering_strategies,
+        ordering_strategies=list_ordering_strategies
+    )
+
+    if filters:
+        query_context.filtering(**filters)
+
+    if ordering:
+        query_context.ordering(ordering)
+    return query_context.query
+
+
+def enabled_catalog_engine():
+    """the in-memory catalog engine, None when it is disabled; numpy is only imported by workers that use it"""
+    if not CATALOG_ENGINE_ENABLED:
+        return None
+    from services.catalog import catalog_engine
+    return catalog_engine
 
 
 async def products_list(
     async_db: AsyncSession,
     limit: int,
     offset: int = 0,
-    filters: dict[Literal["activity", "category", "search", "popular", "discount"], str | bool | None] = None,
-    ordering: list[Literal["id", "-id", "discount", "-discount", "popular", "-popular", "new", "-new"]] = None,
-):
+    filters: dict[ProductListFilter, str | bool | dict | timedelta | None] = None,
+    ordering: list[ProductListOrdering] = None,
+    fields: Iterable[str] = None,
+    total: TotalMode = None,
+) -> dict:
+    """
+    one page of products, see crud.pagination.fetch_page; the total counts only ids, without any aggregate. It
+    joins only what the filters need: every child aggregate is joined 1:1, so the joins an ordering adds to the
+    page cannot change which products it holds.
+    For new arrivals only the ids of the page are selected in order, its rows are aggregated afterwards.
+    """
     if limit > MAX_PRODUCTS_PER_PAGE:
         limit = MAX_PRODUCTS_PER_PAGE
 
+    with stage("build"):
+        count_query = products_list_query(filters, fields=()) if total else None
+    catalog_engine = enabled_catalog_engine()
+    if catalog_engine is not None and catalog_engine.supports(filters, ordering):
+        product_ids = catalog_engine.search(limit + 1, offset, filters, ordering)
+        with stage("fetch"):
+            rows = await _products_by_ids(
+                async_db,
+                product_ids,
+                activity=(filters or {}).get("activity"),
+                category_active=(filters or {}).get("category_active"),
+                fields=fields
+            )
+            return await paginate(async_db, count_query, rows, limit, offset, total)
+
+    if is_new_arrivals(filters, ordering):
+        with stage("build"):
+            ids_query = products_list_query(filters, ordering, fields=()).limit(limit + 1).offset(offset)
+        with stage("fetch"):
+            rows = await _products_by_ids(
+                async_db,
+                list(await async_db.scalars(ids_query)),
+                activity=(filters or {}).get("activity"),
+                category_active=(filters or {}).get("category_active"),
+                fields=fields
+            )
+            return await paginate(async_db, count_query, rows, limit, offset, total)
+
+    with stage("build"):
+        query = products_list_query(filters, ordering, fields)
+    with stage("fetch"):
+        return await fetch_page(async_db, query, limit, offset, total, count_query=count_query)
+
+
+async def _products_by_ids(
+    async_db: AsyncSession,
+    product_ids: list,
+    activity: bool = None,
+    category_active: bool = None,
+    fields: Iterable[str] = None
+):
+    if not product_ids:
+        return []
+
     query_context = QueryContext(
-        select_strategy=products.ProductListSelectStrategy(alias=aliased(Product, name="p")),
+        select_strategy=products.ProductListSelectStrategy(alias=aliased(Product, name="p"), fields=fields),
         filtering_strategies={
+            "ids": common.IDInFilteringStrategy,
             "activity": products.ProductActivityFilteringStrategy,
-            "category": products.ProductCategoryFilteringStrategy,
-            "search": common.NameSearchFilteringStrategy,
-            "popular": products.ProductPopularFilteringStrategy,
-            "discount": products.ProductDiscountFilteringStrategy
-        },
-        ordering_strategies={
-            "id": common.IDOrderingStrategy,
-            "popular": products.ProductPopularOrderingStrategy,
-            "new": common.CreatedOrderingStrategy,
-            "discount": products.ProductDiscountOrderingStrategy,
-            "price": products.ProductPriceOrderingStrategy
+            "category_active": products.ProductCategoryActiveFilteringStrategy
         }
     )
+    query_context.filtering(ids=product_ids, activity=activity, category_active=category_active)
+    rows = {row.id: row for row in await async_db.execute(query_context.query)}
+    return [rows[product_id] for product_id in product_ids if product_id in rows]
 
-    if filters:
-        query_context.filtering(**filters)
 
-    if ordering:
-        query_context.ordering(ordering)
-    return await async_db.execute(query_context.query.limit(limit).offset(offset))
+async def product_detail(
+    async_db: AsyncSession,
+    product_id: str,
+    activity: bool = None,
+    category_active: bool = None,
+    fields: Iterable[str] = None
+):
+    with stage("build"):
+        query_context = QueryContext(
+            select_strategy=products.ProductDetailSelectStrategy(alias=aliased(Product, name="p"), fields=fields),
+            filtering_strategies={
+                "id": common.IDFilteringStrategy,
+                "activity": products.ProductActivityFilteringStrategy,
+                "category_active": products.ProductCategoryActiveFilteringStrategy,
+            }
+        )
+        query_context.filtering(id=product_id, activity=activity, category_active=category_active)
+    with stage("fetch"):
+        return list(await async_db.execute(query_context.query.limit(1)))[0]
 
 
-async def product_detail(async_db: AsyncSession, product_id: str, activity: bool = None):
+async def product_details(
+    async_db: AsyncSession,
+    product_ids: list,
+    activity: bool = None,
+    category_active: bool = None
+):
+    """streams the detail rows of `product_ids`, in no particular order"""
     query_context = QueryContext(
         select_strategy=products.ProductDetailSelectStrategy(alias=aliased(Product, name="p")),
         filtering_strategies={
-            "id": common.IDFilteringStrategy,
+            "ids": common.IDInFilteringStrategy,
             "activity": products.ProductActivityFilteringStrategy,
+            "category_active": products.ProductCategoryActiveFilteringStrategy,
         }
     )
-    query_context.filtering(id=product_id, activity=activity)
-    return list(await async_db.execute(query_context.query.limit(1)))[0]
+    query_context.filtering(ids=product_ids, activity=activity, category_active=category_active)
+    return await async_db.stream(query_context.query.execution_options(yield_per=STREAM_BATCH_SIZE))
+
+
+async def most_reviewed_products(async_db: AsyncSession, limit: int) -> list:
+    """
+    (id, updated_at) of the `limit` listed products with the most reviews, the closest thing to their traffic
+    the database knows
+    """
+    query = (
+        select(Product.id, Product.updated_at)
+        .outerjoin(ProductRating, ProductRating.product_id == Product.id)
+        .where(Product.is_active.is_(True), Product.category_active.is_(True))
+        .order_by(func.coalesce(ProductRating.reviews_count, 0).desc(), Product.id)
+        .limit(limit)
+    )
+    return (await async_db.execute(query)).all()
 
 
 async def get_product_reviews(
@@ -63,8 +218,9 @@ async def get_product_reviews(
     product_id: str,
     limit: int,
     offset: int = 0,
-    ordering: list[Literal["id", "-id", "created_at", "-created_at"]] = None
-):
+    ordering: list[Literal["id", "-id", "created_at", "-created_at"]] = None,
+    total: TotalMode = None,
+) -> dict:
     if limit > MAX_REVIEWS_PER_PAGE:
         limit = MAX_REVIEWS_PER_PAGE
 
@@ -76,4 +232,17 @@ async def get_product_reviews(
     query_context.filtering(product_id=product_id)
     if ordering:
         query_context.ordering(ordering)
-    return await async_db.execute(query_context.query.limit(limit).offset(offset))
+    return await fetch_page(async_db, query_context.query, limit, offset, total)
+
+
+async def product_suggestions(async_db: AsyncSession, created_after: datetime = None):
+    query_context = QueryContext(
+        select_strategy=products.ProductSuggestSelectStrategy(alias=aliased(Product, name="p")),
+        filtering_strategies={
+            "activity": products.ProductActivityFilteringStrategy,
+            "category_active": products.ProductCategoryActiveFilteringStrategy,
+            "created_after": common.CreatedAfterFilteringStrategy
+        }
+    )
+    query_context.filtering(activity=True, category_active=True, created_after=created_after)
+    return await async_db.stream(query_context.query.execution_options(yield_per=STREAM_BATCH_SIZE))
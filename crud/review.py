@@ -0,0 +1,80 @@
+from sqlalchemy import select, bindparam, func, Uuid, Float, Text, String, DateTime
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Customer, Product, ProductRating, ProductReview
+from schemas import ReviewIngestSchema
+
+
+def _unnest(**columns):
+    """
+    FROM unnest(:a, :b, ...) -- the whole batch travels as one array per column, so the statement size and the
+    number of bind parameters don't grow with the batch
+    """
+    arrays = [bindparam(name, value=values, type_=ARRAY(type_)) for name, (type_, values) in columns.items()]
+    return func.unnest(*arrays).table_valued(*columns)
+
+
+async def ingest_reviews(async_db: AsyncSession, reviews: list[ReviewIngestSchema]) -> dict:
+    """
+    Inserts a batch of reviews in one transaction with three statements: a customer upsert by email, a
+    multi-row review insert and (through the statement level product_rating_sync trigger) a single
+    aggregate update per product in the batch. Reviews of unknown products are reported back, not inserted.
+    """
+    product_ids = {review.product_id for review in reviews}
+    existing_ids = set((await async_db.execute(select(Product.id).where(Product.id.in_(product_ids)))).scalars())
+
+    accepted, rejected = [], []
+    for index, review in enumerate(reviews):
+        if review.product_id in existing_ids:
+            accepted.append(review)
+        else:
+            rejected.append({"index": index, "error": "product %s does not exist" % review.product_id})
+
+    if not accepted:
+        return {"inserted": 0, "customers": 0, "rejected": rejected}
+
+    fullnames = {review.email: review.fullname for review in accepted}
+    customers = _unnest(email=(String, list(fullnames)), fullname=(String, list(fullnames.values())))
+    upsert = insert(Customer).from_select(["email", "fullname"], select(customers.c.email, customers.c.fullname))
+    # a no-op update instead of DO NOTHING, so existing customers are returned too
+    upsert = upsert.on_conflict_do_update(index_elements=[Customer.email], set_={"email": upsert.excluded.email})
+    customer_ids = dict((await async_db.execute(upsert.returning(Customer.email, Customer.id))).all())
+
+    rows = _unnest(
+        product_id=(Uuid, [review.product_id for review in accepted]),
+        customer_id=(Uuid, [customer_ids[review.email] for review in accepted]),
+        rating=(Float, [review.rating for review in accepted]),
+        comment=(Text, [review.comment for review in accepted]),
+        created_at=(DateTime(timezone=True), [review.created_at for review in accepted]),
+    )
+    await async_db.execute(
+        insert(ProductReview).from_select(
+            ["product_id", "customer_id", "rating", "comment", "created_at"],
+            select(
+                rows.c.product_id,
+                rows.c.customer_id,
+                rows.c.rating,
+                rows.c.comment,
+                func.coalesce(rows.c.created_at, func.now())
+            )
+        )
+    )
+    await async_db.commit()
+    return {"inserted": len(accepted), "customers": len(customer_ids), "rejected": rejected}
+
+
+async def rebuild_product_ratings(async_db: AsyncSession):
+    """recomputes every aggregate from product_reviews, for backfills; the triggers keep them current after that"""
+    totals = (
+        select(ProductReview.product_id, func.count(), func.sum(ProductReview.rating))
+        .group_by(ProductReview.product_id)
+    )
+    upsert = insert(ProductRating).from_select(["product_id", "reviews_count", "rating_sum"], totals)
+    await async_db.execute(
+        upsert.on_conflict_do_update(
+            index_elements=[ProductRating.product_id],
+            set_={"reviews_count": upsert.excluded.reviews_count, "rating_sum": upsert.excluded.rating_sum}
+        )
+    )
+    await async_db.commit()
@@ -1,30 +1,66 @@
 from contextlib import asynccontextmanager
 from typing import AsyncIterator
 
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine, AsyncConnection, AsyncSession
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine, AsyncConnection, AsyncEngine, \
+    AsyncSession
 
-from config import DB_URL, DB_ECHO
+from config import DB_URL, DB_ECHO, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_PREPARED_STATEMENT_CACHE_SIZE
 
 
 class DatabaseSessionManager:
+    """
+    The engine is only created by open(): the application does that in its lifespan, scripts and tests get it
+    on first use. Importing this module (and so the application) never touches the database driver.
+    """
+
     def __init__(self, db_url: str, **engine_kwargs):
-        self._engine = create_async_engine(db_url, **engine_kwargs)
-        self._async_session = async_sessionmaker(bind=self._engine, autocommit=False)
+        self._db_url = db_url
+        self._engine_kwargs = engine_kwargs
+        self._engine: AsyncEngine | None = None
+        self._async_session: async_sessionmaker[AsyncSession] | None = None
+
+    def open(self) -> None:
+        if self._engine is None:
+            self._engine = create_async_engine(self._db_url, **self._engine_kwargs)
+            self._async_session = async_sessionmaker(bind=self._engine, autocommit=False)
+
+    @property
+    def engine(self) -> AsyncEngine:
+        self.open()
+        return self._engine
 
     async def close(self):
-        await self._engine.dispose()
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = self._async_session = None
 
     @asynccontextmanager
     async def connect(self) -> AsyncIterator[AsyncConnection]:
-        async with self._engine.begin() as connection:
+        async with self.engine.begin() as connection:
             try:
                 yield connection
             except Exception:
                 await connection.rollback()
                 raise
 
+    @asynccontextmanager
+    async def isolated(self) -> AsyncIterator[AsyncConnection]:
+        """
+        Binds every session opened through session() to one outer transaction that is rolled back on exit;
+        their commits only release savepoints. This is how the test suite isolates tests from each other.
+        """
+        async with self.engine.connect() as connection:
+            transaction = await connection.begin()
+            self._async_session.configure(bind=connection, join_transaction_mode="create_savepoint")
+            try:
+                yield connection
+            finally:
+                self._async_session.configure(bind=self._engine, join_transaction_mode="conservative_savepoint")
+                await transaction.rollback()
+
     @asynccontextmanager
     async def session(self) -> AsyncIterator[AsyncSession]:
+        self.open()
         session = self._async_session()
         try:
             yield session
@@ -35,4 +71,10 @@ class DatabaseSessionManager:
             await session.close()
 
 
-db_session_manager = DatabaseSessionManager(DB_URL, echo=DB_ECHO)
+db_session_manager = DatabaseSessionManager(
+    DB_URL,
+    echo=DB_ECHO,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    connect_args={"prepared_statement_cache_size": DB_PREPARED_STATEMENT_CACHE_SIZE}
+)
@@ -3,11 +3,13 @@ from decimal import Decimal
 from typing import Self
 from uuid import UUID, uuid4
 
-from sqlalchemy import MetaData, String, ForeignKey, DECIMAL, Column, Table, text, DateTime, Index, func
-from sqlalchemy.dialects.postgresql import JSON
-from sqlalchemy.orm import declarative_base, Mapped, mapped_column, relationship, remote, foreign
+from sqlalchemy import MetaData, String, ForeignKey, DECIMAL, Column, Table, text, DateTime, Index, DDL, event
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import backref, declarative_base, Mapped, mapped_column, relationship
 from sqlalchemy_utils import LtreeType, Ltree
 
+from config import SEARCH_TEXT_CONFIG
+
 
 convention = {
     "ix": "ix_%(column_0_label)s",
@@ -30,15 +32,19 @@ class BaseModel(DeclarativeBase):
 class Category(BaseModel):
     __tablename__ = "category"
 
+    id: Mapped[UUID] = mapped_column(default=uuid4, server_default=text("uuid_generate_v4()"), primary_key=True)
     name: Mapped[str] = mapped_column(String(50), nullable=False)
     deactivated: Mapped[bool] = mapped_column(default=False, server_default="false")
+    # false when the category or any of its ancestors is deactivated, see crud.category.set_category_deactivated
+    effectively_active: Mapped[bool] = mapped_column(default=True, server_default="true")
     hierarchy = Column(LtreeType, nullable=False)
+    # derived from hierarchy by the category_sync_hierarchy trigger, never written on their own; a category with
+    # children can't be deleted, its subtree (and the products in it) has to be removed or moved explicitly
+    parent_id: Mapped[UUID] = mapped_column(ForeignKey("category.id", ondelete="RESTRICT"), nullable=True)
+    depth: Mapped[int] = mapped_column(default=1, server_default="1", nullable=False)
 
-    parent: Mapped['Category'] = relationship(
-        primaryjoin=(remote(hierarchy) == foreign(func.subpath(hierarchy, 0, -1))),
-        backref='children',
-        viewonly=True
-    )
+    # passive_deletes: the ORM leaves parent_id of the children alone and lets the foreign key refuse the delete
+    parent: Mapped['Category'] = relationship(remote_side=[id], backref=backref('children', passive_deletes="all"))
 
     products: Mapped[list["Product"]] = relationship(back_populates="category")
 
@@ -48,13 +54,117 @@ class Category(BaseModel):
         ltree_id = Ltree(obj_id.hex)
         self.name = name
         self.hierarchy = ltree_id if parent is None else parent.hierarchy + ltree_id
+        self.depth = len(self.hierarchy)
+        if parent is not None:
+            self.parent = parent
         self.deactivated = deactivated
+        self.effectively_active = not deactivated and (parent is None or parent.effectively_active)
 
     __table_args__ = (
         Index('ix_categories_hierarchy', hierarchy, postgresql_using='gist'),
+        Index('ix_categories_parent_id', parent_id),
+        Index('ix_categories_depth', depth),
     )
 
 
+category_sync_hierarchy_function = DDL(
+    """
+    CREATE OR REPLACE FUNCTION category_sync_hierarchy() RETURNS trigger AS $$
+    BEGIN
+        NEW.depth := nlevel(NEW.hierarchy);
+        NEW.parent_id := CASE
+            WHEN NEW.depth > 1 THEN ltree2text(subltree(NEW.hierarchy, NEW.depth - 2, NEW.depth - 1))::uuid
+        END;
+        IF TG_OP = 'INSERT' THEN
+            NEW.effectively_active := NOT NEW.deactivated AND coalesce(
+                (SELECT effectively_active FROM category WHERE id = NEW.parent_id), true
+            );
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """
+)
+category_sync_hierarchy_trigger = DDL(
+    """
+    CREATE TRIGGER category_sync_hierarchy
+    BEFORE INSERT OR UPDATE OF hierarchy ON category
+    FOR EACH ROW EXECUTE FUNCTION category_sync_hierarchy()
+    """
+)
+event.listen(Category.__table__, "after_create", category_sync_hierarchy_function)
+event.listen(Category.__table__, "after_create", category_sync_hierarchy_trigger)
+
+
+class CategoryProductCount(DeclarativeBase):
+    """active products per category, kept up to date by the triggers below"""
+    __tablename__ = "category_product_count"
+
+    category_id: Mapped[UUID] = mapped_column(ForeignKey("category.id", ondelete="CASCADE"), primary_key=True)
+    direct_count: Mapped[int] = mapped_column(default=0, server_default="0", nullable=False)
+    subtree_count: Mapped[int] = mapped_column(default=0, server_default="0", nullable=False)
+
+
+category_product_count_add_function = DDL(
+    """
+    CREATE OR REPLACE FUNCTION category_product_count_add(target uuid, delta integer) RETURNS void AS $$
+        UPDATE category_product_count cpc
+        SET direct_count = cpc.direct_count + CASE WHEN cpc.category_id = target THEN delta ELSE 0 END,
+            subtree_count = cpc.subtree_count + delta
+        WHERE cpc.category_id = any((
+            SELECT string_to_array(ltree2text(hierarchy), '.')::uuid[] FROM category WHERE id = target
+        ))
+    $$ LANGUAGE sql
+    """
+)
+category_product_count_create_function = DDL(
+    """
+    CREATE OR REPLACE FUNCTION category_product_count_create() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO category_product_count (category_id) VALUES (NEW.id);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """
+)
+category_product_count_create_trigger = DDL(
+    """
+    CREATE TRIGGER category_product_count_create
+    AFTER INSERT ON category
+    FOR EACH ROW EXECUTE FUNCTION category_product_count_create()
+    """
+)
+# runs before the products of the category go with it through ON DELETE CASCADE: by the time product_count_sync
+# fires for them the category row is gone and category_product_count_add finds no ancestors to update
+category_product_count_remove_function = DDL(
+    """
+    CREATE OR REPLACE FUNCTION category_product_count_remove() RETURNS trigger AS $$
+    BEGIN
+        UPDATE category_product_count cpc
+        SET subtree_count = cpc.subtree_count - removed.subtree_count
+        FROM category_product_count removed
+        WHERE removed.category_id = OLD.id
+            AND cpc.category_id = any(string_to_array(ltree2text(OLD.hierarchy), '.')::uuid[])
+            AND cpc.category_id != OLD.id;
+        RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql
+    """
+)
+category_product_count_remove_trigger = DDL(
+    """
+    CREATE TRIGGER category_product_count_remove
+    BEFORE DELETE ON category
+    FOR EACH ROW EXECUTE FUNCTION category_product_count_remove()
+    """
+)
+event.listen(CategoryProductCount.__table__, "after_create", category_product_count_add_function)
+event.listen(CategoryProductCount.__table__, "after_create", category_product_count_create_function)
+event.listen(CategoryProductCount.__table__, "after_create", category_product_count_create_trigger)
+event.listen(CategoryProductCount.__table__, "after_create", category_product_count_remove_function)
+event.listen(CategoryProductCount.__table__, "after_create", category_product_count_remove_trigger)
+
+
 product_tag_association = Table(
     "product_tag",
     BaseModel.metadata,
@@ -84,12 +194,26 @@ class Product(BaseModel):
     name: Mapped[str] = mapped_column(String(50), nullable=False)
     description: Mapped[str] = mapped_column(nullable=True)
     is_active: Mapped[bool] = mapped_column(default=True, server_default="true")
+    # copy of category.effectively_active, set by the product_sync_category trigger and the category crud
+    category_active: Mapped[bool] = mapped_column(default=True, server_default="true")
     made_in: Mapped[str] = mapped_column(String(50), nullable=True)
+    # copy of the image of the first product_image by (position, id), set by the product_image_sync_primary trigger
+    primary_image: Mapped[str] = mapped_column(String(100), nullable=True)
+    # name (A), tag names (B), category path names (C) and description (D), kept up to date by the
+    # product_search_* triggers on product, product_tag, tag and category
+    search_document = Column(TSVECTOR, nullable=True)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         default=datetime.utcnow,
         server_default=text("CURRENT_TIMESTAMP")
     )
+    # last change of the product or of what its detail page shows (images, variants, prices, availability), set by
+    # the product_touch trigger and the triggers on product_image and product_inventory
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=datetime.utcnow,
+        server_default=text("CURRENT_TIMESTAMP")
+    )
 
     category_id: Mapped[UUID] = mapped_column(ForeignKey("category.id", ondelete="CASCADE"), nullable=False)
     category: Mapped["Category"] = relationship(back_populates="products")
@@ -101,6 +225,216 @@ class Product(BaseModel):
         back_populates="products"
     )
 
+    __table_args__ = (
+        Index('ix_product_search_document', "search_document", postgresql_using='gin'),
+        # the newest-first listing of what the catalog shows, matching its filters, paged by
+        # ProductArrivedBeforeFilteringStrategy
+        Index(
+            'ix_product_new_arrivals', "created_at", "id",
+            postgresql_where=text("is_active IS true AND category_active IS true")
+        ),
+        # products are appended in created_at order, so a few block ranges cover any recent time window
+        Index('ix_product_created_at_brin', "created_at", postgresql_using='brin'),
+    )
+
+
+product_sync_category_function = DDL(
+    """
+    CREATE OR REPLACE FUNCTION product_sync_category() RETURNS trigger AS $$
+    BEGIN
+        NEW.category_active := coalesce(
+            (SELECT effectively_active FROM category WHERE id = NEW.category_id), true
+        );
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """
+)
+product_sync_category_trigger = DDL(
+    """
+    CREATE TRIGGER product_sync_category
+    BEFORE INSERT OR UPDATE OF category_id ON product
+    FOR EACH ROW EXECUTE FUNCTION product_sync_category()
+    """
+)
+product_count_sync_function = DDL(
+    """
+    CREATE OR REPLACE FUNCTION product_count_sync() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.is_active AND OLD.category_active THEN
+            PERFORM category_product_count_add(OLD.category_id, -1);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.is_active AND NEW.category_active THEN
+            PERFORM category_product_count_add(NEW.category_id, 1);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """
+)
+product_count_sync_trigger = DDL(
+    """
+    CREATE TRIGGER product_count_sync
+    AFTER INSERT OR DELETE OR UPDATE OF category_id, is_active, category_active ON product
+    FOR EACH ROW EXECUTE FUNCTION product_count_sync()
+    """
+)
+# plpgsql, not sql: its body refers to tables that don't exist yet when product is created
+product_search_document_function = DDL(
+    """
+    CREATE OR REPLACE FUNCTION product_search_document(
+        product_id uuid, name text, description text, category_id uuid
+    ) RETURNS tsvector AS $$
+    BEGIN
+        RETURN setweight(to_tsvector('{config}', coalesce(name, '')), 'A')
+            || setweight(to_tsvector('{config}', coalesce((
+                SELECT string_agg(tag.name, ' ') FROM product_tag JOIN tag ON tag.id = product_tag.tag_id
+                WHERE product_tag.product_id = product_search_document.product_id
+            ), '')), 'B')
+            || setweight(to_tsvector('{config}', coalesce((
+                SELECT string_agg(path.name, ' ') FROM category AS path
+                WHERE path.hierarchy @> (SELECT hierarchy FROM category WHERE id = product_search_document.category_id)
+            ), '')), 'C')
+            || setweight(to_tsvector('{config}', coalesce(description, '')), 'D');
+    END;
+    $$ LANGUAGE plpgsql STABLE
+    """.format(config=SEARCH_TEXT_CONFIG)
+)
+product_search_sync_function = DDL(
+    """
+    CREATE OR REPLACE FUNCTION product_search_sync() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_document := product_search_document(NEW.id, NEW.name, NEW.description, NEW.category_id);
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """
+)
+product_search_sync_trigger = DDL(
+    """
+    CREATE TRIGGER product_search_sync
+    BEFORE INSERT OR UPDATE OF name, description, category_id ON product
+    FOR EACH ROW EXECUTE FUNCTION product_search_sync()
+    """
+)
+# one update per statement for the products whose tags or category path changed
+product_search_refresh = """
+            UPDATE product
+            SET search_document = product_search_document(product.id, product.name, product.description,
+                                                          product.category_id)
+            WHERE {products};
+"""
+event.listen(Product.__table__, "after_create", product_sync_category_function)
+event.listen(Product.__table__, "after_create", product_sync_category_trigger)
+event.listen(Product.__table__, "after_create", product_count_sync_function)
+event.listen(Product.__table__, "after_create", product_count_sync_trigger)
+event.listen(Product.__table__, "after_create", product_search_document_function)
+event.listen(Product.__table__, "after_create", product_search_sync_function)
+event.listen(Product.__table__, "after_create", product_search_sync_trigger)
+
+
+product_touch_function = DDL(
+    """
+    CREATE OR REPLACE FUNCTION product_touch() RETURNS trigger AS $$
+    BEGIN
+        NEW.updated_at := now();
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """
+)
+# named to run after the other BEFORE triggers on product, so the columns they set count as changes too
+product_touch_trigger = DDL(
+    """
+    CREATE TRIGGER product_touch
+    BEFORE UPDATE ON product
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION product_touch()
+    """
+)
+event.listen(Product.__table__, "after_create", product_touch_function)
+event.listen(Product.__table__, "after_create", product_touch_trigger)
+
+product_search_sync_tags_function = DDL(
+    """
+    CREATE OR REPLACE FUNCTION product_search_sync_tags() RETURNS trigger AS $$
+    BEGIN
+        IF TG_TABLE_NAME = 'product_tag' AND TG_OP = 'INSERT' THEN
+            {inserted}
+        ELSIF TG_TABLE_NAME = 'product_tag' THEN
+            {deleted}
+        ELSE
+            {renamed}
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """.format(
+        inserted=product_search_refresh.format(products="product.id IN (SELECT product_id FROM new_rows)"),
+        deleted=product_search_refresh.format(products="product.id IN (SELECT product_id FROM old_rows)"),
+        renamed=product_search_refresh.format(
+            products="product.id IN (SELECT product_tag.product_id FROM product_tag "
+                     "JOIN new_rows ON new_rows.id = product_tag.tag_id "
+                     "JOIN old_rows ON old_rows.id = new_rows.id AND old_rows.name IS DISTINCT FROM new_rows.name)"
+        ),
+    )
+)
+product_search_sync_tags_triggers = [
+    DDL(
+        """
+        CREATE TRIGGER product_search_sync_tags_insert
+        AFTER INSERT ON product_tag REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION product_search_sync_tags()
+        """
+    ),
+    DDL(
+        """
+        CREATE TRIGGER product_search_sync_tags_delete
+        AFTER DELETE ON product_tag REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION product_search_sync_tags()
+        """
+    ),
+]
+# transition tables rule out "UPDATE OF name", so the function compares the names itself
+product_search_sync_tag_names_trigger = DDL(
+    """
+    CREATE TRIGGER product_search_sync_tag_names
+    AFTER UPDATE ON tag REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION product_search_sync_tags()
+    """
+)
+product_search_sync_categories_function = DDL(
+    """
+    CREATE OR REPLACE FUNCTION product_search_sync_categories() RETURNS trigger AS $$
+    BEGIN
+        {renamed}
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """.format(
+        # a renamed or moved category changes the path of every product below it
+        renamed=product_search_refresh.format(
+            products="product.category_id IN (SELECT below.id FROM category AS below "
+                     "JOIN new_rows ON below.hierarchy <@ new_rows.hierarchy "
+                     "JOIN old_rows ON old_rows.id = new_rows.id "
+                     "AND (old_rows.name, old_rows.hierarchy) IS DISTINCT FROM (new_rows.name, new_rows.hierarchy))"
+        )
+    )
+)
+product_search_sync_categories_trigger = DDL(
+    """
+    CREATE TRIGGER product_search_sync_categories
+    AFTER UPDATE ON category REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION product_search_sync_categories()
+    """
+)
+event.listen(product_tag_association, "after_create", product_search_sync_tags_function)
+for product_search_sync_tags_trigger in product_search_sync_tags_triggers:
+    event.listen(product_tag_association, "after_create", product_search_sync_tags_trigger)
+event.listen(Tag.__table__, "after_create", product_search_sync_tags_function)
+event.listen(Tag.__table__, "after_create", product_search_sync_tag_names_trigger)
+event.listen(Category.__table__, "after_create", product_search_sync_categories_function)
+event.listen(Category.__table__, "after_create", product_search_sync_categories_trigger)
+
 
 class ProductInventory(BaseModel):
     __tablename__ = "product_inventory"
@@ -108,20 +442,207 @@ class ProductInventory(BaseModel):
     quantity: Mapped[int] = mapped_column(default=0, server_default="0", nullable=False)
     unit_price: Mapped[Decimal] = mapped_column(DECIMAL(7, 3), nullable=False)
     discount: Mapped[float] = mapped_column(nullable=True)
-    meta = Column(JSON, nullable=True)  # there may be product variations or anything else that might highlight the data
+    # there may be product variations or anything else that might highlight the data
+    meta = Column(JSONB, nullable=True)
 
     product_id: Mapped[UUID] = mapped_column(ForeignKey("product.id", ondelete="CASCADE"), nullable=False)
     product: Mapped["Product"] = relationship(back_populates="inventories")
 
+    __table_args__ = (
+        # (product_id, id) also hands the detail query its variants already in aggregation order
+        Index('ix_product_inventory_product_id', product_id, "id"),
+        # jsonb_path_ops only serves @> containment, which is all the variant attribute filter uses
+        Index('ix_product_inventory_meta', meta, postgresql_using='gin', postgresql_ops={'meta': 'jsonb_path_ops'}),
+    )
+
+
+# quantity only shows as availability, so the reservations moving it only touch the product when it runs out or
+# comes back
+product_inventory_touch_product_function = DDL(
+    """
+    CREATE OR REPLACE FUNCTION product_inventory_touch_product() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            UPDATE product SET updated_at = now() WHERE id IN (SELECT product_id FROM new_variants);
+        ELSIF TG_OP = 'DELETE' THEN
+            UPDATE product SET updated_at = now() WHERE id IN (SELECT product_id FROM old_variants);
+        ELSE
+            UPDATE product SET updated_at = now() WHERE id IN (
+                SELECT new_variants.product_id FROM new_variants JOIN old_variants USING (id)
+                WHERE (
+                    old_variants.product_id, old_variants.unit_price, old_variants.discount, old_variants.meta,
+                    old_variants.quantity > 0
+                ) IS DISTINCT FROM (
+                    new_variants.product_id, new_variants.unit_price, new_variants.discount, new_variants.meta,
+                    new_variants.quantity > 0
+                )
+                UNION
+                SELECT old_variants.product_id FROM new_variants JOIN old_variants USING (id)
+                WHERE old_variants.product_id <> new_variants.product_id
+            );
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """
+)
+product_inventory_touch_product_triggers = [
+    DDL(
+        """
+        CREATE TRIGGER product_inventory_touch_product_insert
+        AFTER INSERT ON product_inventory REFERENCING NEW TABLE AS new_variants
+        FOR EACH STATEMENT EXECUTE FUNCTION product_inventory_touch_product()
+        """
+    ),
+    DDL(
+        """
+        CREATE TRIGGER product_inventory_touch_product_delete
+        AFTER DELETE ON product_inventory REFERENCING OLD TABLE AS old_variants
+        FOR EACH STATEMENT EXECUTE FUNCTION product_inventory_touch_product()
+        """
+    ),
+    DDL(
+        """
+        CREATE TRIGGER product_inventory_touch_product_update
+        AFTER UPDATE ON product_inventory REFERENCING OLD TABLE AS old_variants NEW TABLE AS new_variants
+        FOR EACH STATEMENT EXECUTE FUNCTION product_inventory_touch_product()
+        """
+    ),
+]
+event.listen(ProductInventory.__table__, "after_create", product_inventory_touch_product_function)
+for product_inventory_touch_product_trigger in product_inventory_touch_product_triggers:
+    event.listen(ProductInventory.__table__, "after_create", product_inventory_touch_product_trigger)
+
+
+class InventoryReservation(BaseModel):
+    """
+    Stock held for one cart. Reserving already takes the units off product_inventory.quantity, so quantity
+    is always what can still be sold; releasing (by the client or by expiry) gives them back.
+    """
+    __tablename__ = "inventory_reservation"
+
+    status: Mapped[str] = mapped_column(String(10), default="held", server_default="held", nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=datetime.utcnow,
+        server_default=text("CURRENT_TIMESTAMP")
+    )
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+    items: Mapped[list["InventoryReservationItem"]] = relationship(back_populates="reservation")
+
+    __table_args__ = (
+        # the expiry sweeper only ever looks at held reservations
+        Index('ix_inventory_reservation_expires_at', expires_at, postgresql_where=text("status = 'held'")),
+    )
+
+
+class InventoryReservationItem(BaseModel):
+    __tablename__ = "inventory_reservation_item"
+
+    quantity: Mapped[int] = mapped_column(nullable=False)
+
+    reservation_id: Mapped[UUID] = mapped_column(
+        ForeignKey("inventory_reservation.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True
+    )
+    reservation: Mapped["InventoryReservation"] = relationship(back_populates="items")
+    inventory_id: Mapped[UUID] = mapped_column(ForeignKey("product_inventory.id", ondelete="CASCADE"), nullable=False)
+
+
+class MediaAsset(DeclarativeBase):
+    """an uploaded file, stored once per content digest together with its size variants, see services.media"""
+    __tablename__ = "media_asset"
+
+    digest: Mapped[str] = mapped_column(String(64), primary_key=True)
+    content_type: Mapped[str] = mapped_column(String(50), nullable=False)
+    width: Mapped[int] = mapped_column(nullable=False)
+    height: Mapped[int] = mapped_column(nullable=False)
+    size: Mapped[int] = mapped_column(nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=datetime.utcnow,
+        server_default=text("CURRENT_TIMESTAMP")
+    )
+
 
 class ProductImage(BaseModel):
     __tablename__ = "product_image"
 
+    # "sha256:<digest>" of a MediaAsset for uploaded images, a plain path for images added before uploads existed
     image: Mapped[str] = mapped_column(String(100), nullable=False)
+    # images are shown by ascending position, the first one is the product's primary image
+    position: Mapped[int] = mapped_column(default=0, server_default="0", nullable=False)
 
     product_id: Mapped[UUID] = mapped_column(ForeignKey("product.id", ondelete="CASCADE"), nullable=False)
     product: Mapped["Product"] = relationship(back_populates="images")
 
+    __table_args__ = (
+        Index('ix_product_image_product_id', product_id, position, "id"),
+    )
+
+
+# one update per statement, so reordering all images of a product recomputes its primary image once; any image
+# change touches the product, its detail page lists them all
+product_image_sync_primary_update = """
+            UPDATE product SET updated_at = now(), primary_image = (
+                SELECT product_image.image FROM product_image
+                WHERE product_image.product_id = product.id
+                ORDER BY product_image.position, product_image.id
+                LIMIT 1
+            )
+            WHERE product.id IN ({changes});
+"""
+product_image_sync_primary_function = DDL(
+    """
+    CREATE OR REPLACE FUNCTION product_image_sync_primary() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            {inserted}
+        ELSIF TG_OP = 'DELETE' THEN
+            {deleted}
+        ELSE
+            {updated}
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """.format(
+        inserted=product_image_sync_primary_update.format(changes="SELECT product_id FROM new_images"),
+        deleted=product_image_sync_primary_update.format(changes="SELECT product_id FROM old_images"),
+        updated=product_image_sync_primary_update.format(
+            changes="SELECT product_id FROM new_images UNION SELECT product_id FROM old_images"
+        ),
+    )
+)
+product_image_sync_primary_triggers = [
+    DDL(
+        """
+        CREATE TRIGGER product_image_sync_primary_insert
+        AFTER INSERT ON product_image REFERENCING NEW TABLE AS new_images
+        FOR EACH STATEMENT EXECUTE FUNCTION product_image_sync_primary()
+        """
+    ),
+    DDL(
+        """
+        CREATE TRIGGER product_image_sync_primary_delete
+        AFTER DELETE ON product_image REFERENCING OLD TABLE AS old_images
+        FOR EACH STATEMENT EXECUTE FUNCTION product_image_sync_primary()
+        """
+    ),
+    DDL(
+        """
+        CREATE TRIGGER product_image_sync_primary_update
+        AFTER UPDATE ON product_image REFERENCING OLD TABLE AS old_images NEW TABLE AS new_images
+        FOR EACH STATEMENT EXECUTE FUNCTION product_image_sync_primary()
+        """
+    ),
+]
+event.listen(ProductImage.__table__, "after_create", product_image_sync_primary_function)
+for product_image_sync_primary_trigger in product_image_sync_primary_triggers:
+    event.listen(ProductImage.__table__, "after_create", product_image_sync_primary_trigger)
+
 
 class Customer(BaseModel):
     __tablename__ = "customer"
@@ -147,3 +668,133 @@ class ProductReview(BaseModel):
     product: Mapped["Product"] = relationship(back_populates="reviews")
     customer_id: Mapped[UUID] = mapped_column(ForeignKey("customer.id", ondelete="CASCADE"), nullable=False)
     customer: Mapped["Customer"] = relationship(back_populates="reviews")
+    # copy of customer.fullname, set by the product_review_sync_author trigger and the customer_sync_review_authors
+    # trigger on renames, so listing reviews needs no join to customer
+    author_name: Mapped[str] = mapped_column(String(100), nullable=False, server_default="")
+
+    __table_args__ = (
+        Index('ix_product_reviews_product_id', product_id),
+        # a customer's rename has to find all of their reviews
+        Index('ix_product_reviews_customer_id', customer_id),
+    )
+
+
+product_review_sync_author_function = DDL(
+    """
+    CREATE OR REPLACE FUNCTION product_review_sync_author() RETURNS trigger AS $$
+    BEGIN
+        NEW.author_name := coalesce((SELECT fullname FROM customer WHERE id = NEW.customer_id), '');
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """
+)
+product_review_sync_author_trigger = DDL(
+    """
+    CREATE TRIGGER product_review_sync_author
+    BEFORE INSERT OR UPDATE OF customer_id ON product_reviews
+    FOR EACH ROW EXECUTE FUNCTION product_review_sync_author()
+    """
+)
+customer_sync_review_authors_function = DDL(
+    """
+    CREATE OR REPLACE FUNCTION customer_sync_review_authors() RETURNS trigger AS $$
+    BEGIN
+        UPDATE product_reviews SET author_name = NEW.fullname WHERE customer_id = NEW.id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """
+)
+customer_sync_review_authors_trigger = DDL(
+    """
+    CREATE TRIGGER customer_sync_review_authors
+    AFTER UPDATE OF fullname ON customer
+    FOR EACH ROW WHEN (OLD.fullname IS DISTINCT FROM NEW.fullname) EXECUTE FUNCTION customer_sync_review_authors()
+    """
+)
+event.listen(ProductReview.__table__, "after_create", product_review_sync_author_function)
+event.listen(ProductReview.__table__, "after_create", product_review_sync_author_trigger)
+event.listen(ProductReview.__table__, "after_create", customer_sync_review_authors_function)
+event.listen(ProductReview.__table__, "after_create", customer_sync_review_authors_trigger)
+
+
+class ProductRating(DeclarativeBase):
+    """review aggregates per product, kept up to date by the statement level triggers below"""
+    __tablename__ = "product_rating"
+
+    product_id: Mapped[UUID] = mapped_column(ForeignKey("product.id", ondelete="CASCADE"), primary_key=True)
+    reviews_count: Mapped[int] = mapped_column(default=0, server_default="0", nullable=False)
+    rating_sum: Mapped[float] = mapped_column(default=0.0, server_default="0", nullable=False)
+
+
+# one upsert per statement, so a batch of reviews updates every product it touches exactly once
+product_rating_upsert = """
+            INSERT INTO product_rating AS pr (product_id, reviews_count, rating_sum)
+            SELECT changes.product_id, sum(changes.reviews_count), sum(changes.rating_sum)
+            FROM ({changes}) AS changes
+            WHERE EXISTS (SELECT 1 FROM product WHERE product.id = changes.product_id)
+            GROUP BY changes.product_id
+            ON CONFLICT (product_id) DO UPDATE
+            SET reviews_count = pr.reviews_count + EXCLUDED.reviews_count,
+                rating_sum = pr.rating_sum + EXCLUDED.rating_sum;
+"""
+product_rating_sync_function = DDL(
+    """
+    CREATE OR REPLACE FUNCTION product_rating_sync() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            {inserted}
+        ELSIF TG_OP = 'DELETE' THEN
+            {deleted}
+        ELSE
+            {updated}
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """.format(
+        inserted=product_rating_upsert.format(
+            changes="SELECT product_id, 1 AS reviews_count, rating AS rating_sum FROM new_reviews"
+        ),
+        deleted=product_rating_upsert.format(
+            changes="SELECT product_id, -1 AS reviews_count, -rating AS rating_sum FROM old_reviews"
+        ),
+        # only reviews that moved to another product or got another rating, not e.g. author_name rewrites
+        updated=product_rating_upsert.format(
+            changes="SELECT new_reviews.product_id, 1 AS reviews_count, new_reviews.rating AS rating_sum "
+                    "FROM new_reviews JOIN old_reviews USING (id) {changed} "
+                    "UNION ALL SELECT old_reviews.product_id, -1, -old_reviews.rating "
+                    "FROM old_reviews JOIN new_reviews USING (id) {changed}".format(
+                        changed="WHERE (new_reviews.product_id, new_reviews.rating) "
+                                "IS DISTINCT FROM (old_reviews.product_id, old_reviews.rating)"
+                    )
+        ),
+    )
+)
+product_rating_triggers = [
+    DDL(
+        """
+        CREATE TRIGGER product_rating_sync_insert
+        AFTER INSERT ON product_reviews REFERENCING NEW TABLE AS new_reviews
+        FOR EACH STATEMENT EXECUTE FUNCTION product_rating_sync()
+        """
+    ),
+    DDL(
+        """
+        CREATE TRIGGER product_rating_sync_delete
+        AFTER DELETE ON product_reviews REFERENCING OLD TABLE AS old_reviews
+        FOR EACH STATEMENT EXECUTE FUNCTION product_rating_sync()
+        """
+    ),
+    DDL(
+        """
+        CREATE TRIGGER product_rating_sync_update
+        AFTER UPDATE ON product_reviews REFERENCING OLD TABLE AS old_reviews NEW TABLE AS new_reviews
+        FOR EACH STATEMENT EXECUTE FUNCTION product_rating_sync()
+        """
+    ),
+]
+event.listen(ProductReview.__table__, "after_create", product_rating_sync_function)
+for product_rating_trigger in product_rating_triggers:
+    event.listen(ProductReview.__table__, "after_create", product_rating_trigger)
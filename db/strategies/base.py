@@ -27,6 +27,8 @@ class SelectStrategy(AliasedStrategy, ABC):
 class BaseQueryStrategy(AliasedStrategy):
     default_data: Any = None
     bool_check: bool = False
+    # relationships of the aliased model the select strategy has to join for this strategy to work
+    required_joins: tuple[str, ...] = ()
 
     def __init__(self, query, alias: AliasedClass = None):
         super().__init__(alias)
@@ -1,23 +1,80 @@
 from uuid import UUID
 
-from sqlalchemy import select, func
+from sqlalchemy import select, func, Uuid
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.sql import expression
 from sqlalchemy.sql.selectable import Select
 from sqlalchemy_utils.types.ltree import LQUERY
 
-from db.models import Category
+from db.models import Category, CategoryProductCount, Product
 from .base import SelectStrategy, FilteringStrategy
 
 
+def path_ids(category_id: UUID | str):
+    """ids of the category and all of its ancestors, read from the labels of its hierarchy"""
+    return (
+        select(expression.cast(func.string_to_array(func.ltree2text(Category.hierarchy), "."), ARRAY(Uuid)))
+        .where(Category.id == category_id)
+        .scalar_subquery()
+    )
+
+
 class CategorySelectStrategy(SelectStrategy):
     """
     SELECT
         c.id,
         c.name,
-        pc.id AS parent,
-        nlevel(c.hierarchy) AS level
+        c.parent_id AS parent,
+        c.depth AS level
+    FROM category AS c;
+    """
+
+    def select(self) -> Select[Category]:
+        return (
+            select(
+                self._alias.id,
+                self._alias.name,
+                self._alias.parent_id.label("parent"),
+                self._alias.depth.label("level")
+            )
+            .select_from(self._alias)
+        )
+
+
+class CategoryWithCountsSelectStrategy(CategorySelectStrategy):
+    """
+    SELECT
+        c.id,
+        c.name,
+        c.parent_id AS parent,
+        c.depth AS level,
+        cpc.direct_count AS product_count,
+        cpc.subtree_count AS subtree_product_count
+    FROM category AS c
+    LEFT OUTER JOIN category_product_count cpc ON c.id = cpc.category_id;
+    """
+
+    def select(self) -> Select[Category]:
+        return (
+            super().select()
+            .add_columns(
+                CategoryProductCount.direct_count.label("product_count"),
+                CategoryProductCount.subtree_count.label("subtree_product_count")
+            )
+            .outerjoin(CategoryProductCount, CategoryProductCount.category_id == self._alias.id)
+        )
+
+
+class CategorySuggestSelectStrategy(SelectStrategy):
+    """
+    SELECT
+        c.id,
+        c.name,
+        count(p.id) FILTER (WHERE p.is_active IS true) AS weight
     FROM category AS c
-    LEFT OUTER JOIN category pc ON pc.hierarchy = subpath(c.hierarchy, 0, -1);
+    LEFT OUTER JOIN product p ON c.id = p.category_id
+    GROUP BY
+        c.id;
     """
 
     def select(self) -> Select[Category]:
@@ -25,11 +82,11 @@ class CategorySelectStrategy(SelectStrategy):
             select(
                 self._alias.id,
                 self._alias.name,
-                Category.id.label("parent"),
-                (func.nlevel(self._alias.hierarchy)).label("level")
+                func.count(Product.id).filter(Product.is_active.is_(True)).label("weight")
             )
             .select_from(self._alias)
-            .outerjoin(self._alias.parent)
+            .outerjoin(self._alias.products)
+            .group_by(self._alias.id)
         )
 
 
@@ -39,30 +96,45 @@ class CategoryDeactivatedFilteringStrategy(FilteringStrategy):
         return self.query.where(self._alias.deactivated.is_(deactivated))
 
 
+class CategoryEffectivelyActiveFilteringStrategy(FilteringStrategy):
+    def filter(self, effectively_active: bool) -> Select[Category]:
+        assert isinstance(effectively_active, bool)
+        return self.query.where(self._alias.effectively_active.is_(effectively_active))
+
+
 class CategoryLevelFilteringStrategy(FilteringStrategy):
     def filter(self, level: int) -> Select[Category]:
         assert isinstance(level, int)
-        return self.query.where(func.nlevel(self._alias.hierarchy) == level)
+        return self.query.where(self._alias.depth == level)
 
 
 class CategoryHierarchyFilteringStrategy(FilteringStrategy):
+    """
+    descendants: every row whose path runs through the category below it, answered by the GiST index
+        c.hierarchy ~ '*.<category hex>.*{1,}'
+    ancestors: primary key lookups of the labels of the category's own path
+        c.id = any((SELECT string_to_array(ltree2text(hierarchy), '.')::uuid[] FROM category WHERE id = :id))
+    """
+
     def filter(self, data) -> Select[Category]:
         assert isinstance(data, dict)
 
         match data:
-            case {"descendants": bool() as descendants, "category_id": str() as category_id}:
-                current_hierarchy = (
-                    select(Category.hierarchy)
-                    .where(Category.id == category_id)
-                    .limit(1)
-                    .scalar_subquery()
+            case {"descendants": True, "category_id": str() | UUID() as category_id}:
+                return self.query.where(
+                    self._alias.hierarchy.lquery(expression.cast("*.%s.*{1,}" % self._hex(category_id), LQUERY))
                 )
-                referral_method = "ancestor_of" if descendants is False else "descendant_of"
+            case {"descendants": False, "category_id": str() | UUID() as category_id}:
                 return self.query.where(
-                    getattr(self._alias.hierarchy, referral_method)(current_hierarchy),
+                    self._alias.id == func.any(path_ids(category_id)),
                     self._alias.id != category_id
                 )
             case {"category_id": str() | UUID() as category_id}:
-                category_hex = UUID(category_id).hex if isinstance(category_id, str) else category_id.hex
-                return self.query.where(self._alias.hierarchy.lquery(expression.cast("*.%s.*" % category_hex, LQUERY)))
+                return self.query.where(
+                    self._alias.hierarchy.lquery(expression.cast("*.%s.*" % self._hex(category_id), LQUERY))
+                )
         return self.query
+
+    @staticmethod
+    def _hex(category_id: str | UUID) -> str:
+        return UUID(category_id).hex if isinstance(category_id, str) else category_id.hex
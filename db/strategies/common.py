@@ -1,4 +1,8 @@
-from typing import Literal, Any
+from datetime import datetime, timedelta
+from typing import Literal, Any, Iterable
+
+from sqlalchemy import any_, bindparam, func
+from sqlalchemy.dialects.postgresql import ARRAY
 
 from .base import SortStrategy, FilteringStrategy
 
@@ -14,6 +18,14 @@ class IDFilteringStrategy(FilteringStrategy):
         return self.query.where(self._alias.id == _id)
 
 
+class IDInFilteringStrategy(FilteringStrategy):
+    def filter(self, ids: Iterable[Any]):
+        assert not isinstance(ids, str)
+        # one array parameter instead of IN (...) with a parameter per id: the statement is the same for any count
+        ids = bindparam("ids", list(ids), type_=ARRAY(self._alias.id.type))
+        return self.query.where(self._alias.id == any_(ids))
+
+
 class IDOrderingStrategy(SortStrategy):
     def sort(self, sort_type: Literal["asc", "desc"]):
         assert isinstance(sort_type, str) and sort_type in ("asc", "desc")
@@ -24,3 +36,24 @@ class CreatedOrderingStrategy(SortStrategy):
     def sort(self, sort_type: Literal["asc", "desc"]):
         assert isinstance(sort_type, str) and sort_type in ("asc", "desc")
         return self.query.order_by(self._get_sort_method(self._alias.created_at, sort_type)())
+
+
+class CreatedAfterFilteringStrategy(FilteringStrategy):
+    def filter(self, created_after: datetime):
+        assert isinstance(created_after, datetime)
+        return self.query.where(self._alias.created_at > created_after)
+
+
+class CreatedWithinFilteringStrategy(FilteringStrategy):
+    """
+    rows created during the last `created_within`, relative to the transaction's now(), so the statement stays
+    the same from one request to the next:
+
+    WHERE p.created_at >= now() - :created_within
+    """
+
+    def filter(self, created_within: timedelta):
+        assert isinstance(created_within, timedelta)
+        return self.query.where(
+            self._alias.created_at >= func.now() - bindparam("created_within", created_within)
+        )
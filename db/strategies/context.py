@@ -80,6 +80,10 @@ class QueryContext:
         self.ordering_strategies = ordering_strategies
 
     def filtering(self, **filters) -> bool:
+        """
+        Filters are applied in the order of filtering_strategies, not in the order they are passed, so equal
+        filters always render byte-identical SQL and reuse one compiled and prepared statement.
+        """
         assert self.filtering_strategies, "filtering_strategies required on using this method!"
 
         filtering_context = FilterContext(
@@ -88,12 +92,22 @@ class QueryContext:
             aliased_class=self.aliased_class
         )
 
-        for filter_name, value in (filters or {}).items():
-            filtered_query = filtering_context.filter(value, filter_name)
+        filters = filters or {}
+        if filters.keys() - self.filtering_strategies.keys():
+            raise ValueError('Invalid strategy name')
+
+        for filter_name in self.filtering_strategies:
+            if filter_name not in filters:
+                continue
+            filtered_query = filtering_context.filter(filters[filter_name], filter_name)
             if filtered_query is not None:
                 filtering_context.query = self.query = filtered_query
 
     def ordering(self, ordering_fields: Iterable[str] = None) -> None:
+        """
+        The order of the fields is the sort order, so it is kept; a field repeated later ("price,-price") can't
+        change the result and is dropped, so it doesn't make the statement differ either.
+        """
         assert self.ordering_strategies, "ordering_strategies required on using this method!"
 
         ordering_context = OrderingContext(
@@ -102,7 +116,12 @@ class QueryContext:
             aliased_class=self.aliased_class
         )
 
+        applied = set()
         for field in ordering_fields or []:
-            ordered_query = ordering_context.order_by(field.split("-")[-1], not field.startswith("-"))
+            name = field.split("-")[-1]
+            if name in applied:
+                continue
+            applied.add(name)
+            ordered_query = ordering_context.order_by(name, not field.startswith("-"))
             if ordered_query is not None:
                 ordering_context.query = self.query = ordered_query
@@ -1,15 +1,37 @@
-from typing import Literal
+from typing import Iterable, Literal
 from uuid import UUID
 
-from sqlalchemy import select, func, case as sql_case
-from sqlalchemy.sql import expression
+from sqlalchemy import Float, select, func, case as sql_case, literal, tuple_, bindparam
+from sqlalchemy.dialects.postgresql import JSONB, REGCONFIG, aggregate_order_by
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql import expression, ColumnElement
 from sqlalchemy.sql.selectable import Select
 from sqlalchemy_utils.types.ltree import LQUERY
 
-from db.models import Category, Product, ProductInventory, ProductImage, ProductReview
+from config import SEARCH_TEXT_CONFIG
+from db.models import Category, Product, ProductInventory, ProductImage, ProductRating
 from .base import SelectStrategy, FilteringStrategy, SortStrategy
 
 
+# every child table is aggregated per product on its own and joined 1:1, so one child never multiplies the
+# aggregates of the other and a column means the same whatever else is selected, filtered or ordered by
+inventory_totals = (
+    select(
+        ProductInventory.product_id,
+        func.max(ProductInventory.unit_price).label("price"),
+        func.max(ProductInventory.discount).label("discount"),
+        func.sum(ProductInventory.discount).label("discount_total"),
+    )
+    .group_by(ProductInventory.product_id)
+    .subquery("inv")
+)
+# review aggregates are kept per product by triggers, see db.models.ProductRating
+review_totals = ProductRating.__table__.alias("rv")
+average_rating = review_totals.c.rating_sum / func.nullif(review_totals.c.reviews_count, 0, type_=Float)
+# the joins filters and orderings name in `required_joins`
+child_totals = {"inventories": inventory_totals, "reviews": review_totals}
+
+
 class ProductListSelectStrategy(SelectStrategy):
     """
     SELECT
@@ -17,39 +39,87 @@ class ProductListSelectStrategy(SelectStrategy):
         p.name,
         p.category_id,
         p.made_in,
-        max(p_img.image) AS image,
-        max(inv.unit_price) AS price,
-        max(inv.discount) AS discount,
-        coalesce(avg(rv.rating), 0.0) AS avg_rating,
-        count(rv.id) AS reviews_count
+        p.primary_image AS image,
+        inv.price,
+        inv.discount,
+        coalesce(rv.rating_sum / nullif(rv.reviews_count, 0), 0.0) AS avg_rating,
+        coalesce(rv.reviews_count, 0) AS reviews_count
     FROM product AS p
-    LEFT OUTER JOIN product_image p_img ON p.id = p_img.product_id
-    LEFT OUTER JOIN product_inventory inv ON p.id = inv.product_id
-    LEFT OUTER JOIN product_reviews rv ON p.id = rv.product_id
-    GROUP BY
-        p.id
+    LEFT OUTER JOIN (
+        SELECT product_id, max(unit_price) AS price, max(discount) AS discount, sum(discount) AS discount_total
+        FROM product_inventory GROUP BY product_id
+    ) AS inv ON inv.product_id = p.id
+    LEFT OUTER JOIN product_rating AS rv ON rv.product_id = p.id
     ORDER BY
         p.id ASC
     LIMIT 10 OFFSET 0;
+
+    With `fields` only those columns (and id) are selected and a child aggregate is only joined when one of them,
+    or one of the extra `joins` filters and orderings rely on, is computed from it; without a join an ordered
+    index on product can hand out the page directly.
     """
+    field_joins = {
+        "price": "inventories",
+        "discount": "inventories",
+        "avg_rating": "reviews",
+        "reviews_count": "reviews",
+    }
+
+    def __init__(self, alias, fields: Iterable[str] = None, joins: Iterable[str] = ()):
+        super().__init__(alias)
+        self.fields = None if fields is None else {"id", *fields}
+        self.joins = set(joins)
+
+    def columns(self) -> dict[str, ColumnElement]:
+        return {
+            "id": self._alias.id,
+            "name": self._alias.name,
+            "category_id": self._alias.category_id,
+            "made_in": self._alias.made_in,
+            "image": self._alias.primary_image.label("image"),
+            "price": inventory_totals.c.price,
+            "discount": inventory_totals.c.discount,
+            "avg_rating": func.coalesce(average_rating, 0.0).label('avg_rating'),
+            "reviews_count": func.coalesce(review_totals.c.reviews_count, 0).label("reviews_count"),
+        }
+
     def select(self) -> Select[Product]:
-        return (
-            select(
-                self._alias.id,
-                self._alias.name,
-                self._alias.category_id,
-                self._alias.made_in,
-                func.max(ProductImage.image).label("image"),
-                func.max(ProductInventory.unit_price).label("price"),
-                func.max(ProductInventory.discount).label("discount"),
-                func.coalesce(func.avg(ProductReview.rating), 0.0).label('avg_rating'),
-                func.count(ProductReview.id).label("reviews_count")
-            )
-            .select_from(self._alias)
-            .outerjoin(self._alias.images)
-            .outerjoin(self._alias.inventories)
-            .outerjoin(self._alias.reviews)
-            .group_by(self._alias.id)
+        columns = {
+            name: column for name, column in self.columns().items() if self.fields is None or name in self.fields
+        }
+        joins = self.joins | {self.field_joins[name] for name in columns if name in self.field_joins}
+
+        query = select(*columns.values()).select_from(self._alias)
+        for relationship, totals in child_totals.items():
+            if relationship in joins:
+                query = query.outerjoin(totals, totals.c.product_id == self._alias.id)
+        return query
+
+
+class ProductCatalogSelectStrategy(ProductListSelectStrategy):
+    """
+    ProductListSelectStrategy extended by the raw values the list filters and orderings work on:
+
+    SELECT
+        ...,
+        p.is_active,
+        p.category_active,
+        p.created_at,
+        inv.discount_total,
+        rv.rating_sum / nullif(rv.reviews_count, 0) AS rating
+    ...
+    """
+
+    def __init__(self, alias, fields: Iterable[str] = None, joins: Iterable[str] = ()):
+        super().__init__(alias, fields, joins={*joins, *child_totals})
+
+    def select(self) -> Select[Product]:
+        return super().select().add_columns(
+            self._alias.is_active,
+            self._alias.category_active,
+            self._alias.created_at,
+            inventory_totals.c.discount_total,
+            average_rating.label("rating")
         )
 
 
@@ -61,27 +131,82 @@ class ProductDetailSelectStrategy(SelectStrategy):
         p.category_id,
         p.made_in,
         p.description,
-        coalesce(array_agg(distinct(product_image.image)), '{}') AS images,
         coalesce(
-            array_agg(
-                distinct(
+            (SELECT array_agg(product_image.image ORDER BY product_image.position, product_image.id) FROM product_image
+             WHERE product_image.product_id = p.id), '{}'
+        ) AS images,
+        coalesce(
+            (
+                SELECT jsonb_agg(
                     jsonb_build_object(
                         'id', product_inventory.id,
                         'meta', product_inventory.meta,
                         'availability', CASE WHEN product_inventory.quantity > 0 THEN true ELSE false END,
                         'unit_price', product_inventory.unit_price,
                         'discount', product_inventory.discount
-                    )
+                    ) ORDER BY product_inventory.id
                 )
-            ), '{}'
+                FROM product_inventory
+                WHERE product_inventory.product_id = p.id
+            ), '[]'
         ) AS inventories
     FROM product AS p
-    LEFT OUTER JOIN product_image ON p.id = product_image.product_id
-    LEFT OUTER JOIN product_inventory ON p.id = product_inventory.product_id
-    LEFT OUTER JOIN category ON p.category_id = category.id
-    GROUP BY
-        p.id
     LIMIT 1;
+
+    Every child collection is aggregated in its own subquery, so the row count never becomes images x variants
+    and nothing has to be deduplicated afterwards. With `fields` only those columns (and id) are selected.
+    """
+
+    def __init__(self, alias, fields: Iterable[str] = None):
+        super().__init__(alias)
+        self.fields = None if fields is None else {"id", *fields}
+
+    def columns(self) -> dict[str, ColumnElement]:
+        return {
+            "id": self._alias.id,
+            "name": self._alias.name,
+            "category_id": self._alias.category_id,
+            "made_in": self._alias.made_in,
+            "description": self._alias.description,
+            "images": func.coalesce(self._images(), []).label('images'),
+            "inventories": func.coalesce(self._inventories(), func.cast('[]', JSONB)).label('inventories'),
+        }
+
+    def select(self) -> Select[Product]:
+        columns = [column for name, column in self.columns().items() if self.fields is None or name in self.fields]
+        return select(*columns).select_from(self._alias)
+
+    def _images(self):
+        return (
+            select(func.array_agg(aggregate_order_by(ProductImage.image, ProductImage.position, ProductImage.id)))
+            .where(ProductImage.product_id == self._alias.id)
+            .scalar_subquery()
+        )
+
+    def _inventories(self):
+        variant = func.jsonb_build_object(
+            'id', ProductInventory.id,
+            'meta', ProductInventory.meta,
+            'availability', sql_case((ProductInventory.quantity > 0, True), else_=False),
+            'unit_price', ProductInventory.unit_price,
+            'discount', ProductInventory.discount
+        )
+        return (
+            select(func.jsonb_agg(aggregate_order_by(variant, ProductInventory.id), type_=JSONB))
+            .where(ProductInventory.product_id == self._alias.id)
+            .scalar_subquery()
+        )
+
+
+class ProductSuggestSelectStrategy(SelectStrategy):
+    """
+    SELECT
+        p.id,
+        p.name,
+        coalesce(rv.reviews_count, 0) AS weight,
+        p.created_at
+    FROM product AS p
+    LEFT OUTER JOIN product_rating AS rv ON rv.product_id = p.id;
     """
 
     def select(self) -> Select[Product]:
@@ -89,28 +214,11 @@ class ProductDetailSelectStrategy(SelectStrategy):
             select(
                 self._alias.id,
                 self._alias.name,
-                self._alias.category_id,
-                self._alias.made_in,
-                self._alias.description,
-                func.coalesce(func.array_agg(func.distinct(ProductImage.image)), []).label('images'),
-                func.coalesce(
-                    func.array_agg(
-                        func.distinct(
-                            func.jsonb_build_object(
-                                'id', ProductInventory.id,
-                                'meta', ProductInventory.meta,
-                                'availability', sql_case((ProductInventory.quantity > 0, True), else_=False),
-                                'unit_price', ProductInventory.unit_price,
-                                'discount', ProductInventory.discount
-                            )
-                        )
-                    ), []
-                ).label('inventories')
+                func.coalesce(review_totals.c.reviews_count, 0).label("weight"),
+                self._alias.created_at
             )
             .select_from(self._alias)
-            .outerjoin(self._alias.images)
-            .outerjoin(self._alias.inventories)
-            .group_by(self._alias.id)
+            .outerjoin(review_totals, review_totals.c.product_id == self._alias.id)
         )
 
 
@@ -120,6 +228,12 @@ class ProductActivityFilteringStrategy(FilteringStrategy):
         return self.query.where(self._alias.is_active.is_(activity))
 
 
+class ProductCategoryActiveFilteringStrategy(FilteringStrategy):
+    def filter(self, category_active: bool):
+        assert isinstance(category_active, bool)
+        return self.query.where(self._alias.category_active.is_(category_active))
+
+
 class ProductCategoryFilteringStrategy(FilteringStrategy):
     def filter(self, category_id: UUID | str):
         assert isinstance(category_id, UUID) or isinstance(category_id, str)
@@ -133,45 +247,105 @@ class ProductCategoryFilteringStrategy(FilteringStrategy):
         )
 
 
+class ProductSearchFilteringStrategy(FilteringStrategy):
+    """
+    full text search over product.search_document (name, tags, category path and description), with the
+    syntax of web search boxes: "red sneakers", "sneakers -kids", "sneakers or boots":
+
+    WHERE p.search_document @@ websearch_to_tsquery('english', 'red sneakers')
+    """
+
+    def filter(self, term: str):
+        assert isinstance(term, str)
+        query = func.websearch_to_tsquery(literal(SEARCH_TEXT_CONFIG, REGCONFIG), term)
+        return self.query.where(self._alias.search_document.op("@@")(query))
+
+
+class ProductArrivedBeforeFilteringStrategy(FilteringStrategy):
+    """
+    keyset pagination of the newest-first listing (ordering "-new", "-id"): the products listed after the one
+    with the given id, the last of the previous page. A row comparison the ix_product_new_arrivals index can
+    start from, so a page reads only its own rows however deep it is:
+
+    WHERE (p.created_at, p.id) < (
+        (SELECT previous.created_at FROM product AS previous WHERE previous.id = :arrived_before), :arrived_before
+    )
+    """
+
+    def filter(self, product_id: UUID | str):
+        assert isinstance(product_id, UUID) or isinstance(product_id, str)
+        if isinstance(product_id, str):
+            product_id = UUID(product_id)
+
+        previous = aliased(Product, name="previous")
+        previous_id = bindparam("arrived_before", product_id, type_=previous.id.type)
+        created_at = select(previous.created_at).where(previous.id == previous_id).scalar_subquery()
+        return self.query.where(tuple_(self._alias.created_at, self._alias.id) < tuple_(created_at, previous_id))
+
+
+class ProductAttributesFilteringStrategy(FilteringStrategy):
+    """
+    products with at least one variant carrying all the given attributes, e.g. {"color": "Blue", "size": "M"}:
+
+    WHERE EXISTS (
+        SELECT variant.id FROM product_inventory AS variant
+        WHERE variant.product_id = p.id AND variant.meta @> '{"color": "Blue", "size": "M"}'
+    )
+    """
+
+    def filter(self, attributes: dict[str, str]):
+        assert isinstance(attributes, dict)
+        if not attributes:
+            return self.query
+
+        variant = aliased(ProductInventory, name="variant")
+        return self.query.where(
+            select(variant.id).where(variant.product_id == self._alias.id, variant.meta.contains(attributes)).exists()
+        )
+
+
 class ProductPopularFilteringStrategy(FilteringStrategy):
-    """this filter assumes a left outer join to Product.reviews in the query"""
+    """this filter assumes a left outer join to review_totals (product_rating) in the query"""
+    required_joins = ("reviews",)
 
     def filter(self, min_avg_rating: float):
         assert isinstance(min_avg_rating, float)
-        avg_rating = func.avg(ProductReview.rating)
-        return self.query.having(avg_rating >= min_avg_rating)
+        return self.query.where(average_rating >= min_avg_rating)
 
 
 class ProductPopularOrderingStrategy(SortStrategy):
-    """this filter assumes a left outer join to Product.reviews in the query"""
+    """this filter assumes a left outer join to review_totals (product_rating) in the query"""
+    required_joins = ("reviews",)
 
     def sort(self, sort_type: Literal["asc", "desc"]):
         assert isinstance(sort_type, str) and sort_type in ("asc", "desc")
-        avg_rating = func.avg(ProductReview.rating)
-        return self.query.order_by(self._get_sort_method(avg_rating, sort_type)())
+        return self.query.order_by(self._get_sort_method(average_rating, sort_type)())
 
 
 class ProductDiscountFilteringStrategy(FilteringStrategy):
-    """this filter assumes a left outer join to Product.inventories in the query"""
+    """this filter assumes a left outer join to inventory_totals in the query"""
+    required_joins = ("inventories",)
 
     def filter(self, min_discount: float):
         assert isinstance(min_discount, float)
         if min_discount == 0:
             return self.query
-        return self.query.having(func.sum(ProductInventory.discount) > min_discount)
+        return self.query.where(inventory_totals.c.discount_total > min_discount)
 
 
 class ProductDiscountOrderingStrategy(SortStrategy):
-    """this filter assumes a left outer join to Product.inventories in the query"""
+    """this filter assumes a left outer join to inventory_totals in the query"""
+    required_joins = ("inventories",)
 
     def sort(self, sort_type: Literal["asc", "desc"]):
         assert isinstance(sort_type, str) and sort_type in ("asc", "desc")
-        return self.query.order_by(self._get_sort_method(func.sum(ProductInventory.discount), sort_type)())
+        return self.query.order_by(self._get_sort_method(inventory_totals.c.discount_total, sort_type)())
 
 
 class ProductPriceOrderingStrategy(SortStrategy):
-    """this filter assumes a left outer join to Product.inventories in the query"""
+    """this filter assumes a left outer join to inventory_totals in the query"""
+    required_joins = ("inventories",)
 
     def sort(self, sort_type: Literal["asc", "desc"]):
         assert isinstance(sort_type, str) and sort_type in ("asc", "desc")
-        return self.query.order_by(self._get_sort_method(func.max(ProductInventory.unit_price), sort_type)())
+        return self.query.order_by(self._get_sort_method(inventory_totals.c.price, sort_type)())
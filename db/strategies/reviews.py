@@ -3,7 +3,7 @@ from typing import Literal
 from sqlalchemy import select
 from sqlalchemy.sql.selectable import Select
 
-from db.models import ProductReview, Customer
+from db.models import ProductReview
 from .base import SelectStrategy, FilteringStrategy, SortStrategy
 
 
@@ -11,24 +11,24 @@ class ReviewListSelectStrategy(SelectStrategy):
     """
     SELECT
         pr.id,
-        u.fullname as fullname,
+        pr.author_name as fullname,
         pr.rating,
         pr.comment,
         pr.created_at
-    FROM product_review AS pr
-    JOIN customer as u;
+    FROM product_review AS pr;
+
+    author_name is the customer's fullname copied by a trigger, so no review row needs a customer lookup.
     """
     def select(self) -> Select[ProductReview]:
         return (
             select(
                 self._alias.id,
-                Customer.fullname.label("fullname"),
+                self._alias.author_name.label("fullname"),
                 self._alias.rating,
                 self._alias.comment,
                 self._alias.created_at
             )
             .select_from(self._alias)
-            .join(self._alias.customer)
         )
 
 
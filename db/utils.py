@@ -1,3 +1,28 @@
+import json
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+
 def get_first_value_from_rows(rows):
     return list(map(lambda row: row[0], rows))
 
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) %s" % compiler.process(element.statement, **kw)
+
+
+async def explain(async_db: AsyncSession, statement) -> dict:
+    """the planner's top plan node of `statement`, with its "Total Cost" and "Plan Rows" estimates"""
+    plan = (await async_db.execute(Explain(statement))).scalar()
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    return plan[0]["Plan"]
@@ -1,15 +1,85 @@
+import hmac
+from contextlib import asynccontextmanager
+from typing import Literal
+
+from fastapi import Header, HTTPException, Request
+from pydantic import BaseModel
+
+import config
 from db.connections import db_session_manager
+from services import admission
 
 
-async def list_parameters(skip: int = 0, limit: int = 10, search: str = None, ordering: str = None):
+async def list_parameters(
+    skip: int = 0,
+    limit: int = 10,
+    search: str = None,
+    ordering: str = None,
+    total: Literal["auto", "exact", "estimated"] = None
+):
     if limit > 30:
         limit = 30
 
     if not ordering:
         ordering = ''
-    return {"skip": skip, "limit": limit, "search": search, "ordering": list(ordering.replace(' ', '').split(','))}
+    return {
+        "skip": skip,
+        "limit": limit,
+        "search": search,
+        "ordering": list(ordering.replace(' ', '').split(',')),
+        "total": total
+    }
+
+
+async def variant_attributes(request: Request):
+    """collects ?attr.<name>=<value> query parameters into {"<name>": "<value>"}, None when there are none"""
+    attributes = {
+        key.removeprefix("attr."): value
+        for key, value in request.query_params.items()
+        if key.startswith("attr.") and key != "attr."
+    }
+    return attributes or None
+
+
+def sparse_fields(schema: type[BaseModel]):
+    """?fields=id,name,price -> frozenset of the requested fields, None (the full response) when absent"""
+    async def fields_parameter(fields: str = None) -> frozenset[str] | None:
+        if not fields:
+            return None
+        requested = frozenset(field for field in fields.replace(' ', '').split(',') if field)
+        unknown = requested - schema.model_fields.keys()
+        if unknown:
+            raise HTTPException(status_code=400, detail={"fields": "unknown fields: %s" % ", ".join(sorted(unknown))})
+        return requested
+    return fields_parameter
 
 
 async def get_db():
     async with db_session_manager.session() as session:
         yield session
+
+
+@asynccontextmanager
+async def admitted(route_class: str):
+    try:
+        async with admission.limiters[route_class].admit():
+            yield
+    except admission.Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+def admission_control(route_class: str):
+    async def admit():
+        async with admitted(route_class):
+            yield
+    return admit
+
+
+async def ops_token(x_ops_token: str = Header(None)):
+    """
+    guards the operational endpoints: 404 unless the request carries OPS_TOKEN, compared in constant time so
+    response times tell nothing about the token
+    """
+    token = config.OPS_TOKEN
+    if token is None or x_ops_token is None or not hmac.compare_digest(x_ops_token.encode(), token.encode()):
+        raise HTTPException(status_code=404)
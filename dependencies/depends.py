@@ -3,7 +3,17 @@ from typing import Annotated
 from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from dependencies.core import list_parameters, get_db
+import schemas
+from dependencies.core import list_parameters, variant_attributes, sparse_fields, get_db, admission_control, ops_token
 
 PageDepends = Annotated[dict, Depends(list_parameters)]
+AttributesDepends = Annotated[dict | None, Depends(variant_attributes)]
 DBDepends = Annotated[AsyncSession, Depends(get_db)]
+ListFieldsDepends = Annotated[frozenset | None, Depends(sparse_fields(schemas.ShortProductSchema))]
+DetailFieldsDepends = Annotated[frozenset | None, Depends(sparse_fields(schemas.ProductDetailSchema))]
+
+CategoriesAdmission = Depends(admission_control("categories"))
+DetailAdmission = Depends(admission_control("detail"))
+ReviewsAdmission = Depends(admission_control("reviews"))
+
+OpsAccess = Depends(ops_token)
@@ -0,0 +1,53 @@
+"""
+Bulk loads reviews from a JSON lines file (one ReviewIngestSchema object per line) in batches.
+
+    python ingest_reviews.py reviews.jsonl [batch_size]
+"""
+import json
+import sys
+
+from pydantic import ValidationError
+
+from config import REVIEW_BATCH_MAX_SIZE
+from crud.review import ingest_reviews
+from db.connections import db_session_manager
+from schemas import ReviewIngestSchema
+
+
+async def ingest_file(path: str, batch_size: int = REVIEW_BATCH_MAX_SIZE):
+    inserted = invalid = rejected = 0
+
+    async def flush(batch):
+        nonlocal inserted, rejected
+        async with db_session_manager.session() as session:
+            result = await ingest_reviews(session, batch)
+        inserted += result["inserted"]
+        rejected += len(result["rejected"])
+        for rejection in result["rejected"]:
+            print("rejected: %s" % rejection["error"], file=sys.stderr)
+
+    batch = []
+    with open(path) as reviews_file:
+        for line_number, line in enumerate(reviews_file, start=1):
+            if not line.strip():
+                continue
+            try:
+                batch.append(ReviewIngestSchema.model_validate(json.loads(line)))
+            except (ValueError, ValidationError) as exc:
+                invalid += 1
+                print("line %s: %s" % (line_number, exc), file=sys.stderr)
+                continue
+            if len(batch) >= batch_size:
+                await flush(batch)
+                batch = []
+    if batch:
+        await flush(batch)
+
+    await db_session_manager.close()
+    print("inserted %s, rejected %s, invalid %s" % (inserted, rejected, invalid))
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    asyncio.run(ingest_file(sys.argv[1], *map(int, sys.argv[2:])))
@@ -1,16 +1,81 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
+from pathlib import Path
+
 from fastapi import FastAPI
 
-from routers import categories, products
+from config import CATALOG_ENGINE_ENABLED, CATALOG_SNAPSHOT_PATH, MEDIA_DIR, MEDIA_URL
+from db.connections import db_session_manager
+from routers import categories, health, inventory, media as media_router, products, reviews
+from services import media, profiling, reservations, suggest
+from services.lifecycle import lifecycle, warm_up, InFlightMiddleware
+from services.statement_metrics import statement_metrics
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # the engine is created here rather than on import, so importing the app never touches the database driver
+    db_session_manager.open()
+    statement_metrics.install(db_session_manager.engine)
+    if profiling.enabled():
+        profiling.install(db_session_manager.engine)
+    MEDIA_DIR.mkdir(parents=True, exist_ok=True)
+    await suggest.load_suggest_index(db_session_manager)
+    background_tasks = [
+        asyncio.create_task(suggest.run_suggest_refresher(db_session_manager)),
+        asyncio.create_task(reservations.run_reservation_sweeper(db_session_manager)),
+    ]
+
+    # numpy is only imported by workers that run the catalog engine
+    if CATALOG_ENGINE_ENABLED and CATALOG_SNAPSHOT_PATH:
+        from services import snapshot
+
+        # every worker maps the same snapshot file instead of holding its own copy of the columns
+        snapshot_path = Path(CATALOG_SNAPSHOT_PATH)
+        inode = await snapshot.attach_catalog_snapshot(db_session_manager, snapshot_path)
+        background_tasks.append(
+            asyncio.create_task(snapshot.run_snapshot_watcher(db_session_manager, snapshot_path, inode))
+        )
+    elif CATALOG_ENGINE_ENABLED:
+        from services import catalog
 
-app = FastAPI()
+        await catalog.load_catalog_engine(db_session_manager)
+        background_tasks.append(asyncio.create_task(catalog.run_catalog_refresher(db_session_manager)))
+
+    warmup_seconds = await warm_up(db_session_manager)
+    logger.info("pool warmed up in %.2fs", warmup_seconds)
+    lifecycle.ready = True
+
+    yield
+
+    # uvicorn stops accepting connections first; whatever is still running finishes before the engine goes away
+    await lifecycle.drain()
+    for task in background_tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    media.shutdown_media_pool()
+    await db_session_manager.close()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(InFlightMiddleware, lifecycle=lifecycle)
+app.add_middleware(profiling.ProfilingMiddleware)
 # add internal routers here
+app.include_router(reviews.router)
+app.include_router(inventory.router)
+app.include_router(media_router.router)
+app.include_router(health.router)
 
 # add external routers here
 app.include_router(categories.router)
 app.include_router(products.router)
+app.mount(MEDIA_URL, media.ImmutableStaticFiles(directory=MEDIA_DIR, check_dir=False), name="media")
 
 
 @app.get("/")
 async def root():
     return {"message": "Hello Bigger Applications!"}
-
@@ -3,41 +3,47 @@ from fastapi import APIRouter
 import schemas
 from crud import category as crud
 from dependencies import depends
+from services.profiling import ProfiledRoute
 
-router = APIRouter(prefix="/categories", tags=["categories"])
+router = APIRouter(
+    prefix="/categories", tags=["categories"], dependencies=[depends.CategoriesAdmission], route_class=ProfiledRoute
+)
 
 
 @router.get("", response_model=list[schemas.CategorySchema])
-async def base_categories(db: depends.DBDepends):
+async def base_categories(db: depends.DBDepends, with_counts: bool = False):
     return await crud.category_list(
         async_db=db,
         filters={
-            "deactivated": False,
+            "effectively_active": True,
             "hierarchy": {"category_id": None, "descendants": False},
             "level": 1
-        }
+        },
+        with_counts=with_counts
     )
 
 
 @router.get("/{category_id}/children/", response_model=list[schemas.CategorySchema])
-async def category_children(category_id: str, db: depends.DBDepends, level: int = None):
+async def category_children(category_id: str, db: depends.DBDepends, level: int = None, with_counts: bool = False):
     return await crud.category_list(
         async_db=db,
         filters={
-            "deactivated": False,
+            "effectively_active": True,
             "hierarchy": {"category_id": category_id, "descendants": True},
             "level": level,
-        }
+        },
+        with_counts=with_counts
     )
 
 
 @router.get("/{category_id}/parents/", response_model=list[schemas.CategorySchema])
-async def category_parents(category_id: str, db: depends.DBDepends, level: int = None):
+async def category_parents(category_id: str, db: depends.DBDepends, level: int = None, with_counts: bool = False):
     return await crud.category_list(
         async_db=db,
         filters={
-            "deactivated": False,
+            "effectively_active": True,
             "hierarchy": {"category_id": category_id, "descendants": False},
             "level": level
-        }
+        },
+        with_counts=with_counts
     )
@@ -0,0 +1,52 @@
+from fastapi import APIRouter, Query
+from fastapi.responses import JSONResponse
+
+from config import STATEMENT_METRICS_MAX_LIMIT
+from db.connections import db_session_manager
+from dependencies import depends
+from services.lifecycle import lifecycle, pool_status
+from services.statement_metrics import statement_metrics, planning_stats
+
+router = APIRouter(tags=["health"])
+
+
+@router.get("/healthz")
+async def healthz():
+    """liveness: the process serves requests, whatever state its pool is in"""
+    return {"status": "ok"}
+
+
+@router.get("/readyz")
+async def readyz():
+    """readiness: the pool is warm and the worker is not draining, 503 otherwise"""
+    ready = lifecycle.ready and not lifecycle.draining
+    content = {
+        "status": "ready" if ready else ("draining" if lifecycle.draining else "starting"),
+        "in_flight": lifecycle.in_flight,
+        "pool": pool_status(db_session_manager) if ready else None,
+    }
+    return JSONResponse(content, status_code=200 if ready else 503)
+
+
+@router.post("/drain", status_code=202, dependencies=[depends.OpsAccess])
+async def drain():
+    """
+    Stops reporting ready but keeps serving, for a pre-stop hook to call before the worker gets its SIGTERM;
+    shutdown then waits for the requests still in flight. POST /undrain takes it back.
+    """
+    lifecycle.start_draining()
+    return {"status": "draining", "in_flight": lifecycle.in_flight}
+
+
+@router.post("/undrain", dependencies=[depends.OpsAccess])
+async def undrain():
+    """reports ready again after a /drain, 409 once the worker is shutting down"""
+    if not lifecycle.stop_draining():
+        return JSONResponse({"status": "stopping"}, status_code=409)
+    return {"status": "ready" if lifecycle.ready else "starting", "in_flight": lifecycle.in_flight}
+
+
+@router.get("/metrics/statements", dependencies=[depends.OpsAccess])
+async def statements_metrics(limit: int = Query(20, ge=1, le=STATEMENT_METRICS_MAX_LIMIT)):
+    """compiled and prepared statement cache hits of this worker, planning times of the whole server"""
+    return {**statement_metrics.snapshot(), "planning": await planning_stats(db_session_manager, limit)}
@@ -0,0 +1,36 @@
+from uuid import UUID
+
+from fastapi import APIRouter, HTTPException
+
+import schemas
+from crud import inventory as crud
+from dependencies import depends
+
+router = APIRouter(prefix="/inventory", tags=["inventory"])
+
+
+@router.post("/reservations", response_model=schemas.ReservationSchema, status_code=201)
+async def reserve(request: schemas.ReservationRequestSchema, db: depends.DBDepends):
+    items = {}
+    for item in request.items:
+        items[item.inventory_id] = items.get(item.inventory_id, 0) + item.quantity
+    try:
+        return await crud.reserve_inventory(async_db=db, items=items)
+    except crud.InsufficientStock as e:
+        raise HTTPException(status_code=409, detail={"unavailable": [str(_id) for _id in e.inventory_ids]})
+
+
+@router.post("/reservations/{reservation_id}/commit", response_model=schemas.ReservationSchema)
+async def commit_reservation(reservation_id: UUID, db: depends.DBDepends):
+    try:
+        return await crud.commit_reservation(async_db=db, reservation_id=reservation_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.post("/reservations/{reservation_id}/release", response_model=schemas.ReservationSchema)
+async def release_reservation(reservation_id: UUID, db: depends.DBDepends):
+    try:
+        return await crud.release_reservation(async_db=db, reservation_id=reservation_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
@@ -0,0 +1,38 @@
+from uuid import UUID
+
+from fastapi import APIRouter, HTTPException, UploadFile
+
+import schemas
+from config import MEDIA_MAX_UPLOAD_BYTES
+from crud import media as crud
+from dependencies import depends
+
+router = APIRouter(prefix="/products", tags=["media"])
+
+
+@router.post(
+    "/{product_id}/images",
+    response_model=schemas.ProductImageSchema,
+    status_code=201,
+    dependencies=[depends.OpsAccess]
+)
+async def upload_product_image(product_id: UUID, file: UploadFile, db: depends.DBDepends):
+    content = await file.read(MEDIA_MAX_UPLOAD_BYTES + 1)
+    if len(content) > MEDIA_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="images are limited to %s bytes" % MEDIA_MAX_UPLOAD_BYTES)
+    try:
+        return await crud.add_product_image(async_db=db, product_id=product_id, content=content)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.put(
+    "/{product_id}/images/order",
+    response_model=list[schemas.ProductImageSchema],
+    dependencies=[depends.OpsAccess]
+)
+async def reorder_product_images(product_id: UUID, order: schemas.ProductImageOrderSchema, db: depends.DBDepends):
+    try:
+        return await crud.reorder_product_images(async_db=db, product_id=product_id, image_ids=order.image_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,22 +1,48 @@
-from fastapi import APIRouter, HTTPException
+from datetime import timedelta
+from uuid import UUID
+
+from fastapi import APIRouter, HTTPException, Query, Response
 
 import schemas
+from config import SUGGEST_MAX_RESULTS
 from crud import product as crud
 from dependencies import depends
+from dependencies.core import admitted
+from services.admission import products_list_classifier
+from services.profiling import ProfiledRoute
+from services.suggest import suggest_index
+
+router = APIRouter(prefix="/products", tags=["products"], route_class=ProfiledRoute)
+
 
-router = APIRouter(prefix="/products", tags=["products"])
+def page_headers(page: dict) -> dict[str, str]:
+    """pagination metadata travels in headers, so the list bodies keep their shape"""
+    headers = {"X-Has-More": "true" if page["has_more"] else "false"}
+    if page["total"] is not None:
+        headers["X-Total-Count"] = str(page["total"])
+        headers["X-Total-Count-Estimated"] = "true" if page["total_estimated"] else "false"
+    return headers
 
 
 @router.get("", response_model=list[schemas.ShortProductSchema])
 async def products_list(
+    response: Response,
     db: depends.DBDepends,
     params: depends.PageDepends,
+    attributes: depends.AttributesDepends,
+    fields: depends.ListFieldsDepends,
     category_id: str = None,
     ordering: str = 'id',
     min_avg_rating: float = None,
-    min_discount: float = None
+    min_discount: float = None,
+    new_within_days: int = None,
+    arrived_before: str = None
 ):
     errors = {}
+    ordering = list(ordering.replace(' ', '').split(','))
+    # newest first is ambiguous between products created at the same time, the id settles it for the keyset
+    if ordering == ["-new"]:
+        ordering.append("-id")
 
     if isinstance(min_avg_rating, float) and min_avg_rating > 5.0:
         errors["min_avg_rating"] = "max available is 5"
@@ -24,6 +50,17 @@ async def products_list(
     if isinstance(min_discount, float) and min_discount < 0:
         errors["min_discount"] = "min_discount must be positive"
 
+    if isinstance(new_within_days, int) and new_within_days < 1:
+        errors["new_within_days"] = "new_within_days must be at least 1"
+
+    if arrived_before is not None and ordering != ["-new", "-id"]:
+        errors["arrived_before"] = "arrived_before pages the ordering=-new listing only"
+    elif arrived_before is not None:
+        try:
+            UUID(arrived_before)
+        except ValueError:
+            errors["arrived_before"] = "arrived_before must be a product id"
+
     if errors:
         raise HTTPException(
             status_code=400,
@@ -31,22 +68,52 @@ async def products_list(
         )
 
     limit, skip, search = params["limit"], params["skip"], params["search"]
-    return await crud.products_list(
-        async_db=db,
-        limit=limit,
-        offset=skip,
-        filters={"activity": True, "category": category_id,  "search": search,
-                 "popular": min_avg_rating, "discount": min_discount},
-        ordering=list(ordering.replace(' ', '').split(','))
-    )
+    filters = {"activity": True, "category_active": True, "category": category_id, "search": search,
+               "attributes": attributes, "popular": min_avg_rating, "discount": min_discount,
+               "created_within": None if new_within_days is None else timedelta(days=new_within_days),
+               "arrived_before": arrived_before}
 
+    async with admitted(await products_list_classifier.classify(db, filters, ordering)):
+        page = await crud.products_list(
+            async_db=db, limit=limit, offset=skip, filters=filters, ordering=ordering, fields=fields,
+            total=params["total"]
+        )
+    if fields is None:
+        response.headers.update(page_headers(page))
+        return page["rows"]
+    sparse = schemas.sparse_response(schemas.ShortProductSchema, fields, page["rows"], many=True)
+    sparse.headers.update(page_headers(page))
+    return sparse
+
+
+@router.get("/suggest", response_model=list[schemas.SuggestionSchema])
+async def products_suggest(q: str, limit: int = Query(SUGGEST_MAX_RESULTS, ge=1, le=SUGGEST_MAX_RESULTS)):
+    return suggest_index.search(q, limit)
 
-@router.get("/{product_id}/detail", response_model=schemas.ProductDetailSchema)
-async def product_detail(product_id: str, db: depends.DBDepends):
-    return await crud.product_detail(async_db=db, product_id=product_id, activity=True)
+
+@router.get(
+    "/{product_id}/detail",
+    response_model=schemas.ProductDetailSchema,
+    dependencies=[depends.DetailAdmission]
+)
+async def product_detail(product_id: str, db: depends.DBDepends, fields: depends.DetailFieldsDepends):
+    product = await crud.product_detail(
+        async_db=db, product_id=product_id, activity=True, category_active=True, fields=fields
+    )
+    if fields is None:
+        return product
+    return schemas.sparse_response(schemas.ProductDetailSchema, fields, product)
 
 
-@router.get("/{product_id}/reviews", response_model=list[schemas.ProductReviewSchema])
-async def product_reviews(product_id: str, db: depends.DBDepends, params: depends.PageDepends):
+@router.get(
+    "/{product_id}/reviews",
+    response_model=list[schemas.ProductReviewSchema],
+    dependencies=[depends.ReviewsAdmission]
+)
+async def product_reviews(product_id: str, response: Response, db: depends.DBDepends, params: depends.PageDepends):
     limit, skip, ordering = params["limit"], params["skip"], params["ordering"]
-    return await crud.get_product_reviews(db, product_id=product_id, limit=limit, offset=skip, ordering=ordering)
+    page = await crud.get_product_reviews(
+        db, product_id=product_id, limit=limit, offset=skip, ordering=ordering, total=params["total"]
+    )
+    response.headers.update(page_headers(page))
+    return page["rows"]
@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+
+import schemas
+from crud import review as crud
+from dependencies import depends
+
+router = APIRouter(prefix="/reviews", tags=["reviews"])
+
+
+@router.post("/batch", response_model=schemas.ReviewBatchResultSchema, dependencies=[depends.OpsAccess])
+async def ingest_reviews(batch: schemas.ReviewBatchSchema, db: depends.DBDepends):
+    return await crud.ingest_reviews(async_db=db, reviews=batch.reviews)
@@ -1,2 +1,6 @@
-from schemas.items import CategorySchema, ShortProductSchema, ProductDetailSchema, ProductReviewSchema
+from schemas.items import CategorySchema, ShortProductSchema, ProductDetailSchema, ProductReviewSchema, \
+    SuggestionSchema, ReviewIngestSchema, ReviewBatchSchema, ReviewBatchResultSchema, \
+    ReservationRequestSchema, ReservationSchema, ProductImageSchema, \
+    ProductImageOrderSchema
 
+from schemas.sparse import sparse_schema, sparse_response
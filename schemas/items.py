@@ -1,7 +1,15 @@
 from datetime import datetime
+from typing import Annotated, Literal
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import AfterValidator, BaseModel, Field
+
+from config import REVIEW_BATCH_MAX_SIZE
+from services.media import variant_url
+
+# uploaded images are served as the size variant that fits where they are shown
+ThumbnailURL = Annotated[str, AfterValidator(lambda image: variant_url(image, "thumbnail"))]
+DetailImageURL = Annotated[str, AfterValidator(lambda image: variant_url(image, "detail"))]
 
 
 class OrmSchema(BaseModel):
@@ -18,6 +26,8 @@ class BaseCategorySchema(OrmSchema):
 class CategorySchema(BaseCategorySchema):
     parent: UUID | None = None
     level: int | None = None
+    product_count: int | None = None
+    subtree_product_count: int | None = None
 
 
 class ProductSchema(OrmSchema):
@@ -27,13 +37,18 @@ class ProductSchema(OrmSchema):
 
 
 class ShortProductSchema(ProductSchema):
-    image: str = ""
+    image: ThumbnailURL = ""
     price: float = 0.0
     avg_rating: float = 0.0
     reviews_count: int = 0
     discount: float | None = None
 
 
+class SuggestionSchema(OrmSchema):
+    name: str
+    kind: Literal["product", "category"]
+
+
 class ProductInventorySchema(OrmSchema):
     availability: bool
     unit_price: float
@@ -43,12 +58,62 @@ class ProductInventorySchema(OrmSchema):
 
 class ProductDetailSchema(ProductSchema):
     description: str | None = None
-    images: list[str] = []
+    images: list[DetailImageURL] = []
     inventories: list[ProductInventorySchema] = []
 
 
+class ProductImageSchema(OrmSchema):
+    image: DetailImageURL
+    position: int
+
+
+class ProductImageOrderSchema(BaseModel):
+    # every image of the product, the first one becomes its primary image
+    image_ids: list[UUID] = Field(min_length=1)
+
+
 class ProductReviewSchema(OrmSchema):
     fullname: str
     rating: float = 0.0
     comment: str | None = None
     created_at: datetime = None
+
+
+class ReviewIngestSchema(BaseModel):
+    product_id: UUID
+    email: str = Field(max_length=50, pattern=r"^[^@\s]+@[^@\s]+$")
+    fullname: str = Field(min_length=1, max_length=100)
+    rating: float = Field(ge=0, le=5)
+    comment: str | None = None
+    created_at: datetime | None = None
+
+
+class ReviewBatchSchema(BaseModel):
+    reviews: list[ReviewIngestSchema] = Field(min_length=1, max_length=REVIEW_BATCH_MAX_SIZE)
+
+
+class ReviewRejectionSchema(BaseModel):
+    index: int
+    error: str
+
+
+class ReviewBatchResultSchema(BaseModel):
+    inserted: int = 0
+    customers: int = 0
+    rejected: list[ReviewRejectionSchema] = []
+
+
+class ReservationItemSchema(BaseModel):
+    inventory_id: UUID
+    quantity: int = Field(gt=0)
+
+
+class ReservationRequestSchema(BaseModel):
+    items: list[ReservationItemSchema] = Field(min_length=1)
+
+
+class ReservationSchema(BaseModel):
+    id: UUID
+    status: Literal["held", "committed", "released"]
+    expires_at: datetime
+    items: list[ReservationItemSchema]
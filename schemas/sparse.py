@@ -0,0 +1,32 @@
+from functools import lru_cache
+from typing import Any
+
+from fastapi import Response
+from pydantic import BaseModel, ConfigDict, TypeAdapter, create_model
+
+
+@lru_cache(maxsize=128)
+def sparse_schema(schema: type[BaseModel], fields: frozenset[str]) -> type[BaseModel]:
+    """`schema` reduced to `fields`, built once per schema and field set"""
+    return create_model(
+        "%sFields" % schema.__name__,
+        __config__=ConfigDict(from_attributes=True),
+        **{name: (field.annotation, field) for name, field in schema.model_fields.items() if name in fields}
+    )
+
+
+@lru_cache(maxsize=128)
+def _list_adapter(schema: type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(list[schema])
+
+
+def sparse_response(schema: type[BaseModel], fields: frozenset[str], content: Any, many: bool = False) -> Response:
+    """serializes rows with only the requested fields (and id), in place of the route's full response_model"""
+    partial = sparse_schema(schema, fields | {"id"})
+    if many:
+        # rows are validated into the partial schema first, the serializer only knows models, not result rows
+        adapter = _list_adapter(partial)
+        body = adapter.dump_json(adapter.validate_python(list(content), from_attributes=True))
+    else:
+        body = partial.model_validate(content).model_dump_json()
+    return Response(body, media_type="application/json")
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Literal
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import (
+    ADMISSION_LIMITS, ADMISSION_RETRY_AFTER, ADMISSION_EXPLAIN_COST_THRESHOLD, ADMISSION_COST_CACHE_SIZE,
+    MAX_PRODUCTS_PER_PAGE
+)
+from crud.product import products_list_query, enabled_catalog_engine, is_new_arrivals, list_ordering_strategies
+from db.utils import explain
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    def __init__(self, route_class: str, retry_after: int):
+        super().__init__("%s requests are over capacity" % route_class)
+        self.route_class = route_class
+        self.retry_after = retry_after
+
+
+class AdmissionLimiter:
+    """caps concurrent requests of one route class; a request that can't get a slot within queue_timeout is shed"""
+
+    def __init__(self, route_class: str, max_concurrency: int, queue_timeout: float, retry_after: int):
+        self.route_class = route_class
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @asynccontextmanager
+    async def admit(self):
+        # a timeout scope around the acquire, wait_for can lose a permit when the timeout races the wakeup
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await self._semaphore.acquire()
+        except TimeoutError:
+            self.rejected += 1
+            raise Overloaded(self.route_class, self.retry_after)
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+
+limiters = {
+    route_class: AdmissionLimiter(route_class, max_concurrency, queue_timeout, ADMISSION_RETRY_AFTER)
+    for route_class, (max_concurrency, queue_timeout) in ADMISSION_LIMITS.items()
+}
+
+
+class ProductsListClassifier:
+    """
+    Sorts `products_list` requests into "list" and "expensive_list". Aggregate filters and orderings force
+    the whole grouped catalog to be computed before the limit applies, so by default they are expensive;
+    with a cost threshold each filter/ordering shape is EXPLAINed once and classified by the planner cost;
+    the costs of the `cache_size` most recently used shapes are kept.
+    """
+
+    # search isn't among them since it is answered by the GIN index on product.search_document
+    expensive_filters = frozenset({"popular", "discount"})
+    expensive_orderings = frozenset({"popular", "discount", "price"})
+
+    def __init__(self, cost_threshold: float = None, cache_size: int = ADMISSION_COST_CACHE_SIZE):
+        self.cost_threshold = cost_threshold
+        self.cache_size = cache_size
+        self._costs: OrderedDict[tuple, float] = OrderedDict()
+
+    @staticmethod
+    def shape(filters: dict = None, ordering: list[str] = None) -> tuple:
+        """
+        the filter names and the ordering as QueryContext applies it: a field repeated later is dropped, so
+        "id,id,id" is the shape of "id"
+        """
+        applied, fields = set(), []
+        for field in ordering or []:
+            name = field.split("-")[-1]
+            if name not in applied:
+                applied.add(name)
+                fields.append(field)
+        return tuple(sorted(name for name, value in (filters or {}).items() if value is not None)), tuple(fields)
+
+    def is_expensive(self, filters: dict = None, ordering: list[str] = None) -> bool:
+        filter_names, ordering_fields = self.shape(filters, ordering)
+        return (
+            not self.expensive_filters.isdisjoint(filter_names)
+            or any(field.split("-")[-1] in self.expensive_orderings for field in ordering_fields)
+        )
+
+    async def classify(
+        self,
+        async_db: AsyncSession,
+        filters: dict = None,
+        ordering: list[str] = None
+    ) -> Literal["list", "expensive_list"]:
+        catalog_engine = enabled_catalog_engine()
+        if catalog_engine is not None and catalog_engine.supports(filters, ordering):
+            return "list"
+
+        if self.cost_threshold is None:
+            return "expensive_list" if self.is_expensive(filters, ordering) else "list"
+
+        shape = self.shape(filters, ordering)
+        if any(field.split("-")[-1] not in list_ordering_strategies for field in shape[1]):
+            # rejected by the endpoint anyway, not worth an EXPLAIN
+            return "expensive_list" if self.is_expensive(filters, ordering) else "list"
+        if shape in self._costs:
+            self._costs.move_to_end(shape)
+        else:
+            try:
+                # new arrivals pick their page by id first, as crud.product.products_list does
+                fields = () if is_new_arrivals(filters, ordering) else None
+                query = products_list_query(filters, ordering, fields).limit(MAX_PRODUCTS_PER_PAGE)
+                self._costs[shape] = (await explain(async_db, query))["Total Cost"]
+            except Exception:
+                logger.exception("could not estimate the cost of %s", shape)
+                return "expensive_list" if self.is_expensive(filters, ordering) else "list"
+            if len(self._costs) > self.cache_size:
+                self._costs.popitem(last=False)
+        return "expensive_list" if self._costs[shape] >= self.cost_threshold else "list"
+
+
+products_list_classifier = ProductsListClassifier(cost_threshold=ADMISSION_EXPLAIN_COST_THRESHOLD)
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+from typing import Any, Iterable
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from config import CATALOG_REFRESH_SECONDS, STREAM_BATCH_SIZE
+from db.models import Category, Product
+from db.strategies.context import QueryContext
+from db.strategies.products import ProductCatalogSelectStrategy
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogEngine:
+    """
+    Columnar copy of the values `products_list` filters and orders on. Filters become boolean masks and
+    orderings become sort keys, so an eligible request resolves to the ids of one page without touching
+    the database; NULL aggregates are kept as NaN and sorted the way Postgres sorts NULLs.
+    """
+
+    def __init__(self):
+        self.columns: dict[str, np.ndarray] | None = None
+        self._category_labels: list[list[str]] = []
+        self._category_codes: dict[str, np.ndarray] = {}
+        self._filters = {
+            "activity": self._activity_mask,
+            "category_active": self._category_active_mask,
+            "category": self._category_mask,
+            "popular": self._popular_mask,
+            "discount": self._discount_mask,
+        }
+        self._orderings = {
+            "id": "id_rank",
+            "popular": "rating",
+            "new": "created_at",
+            "discount": "discount_total",
+            "price": "price",
+        }
+
+    @property
+    def ready(self) -> bool:
+        return self.columns is not None
+
+    def load(self, rows: Iterable[Any], categories: Iterable[tuple[UUID, Any]]) -> None:
+        self.attach(*self.build_columns(rows, categories))
+
+    def attach(self, columns: dict[str, np.ndarray], category_hierarchies: list[str]) -> None:
+        """swaps the served columns in one assignment, so a running search keeps the arrays it started with"""
+        category_labels = [hierarchy.split(".") for hierarchy in category_hierarchies]
+        self.columns, self._category_labels, self._category_codes = columns, category_labels, {}
+
+    @classmethod
+    def build_columns(
+        cls,
+        rows: Iterable[Any],
+        categories: Iterable[tuple[UUID, Any]]
+    ) -> tuple[dict[str, np.ndarray], list[str]]:
+        category_index, category_hierarchies = {}, []
+        for code, (category_id, hierarchy) in enumerate(categories):
+            category_index[category_id] = code
+            category_hierarchies.append(str(hierarchy))
+
+        rows = list(rows)
+        id_rank = np.empty(len(rows), dtype=np.float64)
+        id_rank[sorted(range(len(rows)), key=lambda i: rows[i].id)] = np.arange(len(rows))
+        columns = {
+            "ids": np.frombuffer(b"".join(row.id.bytes for row in rows), dtype=np.uint8).reshape(-1, 16),
+            "id_rank": id_rank,
+            "category": np.array([category_index.get(row.category_id, -1) for row in rows], dtype=np.int32),
+            "is_active": np.array([row.is_active for row in rows], dtype=bool),
+            "category_active": np.array([row.category_active for row in rows], dtype=bool),
+            "price": cls._nullable([row.price for row in rows]),
+            "discount_total": cls._nullable([row.discount_total for row in rows]),
+            "rating": cls._nullable([row.rating for row in rows]),
+            "created_at": cls._nullable([row.created_at and row.created_at.timestamp() for row in rows]),
+        }
+        return columns, category_hierarchies
+
+    def supports(self, filters: dict[str, Any] = None, ordering: list[str] = None) -> bool:
+        return (
+            self.ready
+            and all(name in self._filters for name, value in (filters or {}).items() if value is not None)
+            and all(field.split("-")[-1] in self._orderings for field in ordering or [])
+        )
+
+    def search(self, limit: int, offset: int = 0, filters: dict[str, Any] = None, ordering: list[str] = None):
+        columns = self.columns
+        mask = np.ones(len(columns["ids"]), dtype=bool)
+        for name, value in (filters or {}).items():
+            if value is None:
+                continue
+            filter_mask = self._filters[name](value)
+            if filter_mask is not None:
+                mask &= filter_mask
+        candidates = np.flatnonzero(mask)
+
+        # sort keys from most to least significant; id_rank last keeps equal rows in a stable order
+        keys = []
+        for field in ordering or []:
+            descending = field.startswith("-")
+            key = columns[self._orderings[field.split("-")[-1]]][candidates]
+            key = np.nan_to_num(-key if descending else key, nan=-np.inf if descending else np.inf)
+            keys.append(key)
+        keys.append(columns["id_rank"][candidates])
+
+        end = offset + limit
+        if end < len(candidates):
+            primary = keys[0]
+            threshold = np.partition(primary, end - 1)[end - 1]
+            keep = primary <= threshold
+            candidates, keys = candidates[keep], [key[keep] for key in keys]
+
+        page = candidates[np.lexsort(keys[::-1])][offset:end]
+        return [UUID(bytes=product_id.tobytes()) for product_id in columns["ids"][page]]
+
+    @staticmethod
+    def _nullable(values: list) -> np.ndarray:
+        return np.array([np.nan if value is None else float(value) for value in values], dtype=np.float64)
+
+    def _activity_mask(self, activity: bool) -> np.ndarray:
+        assert isinstance(activity, bool)
+        return self.columns["is_active"] == activity
+
+    def _category_active_mask(self, category_active: bool) -> np.ndarray:
+        assert isinstance(category_active, bool)
+        return self.columns["category_active"] == category_active
+
+    def _category_mask(self, category_id: UUID | str) -> np.ndarray:
+        assert isinstance(category_id, UUID) or isinstance(category_id, str)
+        category_hex = (UUID(category_id) if isinstance(category_id, str) else category_id).hex
+        if category_hex not in self._category_codes:
+            self._category_codes[category_hex] = np.array(
+                [code for code, labels in enumerate(self._category_labels) if category_hex in labels],
+                dtype=np.int32
+            )
+        return np.isin(self.columns["category"], self._category_codes[category_hex])
+
+    def _popular_mask(self, min_avg_rating: float) -> np.ndarray:
+        assert isinstance(min_avg_rating, float)
+        return self.columns["rating"] >= min_avg_rating
+
+    def _discount_mask(self, min_discount: float) -> np.ndarray | None:
+        assert isinstance(min_discount, float)
+        if min_discount == 0:
+            return
+        return self.columns["discount_total"] > min_discount
+
+
+catalog_engine = CatalogEngine()
+
+
+async def fetch_catalog(session_manager) -> tuple[list[Any], list[Any]]:
+    query = QueryContext(select_strategy=ProductCatalogSelectStrategy(alias=aliased(Product, name="p"))).query
+    async with session_manager.session() as session:
+        categories = (await session.execute(select(Category.id, Category.hierarchy))).all()
+        rows = [row async for row in await session.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))]
+    return rows, categories
+
+
+async def load_catalog_engine(session_manager, engine: CatalogEngine = catalog_engine) -> None:
+    engine.load(*await fetch_catalog(session_manager))
+
+
+async def run_catalog_refresher(session_manager, engine: CatalogEngine = catalog_engine) -> None:
+    while True:
+        await asyncio.sleep(CATALOG_REFRESH_SECONDS)
+        try:
+            await load_catalog_engine(session_manager, engine)
+        except Exception:
+            logger.exception("catalog engine refresh failed")
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import time
+from contextlib import suppress
+from uuid import uuid4
+
+from config import DB_WARMUP_CONNECTIONS, DRAIN_TIMEOUT_SECONDS
+from crud import category as category_crud, product as product_crud
+
+logger = logging.getLogger(__name__)
+
+
+class Lifecycle:
+    """
+    Where this worker is in its life: not ready until the pool is warm, serving, then draining once shutdown
+    starts. Draining keeps serving the requests that are in flight but reports not ready, so the load balancer
+    stops sending new ones; the engine is only closed after the last of them finished or the timeout passed.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.draining = False
+        self.stopping = False
+        self.in_flight = 0
+        self._ready_after_drain = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def request_started(self) -> None:
+        self.in_flight += 1
+        self._idle.clear()
+
+    def request_finished(self) -> None:
+        self.in_flight -= 1
+        if self.in_flight == 0:
+            self._idle.set()
+
+    def start_draining(self) -> None:
+        self._ready_after_drain = self._ready_after_drain or self.ready
+        self.ready = False
+        self.draining = True
+
+    def stop_draining(self) -> bool:
+        """
+        undoes start_draining, e.g. for a pre-stop hook whose rollout was cancelled: the worker reports ready again
+        if it was before. False once shutdown started, a stopping worker stays drained.
+        """
+        if self.stopping:
+            return False
+        self.ready = self.ready or self._ready_after_drain
+        self._ready_after_drain = False
+        self.draining = False
+        return True
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT_SECONDS) -> bool:
+        """True when every in-flight request finished before the timeout"""
+        self.stopping = True
+        self.start_draining()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning("drain timed out with %s requests in flight", self.in_flight)
+            return False
+
+
+class InFlightMiddleware:
+    """counts HTTP requests until their response is completely sent, streamed bodies included"""
+
+    def __init__(self, app, lifecycle: Lifecycle):
+        self.app = app
+        self.lifecycle = lifecycle
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        self.lifecycle.request_started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.lifecycle.request_finished()
+
+
+async def _warm_connection(session_manager, barrier: asyncio.Barrier) -> None:
+    async with session_manager.session() as session:
+        # every task holds its connection until all of them have one, so the pool really opens that many
+        await session.connection()
+        await barrier.wait()
+
+        # the statements of the hot endpoints, so their compiled SQL is cached by the engine and prepared on
+        # every connection before the first real request needs them
+        await category_crud.category_list(
+            async_db=session,
+            filters={"effectively_active": True, "hierarchy": {"category_id": None, "descendants": False}, "level": 1}
+        )
+        await product_crud.products_list(
+            async_db=session, limit=10, filters={"activity": True, "category_active": True}, ordering=["id"]
+        )
+        with suppress(IndexError):
+            await product_crud.product_detail(
+                async_db=session, product_id=str(uuid4()), activity=True, category_active=True
+            )
+        await product_crud.get_product_reviews(session, product_id=str(uuid4()), limit=10)
+
+
+async def warm_up(session_manager, connections: int = DB_WARMUP_CONNECTIONS) -> float:
+    """opens `connections` pool connections and runs the warmup queries on each, returns the seconds it took"""
+    started_at = time.perf_counter()
+    if connections > 0:
+        barrier = asyncio.Barrier(connections)
+        await asyncio.gather(*(_warm_connection(session_manager, barrier) for _ in range(connections)))
+    return time.perf_counter() - started_at
+
+
+def pool_status(session_manager) -> dict:
+    pool = session_manager.engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
+
+
+lifecycle = Lifecycle()
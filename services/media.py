@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from fastapi.staticfiles import StaticFiles
+
+from config import MEDIA_DIR, MEDIA_URL, MEDIA_VARIANTS, MEDIA_PROCESS_WORKERS, MEDIA_CACHE_MAX_AGE
+
+# ProductImage.image of an uploaded image; anything else in that column is a plain path served as it is
+KEY_PREFIX = "sha256:"
+VARIANT_SUFFIX = ".webp"
+
+
+def digest_of(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def media_key(digest: str) -> str:
+    return KEY_PREFIX + digest
+
+
+def _relative_path(digest: str, suffix: str = "") -> Path:
+    # two levels of fan-out keep directories small with millions of files
+    return Path(digest[:2], digest[2:4], digest + suffix)
+
+
+def original_path(digest: str, media_dir: Path = MEDIA_DIR) -> Path:
+    return media_dir / "originals" / _relative_path(digest)
+
+
+def variant_path(digest: str, variant: str, media_dir: Path = MEDIA_DIR) -> Path:
+    return media_dir / variant / _relative_path(digest, VARIANT_SUFFIX)
+
+
+def variant_url(image: str | None, variant: str) -> str | None:
+    """URL of one size variant of an uploaded image; plain image paths are returned unchanged"""
+    if not image or not image.startswith(KEY_PREFIX):
+        return image
+    assert variant in MEDIA_VARIANTS
+    return "%s/%s/%s" % (MEDIA_URL, variant, _relative_path(image[len(KEY_PREFIX):], VARIANT_SUFFIX).as_posix())
+
+
+def _write_atomically(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name("%s.%s.tmp" % (path.name, os.getpid()))
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def render_variants(content: bytes, digest: str, media_dir: Path = MEDIA_DIR) -> tuple[int, int, str]:
+    """
+    Runs in the media process pool: stores the original and every size variant under the content digest and
+    returns the original's width, height and content type. Raises ValueError when content is not an image.
+    """
+    # imported here, Pillow is only ever needed in the pool's worker processes
+    from PIL import Image, ImageOps
+
+    try:
+        image = Image.open(io.BytesIO(content))
+        image.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError("Not a supported image: %s" % e)
+
+    content_type = Image.MIME.get(image.format, "application/octet-stream")
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+
+    for variant, box in MEDIA_VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail(box, Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        resized.save(buffer, format="WEBP", quality=80, method=4)
+        _write_atomically(variant_path(digest, variant, media_dir), buffer.getvalue())
+
+    # the original goes last, so its existence means every variant is in place
+    _write_atomically(original_path(digest, media_dir), content)
+    return image.width, image.height, content_type
+
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def media_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=MEDIA_PROCESS_WORKERS)
+    return _pool
+
+
+def shutdown_media_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+async def process_image(content: bytes, digest: str) -> tuple[int, int, str]:
+    """decoding and resizing is CPU bound, so it runs in worker processes instead of blocking the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(media_pool(), render_variants, content, digest)
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """files are addressed by their content, a URL never changes what it serves, so clients may cache for good"""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=%s, immutable" % MEDIA_CACHE_MAX_AGE
+        return response
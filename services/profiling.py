@@ -0,0 +1,260 @@
+import asyncio
+import functools
+import hmac
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from pathlib import Path
+from uuid import uuid4
+
+from fastapi.datastructures import Default, DefaultPlaceholder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import PROFILING_TOKEN, PROFILING_SAMPLE_RATE, PROFILING_INTERVAL_SECONDS, PROFILING_DIR
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+
+
+class RequestProfile:
+    """
+    Wall-clock time of one request by stage: build (QueryContext and strategies), compile (SQL), execute (the
+    database round trip), fetch (turning the results into rows), endpoint (the rest of the endpoint's own code),
+    validate (request parsing, dependencies and the response model), serialize (JSON encoding) and other.
+    Stages nest, but every moment is counted once, for the innermost stage open at the time: the compile and
+    execute time of the statements a fetch runs is not part of the fetch.
+    """
+
+    def __init__(self):
+        self.id = uuid4().hex
+        self.seconds = Counter()
+        self._stack = ["other"]
+        self._since = time.perf_counter()
+
+    def _switch(self) -> None:
+        now = time.perf_counter()
+        self.seconds[self._stack[-1]] += now - self._since
+        self._since = now
+
+    def enter(self, name: str) -> int:
+        """opens stage `name`, returns the depth to leave it at"""
+        self._switch()
+        self._stack.append(name)
+        return len(self._stack) - 1
+
+    def leave(self, depth: int) -> None:
+        """closes the stage opened at `depth` and whatever an error left open inside it"""
+        self._switch()
+        del self._stack[max(depth, 1):]
+
+    @contextmanager
+    def stage(self, name: str):
+        depth = self.enter(name)
+        try:
+            yield
+        finally:
+            self.leave(depth)
+
+    def current(self) -> str:
+        return self._stack[-1]
+
+    def leave_current(self) -> None:
+        self.leave(len(self._stack) - 1)
+
+    def milliseconds(self) -> dict[str, float]:
+        self._switch()
+        return {name: round(seconds * 1000, 3) for name, seconds in self.seconds.items()}
+
+    def server_timing(self) -> str:
+        """the Server-Timing header value, which browser dev tools show next to the request"""
+        return ", ".join("%s;dur=%s" % (name, ms) for name, ms in self.milliseconds().items())
+
+
+current_profile: ContextVar[RequestProfile | None] = ContextVar("current_profile", default=None)
+_NOT_PROFILED = nullcontext()
+
+
+def stage(name: str):
+    """a stage of the current request's profile, a no-op context manager when it isn't profiled"""
+    profile = current_profile.get()
+    return _NOT_PROFILED if profile is None else profile.stage(name)
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the stack of the event loop's thread every `interval` seconds, in the folded format flamegraph.pl,
+    inferno and speedscope read ("frame;frame;frame count" per line). Coroutines of other requests running on
+    the same loop show up in the samples too.
+    """
+
+    def __init__(self, thread_id: int, interval: float = PROFILING_INTERVAL_SECONDS):
+        super().__init__(name="profiling-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                frames.append("%s:%s" % (frame.f_globals.get("__name__"), frame.f_code.co_qualname))
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+    def folded(self) -> str:
+        return "".join("%s %s\n" % (stack, count) for stack, count in self.stacks.most_common())
+
+
+class ProfilingMiddleware:
+    """
+    Profiles the requests that carry the profiling token in their X-Profile header, and a random `sample_rate`
+    share of all others. Both get the stage breakdown in a Server-Timing header and in the log; requested
+    profiles also sample the stack into `output_dir`/<X-Profile-Id>.folded, one sampler at a time. Without a
+    token and a sample rate the middleware only forwards the request.
+    """
+
+    def __init__(
+        self,
+        app,
+        token: str = PROFILING_TOKEN,
+        sample_rate: float = PROFILING_SAMPLE_RATE,
+        output_dir: Path = PROFILING_DIR,
+        interval: float = PROFILING_INTERVAL_SECONDS
+    ):
+        self.app = app
+        self.token = None if token is None else token.encode()
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.interval = interval
+        self._sampling = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.token is not None or self.sample_rate > 0
+
+    def _requested(self, scope) -> bool:
+        if self.token is None:
+            return False
+        # compared in constant time, so response times tell nothing about the token
+        return any(
+            name == PROFILE_HEADER and hmac.compare_digest(value, self.token) for name, value in scope["headers"]
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            return await self.app(scope, receive, send)
+
+        requested = self._requested(scope)
+        if not requested and not (self.sample_rate > 0 and random.random() < self.sample_rate):
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile()
+        sampler = None
+        if requested and not self._sampling:
+            self._sampling = True
+            sampler = StackSampler(threading.get_ident(), self.interval)
+            sampler.start()
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                headers = [*message.get("headers", []), (b"server-timing", profile.server_timing().encode())]
+                if sampler is not None:
+                    headers.append((b"x-profile-id", profile.id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        context_token = current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            current_profile.reset(context_token)
+            logger.info("profile %s of %s %s: %s", profile.id, scope["method"], scope["path"], profile.milliseconds())
+            if sampler is not None:
+                sampler.stop()
+                self._sampling = False
+                self.output_dir.mkdir(parents=True, exist_ok=True)
+                (self.output_dir / ("%s.folded" % profile.id)).write_text(sampler.folded())
+
+
+class ProfiledJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        with stage("serialize"):
+            return super().render(content)
+
+
+class ProfiledRoute(APIRoute):
+    """
+    Route class that splits a profiled request into the endpoint's own stages and FastAPI's: everything the
+    handler does around the endpoint is "validate", except the JSON encoding of the default response class.
+    """
+
+    def __init__(self, path: str, endpoint, *, response_class=Default(JSONResponse), **kwargs):
+        if isinstance(response_class, DefaultPlaceholder):
+            response_class = Default(ProfiledJSONResponse)
+        super().__init__(path, endpoint, response_class=response_class, **kwargs)
+
+    def get_route_handler(self):
+        call = self.dependant.call
+        if asyncio.iscoroutinefunction(call):
+            @functools.wraps(call)
+            async def profiled_call(**values):
+                with stage("endpoint"):
+                    return await call(**values)
+
+            self.dependant.call = profiled_call
+
+        handler = super().get_route_handler()
+
+        async def profiled_handler(request):
+            with stage("validate"):
+                return await handler(request)
+
+        return profiled_handler
+
+
+def _before_execute(conn, clauseelement, multiparams, params, execution_options):
+    profile = current_profile.get()
+    if profile is not None:
+        profile.enter("compile")
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    if profile is not None:
+        if profile.current() == "compile":
+            profile.leave_current()
+        profile.enter("execute")
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    if profile is not None and profile.current() == "execute":
+        profile.leave_current()
+
+
+def enabled() -> bool:
+    return PROFILING_TOKEN is not None or PROFILING_SAMPLE_RATE > 0
+
+
+def install(engine: AsyncEngine) -> None:
+    """times compile and execute of the statements profiled requests run; costs a context lookup otherwise"""
+    if not event.contains(engine.sync_engine, "before_execute", _before_execute):
+        event.listen(engine.sync_engine, "before_execute", _before_execute)
+        event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,29 @@
+import asyncio
+import logging
+
+from config import RESERVATION_SWEEP_SECONDS, RESERVATION_SWEEP_BATCH_SIZE
+from crud.inventory import release_expired_reservations
+
+logger = logging.getLogger(__name__)
+
+
+async def sweep_expired_reservations(session_manager, batch_size: int = RESERVATION_SWEEP_BATCH_SIZE) -> int:
+    """releases expired reservations one batch (and one short transaction) at a time until none are left"""
+    released = 0
+    while True:
+        async with session_manager.session() as session:
+            count = await release_expired_reservations(session, batch_size)
+        released += count
+        if count < batch_size:
+            return released
+
+
+async def run_reservation_sweeper(session_manager) -> None:
+    while True:
+        await asyncio.sleep(RESERVATION_SWEEP_SECONDS)
+        try:
+            released = await sweep_expired_reservations(session_manager)
+            if released:
+                logger.info("released %s expired reservations", released)
+        except Exception:
+            logger.exception("reservation sweep failed")
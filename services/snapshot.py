@@ -0,0 +1,179 @@
+import asyncio
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from config import CATALOG_REFRESH_SECONDS, CATALOG_SNAPSHOT_WATCH_SECONDS
+from services.catalog import CatalogEngine, catalog_engine, fetch_catalog
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CATSNAP\0"
+# bumped whenever the columns of the catalog change, so files of the previous layout are rebuilt, not attached
+FORMAT_VERSION = 2
+ALIGNMENT = 64
+# magic, format version, snapshot version, table of contents length
+HEADER = struct.Struct("<8sIQQ")
+
+
+class CatalogSnapshot(NamedTuple):
+    version: int
+    inode: int
+    columns: dict[str, np.ndarray]
+    category_hierarchies: list[str]
+
+
+# the columns this CatalogEngine serves, a snapshot with any other set is rebuilt
+SNAPSHOT_COLUMNS = frozenset(CatalogEngine.build_columns([], [])[0])
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_catalog_snapshot(
+    path: Path,
+    columns: dict[str, np.ndarray],
+    category_hierarchies: list[str],
+    version: int = None
+) -> int:
+    """
+    Layout: fixed header, JSON table of contents, then every array 64-byte aligned so readers can map them
+    in place. The file is written next to `path` and renamed over it, which readers observe atomically.
+    """
+    version = version or time.time_ns()
+    blobs = {name: np.ascontiguousarray(array) for name, array in columns.items()}
+    blobs["category_hierarchies"] = np.frombuffer("\n".join(category_hierarchies).encode(), dtype=np.uint8)
+
+    toc, offset = [], 0
+    for name, array in blobs.items():
+        toc.append({"name": name, "dtype": array.dtype.str, "shape": array.shape, "offset": offset})
+        offset = _aligned(offset + array.nbytes)
+    toc_bytes = json.dumps(toc).encode()
+    data_start = _aligned(HEADER.size + len(toc_bytes))
+
+    tmp_path = path.with_name("%s.%s.tmp" % (path.name, os.getpid()))
+    with open(tmp_path, "wb") as snapshot_file:
+        snapshot_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, version, len(toc_bytes)))
+        snapshot_file.write(toc_bytes)
+        for entry, array in zip(toc, blobs.values()):
+            snapshot_file.seek(data_start + entry["offset"])
+            snapshot_file.write(array.tobytes())
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(tmp_path, path)
+    return version
+
+
+def read_catalog_snapshot(path: Path) -> CatalogSnapshot:
+    with open(path, "rb") as snapshot_file:
+        inode = os.fstat(snapshot_file.fileno()).st_ino
+        buffer = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, format_version, version, toc_length = HEADER.unpack_from(buffer)
+    if magic != MAGIC or format_version != FORMAT_VERSION:
+        raise ValueError("%s is not a catalog snapshot of format %s" % (path, FORMAT_VERSION))
+
+    toc = json.loads(buffer[HEADER.size:HEADER.size + toc_length])
+    data_start = _aligned(HEADER.size + toc_length)
+    columns = {}
+    for entry in toc:
+        dtype, shape = np.dtype(entry["dtype"]), tuple(entry["shape"])
+        count = int(np.prod(shape))
+        if count == 0:
+            columns[entry["name"]] = np.empty(shape, dtype=dtype)
+            continue
+        # read-only views into the shared page cache; the mapping lives as long as any array references it
+        columns[entry["name"]] = np.frombuffer(
+            buffer, dtype=dtype, count=count, offset=data_start + entry["offset"]
+        ).reshape(shape)
+
+    hierarchies = columns.pop("category_hierarchies").tobytes().decode()
+    return CatalogSnapshot(version, inode, columns, hierarchies.split("\n") if hierarchies else [])
+
+
+def _lock_path(path: Path) -> Path:
+    return path.with_name(path.name + ".lock")
+
+
+async def publish_catalog_snapshot(session_manager, path: Path) -> int:
+    columns, category_hierarchies = CatalogEngine.build_columns(*await fetch_catalog(session_manager))
+    return await asyncio.to_thread(write_catalog_snapshot, path, columns, category_hierarchies)
+
+
+def _is_stale(path: Path) -> bool:
+    return not path.exists() or time.time() - path.stat().st_mtime >= CATALOG_REFRESH_SECONDS
+
+
+def _read_servable(path: Path) -> CatalogSnapshot | None:
+    """the snapshot at `path`, None when it is of another format or holds other columns than the engine serves"""
+    try:
+        snapshot = read_catalog_snapshot(path)
+    except ValueError:
+        logger.warning("%s has an unknown format", path)
+        return None
+    if snapshot.columns.keys() != SNAPSHOT_COLUMNS:
+        logger.warning("%s holds other columns than the catalog engine serves", path)
+        return None
+    return snapshot
+
+
+async def attach_catalog_snapshot(session_manager, path: Path, engine: CatalogEngine = catalog_engine) -> int:
+    """
+    Startup hook: the first worker to take the lock builds a missing, stale or unservable snapshot (one left by
+    an older release) while the others wait, then every worker maps the same file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(_lock_path(path), "a") as lock_file:
+        await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+        try:
+            snapshot = None if _is_stale(path) else _read_servable(path)
+            if snapshot is None:
+                await publish_catalog_snapshot(session_manager, path)
+                snapshot = read_catalog_snapshot(path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    engine.attach(snapshot.columns, snapshot.category_hierarchies)
+    return snapshot.inode
+
+
+async def run_snapshot_watcher(
+    session_manager,
+    path: Path,
+    inode: int,
+    engine: CatalogEngine = catalog_engine
+) -> None:
+    """republishes the snapshot once it is stale (one worker at a time) and remaps whenever the file was replaced"""
+    while True:
+        await asyncio.sleep(CATALOG_SNAPSHOT_WATCH_SECONDS)
+        try:
+            if _is_stale(path):
+                with open(_lock_path(path), "a") as lock_file:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        pass  # another worker is publishing, its file gets picked up below on a later tick
+                    else:
+                        try:
+                            if _is_stale(path):
+                                await publish_catalog_snapshot(session_manager, path)
+                        finally:
+                            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+            if path.stat().st_ino != inode:
+                # a file published by a worker of another release is skipped, the current columns keep serving
+                snapshot = _read_servable(path)
+                if snapshot is not None:
+                    engine.attach(snapshot.columns, snapshot.category_hierarchies)
+                    inode = snapshot.inode
+        except Exception:
+            logger.exception("catalog snapshot refresh failed")
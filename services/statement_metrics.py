@@ -0,0 +1,89 @@
+import logging
+import time
+from collections import Counter
+
+from sqlalchemy import event, text
+from sqlalchemy.engine.interfaces import CacheStats
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+COMPILED_CACHE_STATES = {CacheStats.CACHE_HIT: "hit", CacheStats.CACHE_MISS: "miss"}
+
+PLANNING_QUERY = text(
+    """
+    SELECT query, calls, mean_plan_time, mean_exec_time
+    FROM pg_stat_statements
+    WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+    ORDER BY calls DESC
+    LIMIT :limit
+    """
+)
+
+
+class StatementMetrics:
+    """
+    Counts, per executed statement, whether SQLAlchemy found its compiled form in the engine's cache and whether
+    the connection found it among its prepared statements (asyncpg only parses and describes it again on a miss),
+    with the mean execution time of both, so the cost of a miss is visible next to the hit rate. Planning time
+    is only known to the server, see planning_stats.
+    """
+
+    def __init__(self):
+        self.compiled = Counter()
+        self.prepared = Counter()
+        self.seconds = Counter()
+
+    def install(self, engine: AsyncEngine) -> None:
+        if not event.contains(engine.sync_engine, "before_cursor_execute", self._before_cursor_execute):
+            event.listen(engine.sync_engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(engine.sync_engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+        compiled = COMPILED_CACHE_STATES.get(getattr(context, "cache_hit", None))
+        if compiled is not None:
+            self.compiled[compiled] += 1
+
+        # the asyncpg adapter keys its LRU of prepared statements by the statement text
+        cache = getattr(connection.connection.dbapi_connection, "_prepared_statement_cache", None)
+        prepared = None if cache is None else ("hit" if statement in cache else "miss")
+        context._statement_metrics = (prepared, time.perf_counter())
+
+    def _after_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+        prepared, started_at = getattr(context, "_statement_metrics", (None, None))
+        if prepared is None:
+            return
+        self.prepared[prepared] += 1
+        self.seconds[prepared] += time.perf_counter() - started_at
+
+    @staticmethod
+    def _cache_stats(counter: Counter) -> dict:
+        total = counter["hit"] + counter["miss"]
+        return {"hit": counter["hit"], "miss": counter["miss"], "hit_rate": counter["hit"] / total if total else None}
+
+    def snapshot(self) -> dict:
+        return {
+            "compiled_cache": self._cache_stats(self.compiled),
+            "prepared_cache": self._cache_stats(self.prepared),
+            "mean_execute_ms": {
+                state: self.seconds[state] / self.prepared[state] * 1000 if self.prepared[state] else None
+                for state in ("hit", "miss")
+            },
+        }
+
+
+async def planning_stats(session_manager, limit: int = 20) -> list[dict] | None:
+    """
+    Mean planning and execution time of the most frequent statements from pg_stat_statements, None when the
+    extension isn't installed; planning times stay 0 unless pg_stat_statements.track_planning is on.
+    """
+    try:
+        async with session_manager.session() as session:
+            rows = (await session.execute(PLANNING_QUERY, {"limit": limit})).mappings().all()
+    except Exception:
+        logger.info("pg_stat_statements is not available", exc_info=True)
+        return None
+    return [dict(row) for row in rows]
+
+
+statement_metrics = StatementMetrics()
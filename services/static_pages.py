@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pydantic import TypeAdapter
+
+import schemas
+from config import (
+    STATIC_SNAPSHOT_DIR, STATIC_SNAPSHOT_TOP_PRODUCTS, STATIC_SNAPSHOT_PAGE_SIZE, STATIC_SNAPSHOT_CONCURRENCY,
+    STATIC_SNAPSHOT_CHUNK_SIZE, STREAM_BATCH_SIZE
+)
+from crud import category as category_crud, product as product_crud
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+CATEGORIES_URL = "/categories"
+# the filters /categories and /products apply to every request
+CATEGORIES_FILTERS = {"effectively_active": True, "hierarchy": {"category_id": None, "descendants": False}, "level": 1}
+LISTED_FILTERS = {"activity": True, "category_active": True}
+
+_detail_adapter = TypeAdapter(schemas.ProductDetailSchema)
+_products_adapter = TypeAdapter(list[schemas.ShortProductSchema])
+_categories_adapter = TypeAdapter(list[schemas.CategorySchema])
+
+
+def detail_url(product_id) -> str:
+    return "/products/%s/detail" % product_id
+
+
+def category_page_url(category_id) -> str:
+    return "/products?category_id=%s" % category_id
+
+
+def _file_path(url: str) -> str:
+    """where the body of `url` is stored, relative to the snapshot directory"""
+    if url.startswith("/products?category_id="):
+        return "products/category/%s.json" % url.removeprefix("/products?category_id=")
+    return "%s.json" % url.lstrip("/")
+
+
+def _write_atomically(path: Path, body: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name("%s.%s.tmp" % (path.name, os.getpid()))
+    tmp_path.write_bytes(body)
+    os.replace(tmp_path, path)
+
+
+def render(adapter: TypeAdapter, content) -> bytes:
+    """the body the API sends for `content`: validated into the response model, then compact JSON"""
+    return adapter.dump_json(adapter.validate_python(content, from_attributes=True))
+
+
+def load_manifest(output_dir: Path) -> dict:
+    try:
+        return json.loads((output_dir / MANIFEST_NAME).read_text())
+    except FileNotFoundError:
+        return {"files": {}}
+
+
+class SnapshotWriter:
+    """
+    Collects the manifest entries of one snapshot run. A page whose body hashes the same as in the previous
+    manifest is not written again and not listed as changed, so the CDN upload only carries real changes.
+    """
+
+    def __init__(self, output_dir: Path, previous: dict):
+        self.output_dir = output_dir
+        self.previous = previous["files"]
+        self.files = {}
+        self.changed = []
+
+    def is_current(self, url: str, version: str) -> bool:
+        entry = self.previous.get(url)
+        return entry is not None and entry["version"] == version and (self.output_dir / entry["path"]).exists()
+
+    def keep(self, url: str) -> None:
+        self.files[url] = self.previous[url]
+
+    def write(self, url: str, body: bytes, version: str = None) -> None:
+        digest = hashlib.sha256(body).hexdigest()
+        entry = {"path": _file_path(url), "sha256": digest, "bytes": len(body), "version": version}
+        previous = self.previous.get(url)
+        if previous is None or previous["sha256"] != digest or not (self.output_dir / previous["path"]).exists():
+            _write_atomically(self.output_dir / entry["path"], body)
+            self.changed.append(url)
+        self.files[url] = entry
+
+    def remove_stale(self) -> list[str]:
+        removed = sorted(url for url in self.previous if url not in self.files)
+        for url in removed:
+            (self.output_dir / self.previous[url]["path"]).unlink(missing_ok=True)
+        return removed
+
+
+async def generate_static_snapshot(
+    session_manager,
+    output_dir: Path = STATIC_SNAPSHOT_DIR,
+    top_products: int = STATIC_SNAPSHOT_TOP_PRODUCTS,
+    concurrency: int = STATIC_SNAPSHOT_CONCURRENCY,
+    chunk_size: int = STATIC_SNAPSHOT_CHUNK_SIZE
+) -> dict:
+    """
+    Renders /categories, the first page of /products?category_id=... of every active category and the detail
+    pages of the `top_products` most reviewed products into JSON files under `output_dir`, with the bodies the
+    API would send, and writes their manifest (url: path, sha256, bytes, version) for the CDN upload.
+
+    Detail pages are only rendered again when product.updated_at moved past the version in the previous
+    manifest; the list pages aggregate too much to version, they are rendered and compared by hash. At most
+    `concurrency` sessions read at the same time, the details of `chunk_size` products are streamed per session.
+    """
+    previous = load_manifest(output_dir)
+    writer = SnapshotWriter(output_dir, previous)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with session_manager.session() as session:
+        top = await product_crud.most_reviewed_products(session, top_products)
+        categories = category_crud.category_list_query({"effectively_active": True})
+        category_ids = [
+            row.id async for row in await session.stream(categories.execution_options(yield_per=STREAM_BATCH_SIZE))
+        ]
+
+    versions = {}
+    for product_id, updated_at in top:
+        versions[product_id] = updated_at.isoformat()
+        if writer.is_current(detail_url(product_id), versions[product_id]):
+            writer.keep(detail_url(product_id))
+    stale = [product_id for product_id in versions if detail_url(product_id) not in writer.files]
+
+    async def render_details(product_ids):
+        async with semaphore, session_manager.session() as session:
+            async for row in await product_crud.product_details(session, product_ids, **LISTED_FILTERS):
+                writer.write(detail_url(row.id), render(_detail_adapter, row), version=versions[row.id])
+
+    async def render_category_page(category_id):
+        async with semaphore, session_manager.session() as session:
+            page = await product_crud.products_list(
+                session, limit=STATIC_SNAPSHOT_PAGE_SIZE, filters={**LISTED_FILTERS, "category": category_id},
+                ordering=["id"]
+            )
+        writer.write(category_page_url(category_id), render(_products_adapter, page["rows"]))
+
+    async def render_categories():
+        async with semaphore, session_manager.session() as session:
+            rows = (await category_crud.category_list(session, filters=CATEGORIES_FILTERS)).all()
+        writer.write(CATEGORIES_URL, render(_categories_adapter, rows))
+
+    await asyncio.gather(
+        render_categories(),
+        *(render_category_page(category_id) for category_id in category_ids),
+        *(render_details(stale[i:i + chunk_size]) for i in range(0, len(stale), chunk_size)),
+    )
+
+    manifest = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "content_type": "application/json",
+        "files": dict(sorted(writer.files.items())),
+        "changed": sorted(writer.changed),
+        "removed": writer.remove_stale(),
+    }
+    _write_atomically(output_dir / MANIFEST_NAME, json.dumps(manifest, indent=2).encode())
+    logger.info(
+        "static snapshot: %s pages, %s changed, %s removed",
+        len(manifest["files"]), len(manifest["changed"]), len(manifest["removed"])
+    )
+    return manifest
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from datetime import datetime
+from heapq import nsmallest
+from typing import Iterable, Literal, NamedTuple
+from uuid import UUID
+
+from config import SUGGEST_MAX_RESULTS, SUGGEST_REFRESH_SECONDS, SUGGEST_REBUILD_SECONDS
+from crud.category import category_suggestions
+from crud.product import product_suggestions
+
+logger = logging.getLogger(__name__)
+
+
+class Suggestion(NamedTuple):
+    id: UUID
+    name: str
+    kind: Literal["product", "category"]
+    weight: int = 0
+
+
+def rank(suggestion: Suggestion) -> tuple:
+    """heaviest first, ties by name then id, so ranking a scan and merging into ranked results agree"""
+    return -suggestion.weight, suggestion.name, suggestion.kind, suggestion.id
+
+
+class PrefixIndex:
+    """
+    Sorted array of normalized keys (the whole name plus every word suffix of it, so "red sneakers" is found
+    by "sne" too) with a parallel array of suggestions. A prefix lookup is two bisects. build() ranks the top
+    results of every prefix matching more than `scan_limit` keys, from the ranked results of the prefixes one
+    character longer, so no keystroke ever scans more than that; add() merges into the ranked results instead
+    of dropping them, and remove() re-ranks only the results the removed suggestion was part of.
+    """
+
+    def __init__(self, max_results: int = SUGGEST_MAX_RESULTS, scan_limit: int = 256):
+        self.max_results = max_results
+        self.scan_limit = scan_limit
+        self.watermark: datetime | None = None
+        self._keys: list[str] = []
+        self._entries: list[Suggestion] = []
+        self._documents: dict[tuple[str, UUID], Suggestion] = {}
+        self._top: dict[str, list[Suggestion]] = {}
+
+    def __len__(self):
+        return len(self._documents)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.casefold().split())
+
+    @classmethod
+    def keys_for(cls, name: str) -> set[str]:
+        words = cls.normalize(name).split(" ")
+        return {" ".join(words[i:]) for i in range(len(words)) if words[i]}
+
+    @staticmethod
+    def prefixes_for(keys: Iterable[str]) -> set[str]:
+        return {key[:i] for key in keys for i in range(1, len(key) + 1)}
+
+    def build(self, suggestions: Iterable[Suggestion], watermark: datetime = None) -> None:
+        documents = {(suggestion.kind, suggestion.id): suggestion for suggestion in suggestions}
+        pairs = sorted(
+            ((key, suggestion) for suggestion in documents.values() for key in self.keys_for(suggestion.name)),
+            key=lambda pair: pair[0]
+        )
+        keys, entries, top = [key for key, _ in pairs], [suggestion for _, suggestion in pairs], {}
+        self._rank(keys, entries, top, "", 0, len(keys), reuse=False)
+        top.pop("", None)
+        # swap everything at once so concurrent readers never see a half-built index
+        self._keys, self._entries, self._documents, self._top = keys, entries, documents, top
+        self.watermark = watermark
+
+    def add(self, suggestion: Suggestion) -> None:
+        self.remove(suggestion.kind, suggestion.id)
+        keys = self.keys_for(suggestion.name)
+        for key in keys:
+            position = bisect_left(self._keys, key)
+            self._keys.insert(position, key)
+            self._entries.insert(position, suggestion)
+        self._documents[(suggestion.kind, suggestion.id)] = suggestion
+
+        for prefix in self.prefixes_for(keys):
+            found = self._top.get(prefix)
+            if found is not None and (len(found) < self.max_results or rank(suggestion) < rank(found[-1])):
+                self._top[prefix] = nsmallest(self.max_results, [*found, suggestion], key=rank)
+
+    def remove(self, kind: str, _id: UUID) -> None:
+        suggestion = self._documents.pop((kind, _id), None)
+        if suggestion is None:
+            return
+
+        keys = self.keys_for(suggestion.name)
+        for key in keys:
+            position = bisect_left(self._keys, key)
+            while position < len(self._keys) and self._keys[position] == key:
+                if self._entries[position] is suggestion:
+                    del self._keys[position]
+                    del self._entries[position]
+                    break
+                position += 1
+
+        # longest first, so every prefix is re-ranked from results that no longer hold the suggestion
+        for prefix in sorted(self.prefixes_for(keys), key=len, reverse=True):
+            found = self._top.get(prefix)
+            if found is not None and any(entry is suggestion for entry in found):
+                del self._top[prefix]
+                self._rank(self._keys, self._entries, self._top, prefix, *self._range(prefix), reuse=True)
+
+    def search(self, prefix: str, limit: int = None) -> list[Suggestion]:
+        limit = min(limit or self.max_results, self.max_results)
+        prefix = self.normalize(prefix)
+        if not prefix:
+            return []
+
+        found = self._top.get(prefix)
+        if found is not None:
+            return found[:limit]
+
+        start, end = self._range(prefix)
+        found = self._best(self._entries[start:end])
+        # grown past the limit through add()
+        if end - start > self.scan_limit:
+            self._top[prefix] = found
+        return found[:limit]
+
+    def _range(self, prefix: str) -> tuple[int, int]:
+        start = bisect_left(self._keys, prefix)
+        return start, bisect_left(self._keys, prefix[:-1] + chr(ord(prefix[-1]) + 1), lo=start)
+
+    def _rank(self, keys: list[str], entries: list[Suggestion], top: dict, prefix: str, start: int, end: int,
+              reuse: bool) -> list[Suggestion]:
+        """
+        top results of the keys[start:end] starting with `prefix`, stored in `top` when there are more than
+        `scan_limit` of them: ranked from the keys equal to the prefix and the top results of every prefix one
+        character longer, taken from `top` when `reuse` and already there
+        """
+        if end - start <= self.scan_limit:
+            return self._best(entries[start:end])
+
+        candidates, position = [], start
+        while position < end and len(keys[position]) == len(prefix):
+            candidates.append(entries[position])
+            position += 1
+        while position < end:
+            child = keys[position][:len(prefix) + 1]
+            child_end = bisect_left(keys, child[:-1] + chr(ord(child[-1]) + 1), position, end)
+            if reuse and child in top:
+                candidates.extend(top[child])
+            else:
+                candidates.extend(self._rank(keys, entries, top, child, position, child_end, reuse))
+            position = child_end
+        top[prefix] = self._best(candidates)
+        return top[prefix]
+
+    def _best(self, entries: list[Suggestion]) -> list[Suggestion]:
+        # one document may match through several of its keys, so deduplicate before ranking
+        unique = {(entry.kind, entry.id): entry for entry in entries}
+        return nsmallest(self.max_results, unique.values(), key=rank)
+
+
+suggest_index = PrefixIndex()
+
+
+async def load_suggest_index(session_manager, index: PrefixIndex = suggest_index) -> None:
+    suggestions, watermark = [], None
+    async with session_manager.session() as session:
+        async for row in await category_suggestions(session):
+            suggestions.append(Suggestion(id=row.id, name=row.name, kind="category", weight=row.weight))
+
+        async for row in await product_suggestions(session):
+            suggestions.append(Suggestion(id=row.id, name=row.name, kind="product", weight=row.weight))
+            watermark = row.created_at if watermark is None else max(watermark, row.created_at)
+    index.build(suggestions, watermark=watermark)
+
+
+async def refresh_suggest_index(session_manager, index: PrefixIndex = suggest_index) -> None:
+    """picks up products created since the last load; renames and deactivations wait for the next rebuild"""
+    async with session_manager.session() as session:
+        async for row in await product_suggestions(session, created_after=index.watermark):
+            index.add(Suggestion(id=row.id, name=row.name, kind="product", weight=row.weight))
+            index.watermark = row.created_at if index.watermark is None else max(index.watermark, row.created_at)
+
+
+async def run_suggest_refresher(session_manager, index: PrefixIndex = suggest_index) -> None:
+    rebuilt_at = time.monotonic()
+    while True:
+        await asyncio.sleep(SUGGEST_REFRESH_SECONDS)
+        try:
+            if time.monotonic() - rebuilt_at >= SUGGEST_REBUILD_SECONDS:
+                await load_suggest_index(session_manager, index)
+                rebuilt_at = time.monotonic()
+            else:
+                await refresh_suggest_index(session_manager, index)
+        except Exception:
+            logger.exception("suggest index refresh failed")
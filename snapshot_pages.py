@@ -0,0 +1,33 @@
+"""
+Renders the pages that get most of the traffic (/categories, the first page of every category and the details of
+the most reviewed products) into static JSON files with a manifest for the CDN upload; run again, it only
+rewrites what changed and lists the changes and removals in the manifest.
+
+    python snapshot_pages.py [output_dir] [top products] [concurrency]
+"""
+import sys
+from pathlib import Path
+
+from config import STATIC_SNAPSHOT_DIR, STATIC_SNAPSHOT_TOP_PRODUCTS, STATIC_SNAPSHOT_CONCURRENCY
+from db.connections import db_session_manager
+from services.static_pages import generate_static_snapshot
+
+
+async def snapshot_pages(
+    output_dir: str = STATIC_SNAPSHOT_DIR,
+    top_products: int = STATIC_SNAPSHOT_TOP_PRODUCTS,
+    concurrency: int = STATIC_SNAPSHOT_CONCURRENCY
+):
+    try:
+        manifest = await generate_static_snapshot(db_session_manager, Path(output_dir), top_products, concurrency)
+    finally:
+        await db_session_manager.close()
+    print("%s pages, %s changed, %s removed" % (
+        len(manifest["files"]), len(manifest["changed"]), len(manifest["removed"])
+    ))
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    asyncio.run(snapshot_pages(*sys.argv[1:2], *map(int, sys.argv[2:])))
@@ -0,0 +1,37 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import create_engine
+
+from db.connections import DatabaseSessionManager
+from tests.database import clone_database, drop_database, sync_url, async_url
+
+
+@pytest.fixture(scope="session")
+def database_url(request):
+    """this worker's clone of the template database, dropped when the session ends"""
+    worker_id = getattr(request.config, "workerinput", {}).get("workerid", "main")
+    url = clone_database(worker_id)
+    yield url
+    drop_database(url)
+
+
+@pytest.fixture(scope="session")
+def sync_engine(database_url):
+    engine = create_engine(sync_url(database_url))
+    yield engine
+    engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def session_manager(database_url):
+    """the production session manager on asyncpg, with everything the test does rolled back afterwards"""
+    manager = DatabaseSessionManager(async_url(database_url).render_as_string(hide_password=False))
+    async with manager.isolated():
+        yield manager
+    await manager.close()
+
+
+@pytest_asyncio.fixture
+async def async_db(session_manager):
+    async with session_manager.session() as session:
+        yield session
@@ -0,0 +1,85 @@
+"""
+Test databases. The extensions and the schema are built once into a template database, then every pytest
+worker (one per xdist process) gets its own copy through CREATE DATABASE ... TEMPLATE, which is a file level
+copy instead of replaying the DDL. The template is rebuilt whenever the DDL create_all emits changes, including
+the settings interpolated into the trigger and function bodies.
+"""
+import hashlib
+
+from sqlalchemy import create_engine, create_mock_engine, text
+from sqlalchemy.engine import URL, make_url
+
+from config import TEST_DB_URL
+from db import models
+
+EXTENSIONS = ("uuid-ossp", "ltree")
+
+
+def sync_url(url: URL) -> URL:
+    return url.set(drivername="postgresql+psycopg2")
+
+
+def async_url(url: URL) -> URL:
+    return url.set(drivername="postgresql+asyncpg")
+
+
+def schema_fingerprint() -> str:
+    """hash of the compiled DDL rather than of the models source, config.SEARCH_TEXT_CONFIG and the like end up in it"""
+    digest = hashlib.sha1()
+
+    def executor(statement, *multiparams, **params):
+        digest.update(str(statement.compile(dialect=engine.dialect)).encode())
+
+    engine = create_mock_engine("postgresql+psycopg2://", executor)
+    models.BaseModel.metadata.create_all(bind=engine, checkfirst=False)
+    return digest.hexdigest()
+
+
+def _build_template(connection, url: URL, template: str) -> None:
+    connection.execute(text('DROP DATABASE IF EXISTS "%s"' % template))
+    connection.execute(text('CREATE DATABASE "%s"' % template))
+
+    engine = create_engine(url.set(database=template))
+    try:
+        with engine.begin() as template_connection:
+            for extension in EXTENSIONS:
+                template_connection.execute(text('CREATE EXTENSION IF NOT EXISTS "%s"' % extension))
+            models.BaseModel.metadata.create_all(bind=template_connection)
+    finally:
+        # CREATE DATABASE ... TEMPLATE fails while anyone is still connected to the template
+        engine.dispose()
+    connection.execute(text("COMMENT ON DATABASE \"%s\" IS '%s'" % (template, schema_fingerprint())))
+
+
+def clone_database(worker_id: str) -> URL:
+    url = sync_url(make_url(TEST_DB_URL))
+    template, database = "%s_template" % url.database, "%s_%s" % (url.database, worker_id)
+
+    admin = create_engine(url, isolation_level="AUTOCOMMIT")
+    try:
+        with admin.connect() as connection:
+            # workers start together: the first one (re)builds the template while the others wait for it
+            connection.execute(text("SELECT pg_advisory_lock(hashtext(:name))"), {"name": template})
+            try:
+                fingerprint = connection.execute(
+                    text("SELECT shobj_description(oid, 'pg_database') FROM pg_database WHERE datname = :name"),
+                    {"name": template}
+                ).scalar()
+                if fingerprint != schema_fingerprint():
+                    _build_template(connection, url, template)
+                connection.execute(text('DROP DATABASE IF EXISTS "%s"' % database))
+                connection.execute(text('CREATE DATABASE "%s" TEMPLATE "%s"' % (database, template)))
+            finally:
+                connection.execute(text("SELECT pg_advisory_unlock(hashtext(:name))"), {"name": template})
+    finally:
+        admin.dispose()
+    return url.set(database=database)
+
+
+def drop_database(url: URL) -> None:
+    admin = create_engine(url.set(database=make_url(TEST_DB_URL).database), isolation_level="AUTOCOMMIT")
+    try:
+        with admin.connect() as connection:
+            connection.execute(text('DROP DATABASE IF EXISTS "%s"' % url.database))
+    finally:
+        admin.dispose()
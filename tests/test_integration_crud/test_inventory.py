@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from crud.inventory import (
+    InsufficientStock, reserve_inventory, commit_reservation, release_reservation
+)
+from db.models import Category, Product, ProductInventory, InventoryReservation
+from services.reservations import sweep_expired_reservations
+
+
+async def create_inventories(async_db, *quantities):
+    category = Category(name="Reserved category")
+    product = Product(category=category, name="Reserved product")
+    inventories = [ProductInventory(product=product, quantity=quantity, unit_price=1) for quantity in quantities]
+    async_db.add_all([category, product, *inventories])
+    await async_db.commit()
+    return [inventory.id for inventory in inventories]
+
+
+async def quantities(async_db, inventory_ids):
+    rows = await async_db.execute(
+        select(ProductInventory.id, ProductInventory.quantity).where(ProductInventory.id.in_(inventory_ids))
+    )
+    return [dict(rows.all())[inventory_id] for inventory_id in inventory_ids]
+
+
+@pytest.mark.asyncio
+async def test_reserve_and_commit(async_db):
+    inventory1, inventory2 = await create_inventories(async_db, 5, 1)
+
+    reservation = await reserve_inventory(async_db, {inventory1: 2, inventory2: 1})
+    assert reservation["status"] == "held"
+    assert await quantities(async_db, [inventory1, inventory2]) == [3, 0]
+
+    with pytest.raises(InsufficientStock) as e:
+        await reserve_inventory(async_db, {inventory1: 1, inventory2: 1})
+    assert e.value.inventory_ids == [inventory2]
+    assert await quantities(async_db, [inventory1, inventory2]) == [3, 0]
+
+    reservation = await commit_reservation(async_db, reservation["id"])
+    assert reservation["status"] == "committed"
+    assert await quantities(async_db, [inventory1, inventory2]) == [3, 0]
+
+    with pytest.raises(ValueError):
+        await release_reservation(async_db, reservation["id"])
+
+
+@pytest.mark.asyncio
+async def test_release(async_db):
+    inventory1, = await create_inventories(async_db, 5)
+
+    reservation = await reserve_inventory(async_db, {inventory1: 5})
+    assert await quantities(async_db, [inventory1]) == [0]
+
+    reservation = await release_reservation(async_db, reservation["id"])
+    assert reservation["status"] == "released"
+    assert await quantities(async_db, [inventory1]) == [5]
+
+    with pytest.raises(ValueError):
+        await commit_reservation(async_db, reservation["id"])
+
+
+@pytest.mark.asyncio
+async def test_sweep_expired_reservations(session_manager, async_db):
+    inventory1, = await create_inventories(async_db, 5)
+    expired = await reserve_inventory(async_db, {inventory1: 2})
+    held = await reserve_inventory(async_db, {inventory1: 1})
+    await async_db.execute(
+        update(InventoryReservation)
+        .where(InventoryReservation.id == expired["id"])
+        .values(expires_at=datetime.utcnow() - timedelta(minutes=1))
+    )
+    await async_db.commit()
+
+    assert await sweep_expired_reservations(session_manager, batch_size=1) == 1
+    assert await quantities(async_db, [inventory1]) == [4]
+
+    statuses = dict((await async_db.execute(select(InventoryReservation.id, InventoryReservation.status))).all())
+    assert statuses[expired["id"]] == "released"
+    assert statuses[held["id"]] == "held"
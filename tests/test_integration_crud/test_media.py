@@ -0,0 +1,27 @@
+import pytest
+from sqlalchemy import select
+
+from crud.media import reorder_product_images
+from db.models import Category, Product, ProductImage
+
+
+@pytest.mark.asyncio
+async def test_reorder_product_images(async_db):
+    category = Category(name="Pictured category")
+    product = Product(category=category, name="Pictured product")
+    images = [ProductImage(product=product, image="images/%s.jpg" % i, position=i) for i in range(3)]
+    async_db.add_all([category, product, *images])
+    await async_db.commit()
+
+    primary_image = select(Product.primary_image).where(Product.id == product.id)
+    assert (await async_db.execute(primary_image)).scalar() == "images/0.jpg"
+
+    result = await reorder_product_images(async_db, product.id, [images[2].id, images[0].id, images[1].id])
+
+    assert [(row["image"], row["position"]) for row in result] == [
+        ("images/2.jpg", 0), ("images/0.jpg", 1), ("images/1.jpg", 2)
+    ]
+    assert (await async_db.execute(primary_image)).scalar() == "images/2.jpg"
+
+    with pytest.raises(ValueError):
+        await reorder_product_images(async_db, product.id, [images[0].id, images[1].id])
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from crud.product import products_list
+from db.models import Category, Customer, Product, ProductInventory, ProductReview
+
+
+@pytest.mark.asyncio
+async def test_products_list_pagination(async_db):
+    category = Category(name="Paginated category")
+    async_db.add_all([category, *(Product(category=category, name="Paginated %s" % i) for i in range(7))])
+    await async_db.commit()
+    filters = {"category": category.id}
+
+    page = await products_list(async_db, limit=3, filters=filters, ordering=["id"])
+    assert len(page["rows"]) == 3 and page["has_more"] is True and page["total"] is None
+
+    page = await products_list(async_db, limit=3, offset=3, filters=filters, ordering=["id"], total="exact")
+    assert page["has_more"] is True
+    assert (page["total"], page["total_estimated"]) == (7, False)
+
+    page = await products_list(async_db, limit=3, offset=6, filters=filters, ordering=["id"], total="auto")
+    assert len(page["rows"]) == 1 and page["has_more"] is False
+    assert (page["total"], page["total_estimated"]) == (7, False)
+
+    page = await products_list(async_db, limit=3, filters=filters, ordering=["id"], total="estimated")
+    assert page["total_estimated"] is True and page["total"] >= 0
+
+
+@pytest.mark.asyncio
+async def test_products_list_total_matches_pages(async_db):
+    category = Category(name="Counted category")
+    customer = Customer(email="counted@example.com", fullname="Counted")
+    products = [Product(category=category, name="Counted %s" % i) for i in range(4)]
+    async_db.add_all([category, customer, *products])
+    for i, product in enumerate(products):
+        # 0.3 per variant: only products with two variants pass the filter, however many reviews they have
+        async_db.add_all(
+            [ProductInventory(product=product, quantity=1, unit_price=1, discount=0.3) for _ in range(1 + i % 2)]
+        )
+        async_db.add_all([ProductReview(product=product, customer=customer, rating=i + 1) for _ in range(3)])
+    await async_db.commit()
+    filters = {"category": category.id, "discount": 0.5}
+
+    page = await products_list(async_db, limit=1, filters=filters, ordering=["-popular"], total="exact")
+    rest = await products_list(async_db, limit=10, offset=1, filters=filters, ordering=["-popular"])
+    assert [row.name for row in page["rows"] + rest["rows"]] == ["Counted 3", "Counted 1"]
+    assert page["total"] == 2
+
+
+@pytest.mark.asyncio
+async def test_products_list_new_arrivals(async_db):
+    category = Category(name="New arrivals category")
+    now = datetime.now(timezone.utc)
+    new_products = [
+        Product(category=category, name="Arrival %s" % days, created_at=now - timedelta(days=days))
+        for days in (0, 1, 2, 10)
+    ]
+    async_db.add_all([category, *new_products, Product(category=category, name="Hidden", is_active=False)])
+    await async_db.commit()
+    filters = {"activity": True, "category": category.id}
+    ordering = ["-new", "-id"]
+
+    page = await products_list(async_db, limit=2, filters=filters, ordering=ordering)
+    assert [row.name for row in page["rows"]] == ["Arrival 0", "Arrival 1"] and page["has_more"] is True
+    assert page["rows"][0].price is None and page["rows"][0].reviews_count == 0
+
+    filters["arrived_before"] = page["rows"][-1].id
+    page = await products_list(async_db, limit=2, filters=filters, ordering=ordering, total="exact")
+    assert [row.name for row in page["rows"]] == ["Arrival 2", "Arrival 10"] and page["has_more"] is False
+
+    filters = {"activity": True, "category": category.id, "created_within": timedelta(days=7)}
+    page = await products_list(async_db, limit=10, filters=filters, ordering=ordering)
+    assert [row.name for row in page["rows"]] == ["Arrival 0", "Arrival 1", "Arrival 2"]
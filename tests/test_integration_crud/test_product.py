@@ -0,0 +1,39 @@
+import pytest
+
+from crud.product import products_list
+from db.models import Category, Customer, Product, ProductInventory, ProductReview
+
+
+@pytest.mark.asyncio
+async def test_products_list_sparse_fields_keep_values(async_db):
+    category = Category(name="Sparse category")
+    customer = Customer(email="sparse@example.com", fullname="Sparse")
+    discounted = Product(category=category, name="Discounted")
+    reviewed = Product(category=category, name="Reviewed")
+    async_db.add_all([
+        category, customer, discounted, reviewed,
+        # several variants and several reviews on the same product, each must count once
+        *(ProductInventory(product=discounted, quantity=1, unit_price=price, discount=0.2) for price in (5, 6, 7)),
+        *(ProductReview(product=discounted, customer=customer, rating=rating) for rating in (2, 4)),
+        ProductInventory(product=reviewed, quantity=1, unit_price=5, discount=0.5),
+        *(ProductReview(product=reviewed, customer=customer, rating=5) for _ in range(4)),
+    ])
+    await async_db.commit()
+    filters = {"category": category.id, "discount": 0.4}
+
+    full = await products_list(async_db, limit=10, filters={"category": category.id}, ordering=["id"])
+    sparse = await products_list(
+        async_db, limit=10, filters={"category": category.id}, ordering=["id"], fields=["reviews_count"]
+    )
+    assert [(row.id, row.reviews_count) for row in sparse["rows"]] == [
+        (row.id, row.reviews_count) for row in full["rows"]
+    ]
+    ratings = {row.id: (row.reviews_count, row.avg_rating) for row in full["rows"]}
+    assert ratings == {discounted.id: (2, 3.0), reviewed.id: (4, 5.0)}
+
+    full = await products_list(async_db, limit=10, filters=filters, ordering=["-discount", "id"], total="exact")
+    sparse = await products_list(
+        async_db, limit=10, filters=filters, ordering=["-discount", "id"], fields=["name"], total="exact"
+    )
+    assert [row.id for row in sparse["rows"]] == [row.id for row in full["rows"]] == [discounted.id, reviewed.id]
+    assert sparse["total"] == full["total"] == 2
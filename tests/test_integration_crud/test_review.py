@@ -0,0 +1,40 @@
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import select, func
+
+from crud.review import ingest_reviews
+from db.models import Category, Customer, Product, ProductRating
+from schemas import ReviewIngestSchema
+
+
+@pytest.mark.asyncio
+async def test_ingest_reviews(async_db):
+    category = Category(name="Reviewed category")
+    product1 = Product(category=category, name="Reviewed product 1")
+    product2 = Product(category=category, name="Reviewed product 2")
+    async_db.add_all([category, product1, product2, Customer(email="known@example.com", fullname="Known")])
+    await async_db.commit()
+
+    reviews = [
+        ReviewIngestSchema(product_id=product1.id, email="known@example.com", fullname="Known", rating=5),
+        ReviewIngestSchema(product_id=product1.id, email="new@example.com", fullname="New", rating=3),
+        ReviewIngestSchema(product_id=product2.id, email="new@example.com", fullname="New", rating=4),
+        ReviewIngestSchema(product_id=uuid4(), email="new@example.com", fullname="New", rating=1),
+    ]
+    result = await ingest_reviews(async_db, reviews)
+
+    assert result["inserted"] == 3
+    assert result["customers"] == 2
+    assert [rejection["index"] for rejection in result["rejected"]] == [3]
+
+    customers = await async_db.execute(
+        select(func.count()).select_from(Customer).where(Customer.email.in_(["known@example.com", "new@example.com"]))
+    )
+    assert customers.scalar() == 2
+
+    ratings = dict((await async_db.execute(
+        select(ProductRating.product_id, ProductRating.rating_sum / ProductRating.reviews_count)
+        .where(ProductRating.product_id.in_([product1.id, product2.id]))
+    )).all())
+    assert ratings == {product1.id: 4, product2.id: 4}
@@ -1,19 +1,13 @@
 import pytest
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session
 
-from config import TEST_DB_URL
-from db.models import BaseModel
 
-
-@pytest.fixture(scope="module")
-def session():
-    # required!
-    # CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
-    # CREATE EXTENSION IF NOT EXISTS ltree;
-    engine = create_engine(TEST_DB_URL)
-    BaseModel.metadata.create_all(bind=engine)
-    session = sessionmaker(bind=engine)()
-    yield session
-    session.close()
-    BaseModel.metadata.drop_all(bind=engine)
+@pytest.fixture
+def session(sync_engine):
+    # every test runs in a transaction of its own that is rolled back afterwards, commits release savepoints
+    with sync_engine.connect() as connection:
+        transaction = connection.begin()
+        session = Session(bind=connection, join_transaction_mode="create_savepoint")
+        yield session
+        session.close()
+        transaction.rollback()
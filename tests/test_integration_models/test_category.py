@@ -1,9 +1,11 @@
+import pytest
 from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql import expression
 from sqlalchemy_utils import Ltree
 from sqlalchemy_utils.types.ltree import LQUERY
 
-from db.models import Category
+from db.models import Category, CategoryProductCount, Product
 from db.utils import get_first_value_from_rows
 
 
@@ -21,6 +23,8 @@ def test_category_creation(session):
     assert category1.deactivated is False
     assert category1.hierarchy == category1.id.hex
     assert category1.parent is None
+    assert category1.parent_id is None
+    assert category1.depth == 1
 
     assert category2.id is not None
     assert category2.name == "Test Category 2"
@@ -37,8 +41,14 @@ def test_category_creation(session):
     assert category4.id is not None
     assert category4.name == "Test Category 4"
     assert category4.deactivated is True
+    assert category1.effectively_active is True
+    assert category2.effectively_active is False
+    assert category3.effectively_active is False
+    assert category4.effectively_active is False
     assert category4.hierarchy == category2.hierarchy + Ltree(category4.id.hex)
     assert category4.parent.id == category2.id
+    assert category4.parent_id == category2.id
+    assert category4.depth == 3
 
 
 def test_category_update(session):
@@ -56,6 +66,8 @@ def test_category_update(session):
     assert category2.name == "Updated category"
     assert category2.hierarchy == category.hierarchy + Ltree(category2.id.hex)
     assert category2.parent.id == category.id
+    assert category2.parent_id == category.id
+    assert category2.depth == 2
     assert category2.deactivated is True
 
 
@@ -71,6 +83,40 @@ def test_category_delete(session):
     assert category_query is None
 
 
+def test_category_delete_with_children_is_refused(session):
+    category = Category(name="Parent to delete")
+    child = Category(name="Child of deleted", parent=category)
+    product = Product(category=child, name="Product under deleted")
+    session.add_all([category, child, product])
+    session.commit()
+
+    with pytest.raises(IntegrityError):
+        session.execute(delete(Category).where(Category.id == category.id))
+    session.rollback()
+    assert session.get(Product, product.id, populate_existing=True) is not None
+
+    session.execute(delete(Product).where(Product.id == product.id))
+    session.execute(delete(Category).where(Category.id == child.id))
+    session.execute(delete(Category).where(Category.id == category.id))
+    session.commit()
+    assert session.get(Category, category.id) is None
+
+
+def test_category_delete_keeps_ancestor_counts(session):
+    category = Category(name="Counted parent")
+    leaf = Category(name="Counted leaf to delete", parent=category)
+    session.add_all([category, leaf, Product(name="Counted in parent", category=category)])
+    session.add_all([Product(name="Counted in leaf %s" % i, category=leaf) for i in range(2)])
+    session.commit()
+
+    # the products of the leaf go through ON DELETE CASCADE, after the category row itself
+    session.execute(delete(Category).where(Category.id == leaf.id))
+    session.commit()
+
+    row = session.get(CategoryProductCount, category.id, populate_existing=True)
+    assert (row.direct_count, row.subtree_count) == (1, 1)
+
+
 def test_category_hierarchy_filtering(session):
     category1 = Category(name='Category 1')
     category2 = Category(name='Category 2', parent=category1)
@@ -110,3 +156,37 @@ def test_category_hierarchy_filtering(session):
     assert category2.id in category2_tree
     assert category3.id in category2_tree
     assert category4.id in category2_tree
+
+
+def test_category_product_counts(session):
+    category1 = Category(name='Counted category 1')
+    category2 = Category(name='Counted category 2', parent=category1)
+    category3 = Category(name='Counted category 3')
+    product1 = Product(name="Counted product 1", category=category1)
+    product2 = Product(name="Counted product 2", category=category2)
+    product3 = Product(name="Counted product 3", category=category2, is_active=False)
+
+    session.add_all([category1, category2, category3, product1, product2, product3])
+    session.commit()
+
+    def counts(category):
+        row = session.get(CategoryProductCount, category.id, populate_existing=True)
+        return row.direct_count, row.subtree_count
+
+    assert counts(category1) == (1, 2)
+    assert counts(category2) == (1, 1)
+    assert counts(category3) == (0, 0)
+
+    product3.is_active = True
+    product1.category = category3
+    session.commit()
+
+    assert counts(category1) == (0, 2)
+    assert counts(category2) == (2, 2)
+    assert counts(category3) == (1, 1)
+
+    session.delete(product2)
+    session.commit()
+
+    assert counts(category1) == (0, 1)
+    assert counts(category2) == (1, 1)
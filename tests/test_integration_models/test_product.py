@@ -1,6 +1,10 @@
-from sqlalchemy import delete
+from datetime import datetime
 
-from db.models import Category, Product, ProductInventory
+from sqlalchemy import delete, insert, update, select, func
+
+from crud.inventory import inventory_reserve_query, inventory_restock_query
+from db.models import Category, Customer, Tag, Product, ProductImage, ProductInventory, ProductRating, ProductReview, \
+    InventoryReservation, InventoryReservationItem
 
 
 def test_product_create(session):
@@ -63,3 +67,150 @@ def test_product_delete(session):
 
     query = session.query(Product).where(Product.id == product.id).first()
     assert query is None
+
+
+def test_product_rating_aggregates(session):
+    category = Category(name="Test rated product category")
+    product1 = Product(category=category, name="Rated product 1", made_in="China")
+    product2 = Product(category=category, name="Rated product 2", made_in="China")
+    customer = Customer(email="rater@example.com", fullname="Rater")
+    session.add_all([category, product1, product2, customer])
+    session.commit()
+
+    # a multi-row insert fires the statement level trigger once for the whole batch
+    session.execute(insert(ProductReview), [
+        {"product_id": product1.id, "customer_id": customer.id, "rating": 4},
+        {"product_id": product1.id, "customer_id": customer.id, "rating": 2},
+        {"product_id": product2.id, "customer_id": customer.id, "rating": 5},
+    ])
+    session.commit()
+
+    def rating(product):
+        row = session.get(ProductRating, product.id, populate_existing=True)
+        return row.reviews_count, row.rating_sum
+
+    assert rating(product1) == (2, 6)
+    assert rating(product2) == (1, 5)
+
+    session.execute(update(ProductReview).where(ProductReview.product_id == product2.id).values(rating=3))
+    session.execute(delete(ProductReview).where(ProductReview.product_id == product1.id, ProductReview.rating == 2))
+    session.commit()
+
+    assert rating(product1) == (1, 4)
+    assert rating(product2) == (1, 3)
+
+    # rewrites that keep product and rating, like the author_name sync, leave the aggregates alone
+    session.execute(update(ProductReview).where(ProductReview.customer_id == customer.id).values(author_name="Renamed"))
+    session.execute(update(ProductReview).where(ProductReview.product_id == product2.id).values(product_id=product1.id))
+    session.commit()
+
+    assert rating(product1) == (2, 7)
+    assert rating(product2) == (0, 0)
+
+
+def test_inventory_reservation_queries(session):
+    category = Category(name="Test reserved product category")
+    product = Product(category=category, name="Reserved product", made_in="China")
+    inventory1 = ProductInventory(product=product, quantity=5, unit_price=5.0)
+    inventory2 = ProductInventory(product=product, quantity=1, unit_price=5.0)
+    session.add_all([category, product, inventory1, inventory2])
+    session.commit()
+
+    reserved = session.execute(inventory_reserve_query({inventory1.id: 3, inventory2.id: 2})).scalars().all()
+    assert reserved == [inventory1.id]
+    session.rollback()
+
+    reserved = session.execute(inventory_reserve_query({inventory1.id: 3, inventory2.id: 1})).scalars().all()
+    assert sorted(reserved) == sorted([inventory1.id, inventory2.id])
+    reservation = InventoryReservation(status="held", expires_at=datetime.utcnow())
+    reservation.items.extend([
+        InventoryReservationItem(inventory_id=inventory1.id, quantity=3),
+        InventoryReservationItem(inventory_id=inventory2.id, quantity=1),
+    ])
+    session.add(reservation)
+    session.commit()
+    session.refresh(inventory1)
+    session.refresh(inventory2)
+
+    assert inventory1.quantity == 2
+    assert inventory2.quantity == 0
+
+    session.execute(inventory_restock_query([reservation.id]))
+    session.commit()
+    session.refresh(inventory1)
+    session.refresh(inventory2)
+
+    assert inventory1.quantity == 5
+    assert inventory2.quantity == 1
+
+
+def test_product_search_document(session):
+    def found(term):
+        query = select(Product.id).where(Product.search_document.op("@@")(func.websearch_to_tsquery("english", term)))
+        return product.id in set(session.execute(query).scalars())
+
+    shoes = Category(name="Shoes")
+    sneakers = Category(name="Sneakers", parent=shoes)
+    product = Product(category=sneakers, name="Runner 2", description="Light mesh upper")
+    session.add_all([shoes, sneakers, product])
+    session.commit()
+    assert found("runner") and found("shoes sneakers") and found("mesh")
+    assert not found("red sneakers")
+
+    red = Tag(name="red")
+    product.tags.append(red)
+    session.commit()
+    assert found("red sneakers")
+
+    red.name = "crimson"
+    shoes.name = "Footwear"
+    session.commit()
+    assert found("crimson footwear") and not found("red") and not found("shoes")
+
+    product.tags.remove(red)
+    session.commit()
+    assert not found("crimson")
+
+
+def test_review_author_name(session):
+    category = Category(name="Test review author category")
+    product = Product(category=category, name="Test review author product")
+    customer = Customer(email="author@example.com", fullname="First Name")
+    review = ProductReview(product=product, customer=customer, rating=4)
+    session.add_all([category, product, customer, review])
+    session.commit()
+    assert review.author_name == "First Name"
+
+    customer.fullname = "Second Name"
+    session.commit()
+    session.refresh(review)
+    assert review.author_name == "Second Name"
+
+
+def test_product_updated_at(session):
+    category = Category(name="Test updated at category")
+    product = Product(category=category, name="Test updated at product")
+    inventory = ProductInventory(product=product, quantity=2, unit_price=5.0)
+    session.add_all([category, product, inventory])
+    session.commit()
+
+    def updated_at():
+        return session.execute(select(Product.updated_at).where(Product.id == product.id)).scalar()
+
+    versions = [updated_at()]
+
+    # still available, the detail page looks the same
+    inventory.quantity = 1
+    session.commit()
+    assert updated_at() == versions[-1]
+
+    for change in (
+        lambda: setattr(inventory, "quantity", 0),
+        lambda: setattr(inventory, "unit_price", 6.0),
+        lambda: session.add(ProductImage(product=product, image="updated_at.jpg")),
+        lambda: setattr(product, "description", "Now with a description"),
+    ):
+        change()
+        session.commit()
+        assert updated_at() > versions[-1]
+        versions.append(updated_at())
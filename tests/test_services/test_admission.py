@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from services import admission
+from services.admission import AdmissionLimiter, Overloaded, ProductsListClassifier
+
+
+def test_admission_limiter_sheds_after_queue_timeout():
+    limiter = AdmissionLimiter("list", max_concurrency=1, queue_timeout=0.01, retry_after=3)
+
+    async def scenario():
+        async with limiter.admit():
+            assert limiter.in_flight == 1
+            with pytest.raises(Overloaded) as exc_info:
+                async with limiter.admit():
+                    pass
+            assert exc_info.value.retry_after == 3
+
+        async with limiter.admit():
+            assert limiter.in_flight == 1
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
+    assert limiter.rejected == 1
+
+
+def test_admission_limiter_queues_within_deadline():
+    limiter = AdmissionLimiter("detail", max_concurrency=2, queue_timeout=1.0, retry_after=1)
+
+    async def request():
+        async with limiter.admit():
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        await asyncio.gather(*(request() for _ in range(10)))
+
+    asyncio.run(scenario())
+    assert limiter.rejected == 0
+    assert limiter.in_flight == 0
+
+
+def test_products_list_classifier():
+    classifier = ProductsListClassifier()
+    filters = {"activity": True, "category": None, "search": None, "popular": None, "discount": None}
+
+    assert classifier.shape(filters, ["-id"]) == (("activity",), ("-id",))
+    assert classifier.shape(filters, ["price", "id", "-price", "id"]) == (("activity",), ("price", "id"))
+    assert classifier.is_expensive(filters, ["id", "-new"]) is False
+    assert classifier.is_expensive({**filters, "popular": 4.0}, ["id"]) is True
+    assert classifier.is_expensive({**filters, "discount": 0.5}, ["id"]) is True
+    assert classifier.is_expensive({**filters, "search": "red sneakers"}, ["id"]) is False
+    assert classifier.is_expensive(filters, ["-popular"]) is True
+    assert classifier.is_expensive(filters, ["price"]) is True
+
+
+def test_products_list_classifier_caches_canonical_shapes(monkeypatch):
+    explained = []
+
+    async def explain(async_db, query):
+        explained.append(query)
+        return {"Total Cost": 10.0 * len(explained)}
+
+    monkeypatch.setattr(admission, "explain", explain)
+    classifier = ProductsListClassifier(cost_threshold=15.0, cache_size=2)
+    filters = {"activity": True, "popular": None}
+
+    async def scenario():
+        assert await classifier.classify(None, filters, ["id"]) == "list"
+        # repeated fields don't make a new shape
+        assert await classifier.classify(None, filters, ["id", "id", "-id"]) == "list"
+        assert len(explained) == 1
+        # unknown fields fail in the endpoint, they are never explained
+        await classifier.classify(None, filters, ["id", "nope"])
+        assert len(explained) == 1
+
+        assert await classifier.classify(None, filters, ["-new"]) == "expensive_list"
+        await classifier.classify(None, filters, ["price"])
+        assert len(classifier._costs) == 2 and classifier.shape(filters, ["id"]) not in classifier._costs
+
+    asyncio.run(scenario())
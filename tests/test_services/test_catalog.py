@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from sqlalchemy_utils import Ltree
+
+from services.catalog import CatalogEngine
+
+CREATED_AT = datetime(2024, 1, 1)
+
+
+def make_row(category_id, **values):
+    defaults = {
+        "price": 10.0, "discount_total": None, "rating": None, "is_active": True, "category_active": True,
+        "created_at": CREATED_AT
+    }
+    return SimpleNamespace(id=uuid4(), category_id=category_id, **{**defaults, **values})
+
+
+@pytest.fixture()
+def catalog():
+    root, child, other = uuid4(), uuid4(), uuid4()
+    rows = [
+        make_row(root, price=5.0, rating=4.5, discount_total=10.0),
+        make_row(child, price=20.0, rating=2.0, created_at=CREATED_AT + timedelta(days=1)),
+        make_row(child, price=15.0, discount_total=3.0, created_at=CREATED_AT + timedelta(days=2)),
+        make_row(other, price=None, rating=5.0, is_active=False, category_active=False),
+    ]
+    categories = [
+        (root, Ltree(root.hex)),
+        (child, Ltree(root.hex) + Ltree(child.hex)),
+        (other, Ltree(other.hex)),
+    ]
+    engine = CatalogEngine()
+    engine.load(rows, categories)
+    return SimpleNamespace(engine=engine, rows=rows, root=root, child=child)
+
+
+def test_catalog_engine_supports(catalog):
+    assert CatalogEngine().supports({}, ["id"]) is False
+    assert catalog.engine.supports(
+        {"activity": True, "category_active": True, "category": None, "search": None}, ["-price", "new"]
+    )
+    assert not catalog.engine.supports({"search": "shoes"}, ["id"])
+    assert not catalog.engine.supports({}, ["name"])
+
+
+def test_catalog_engine_filtering(catalog):
+    rows = catalog.rows
+    by_id = sorted(rows, key=lambda row: row.id)
+
+    assert catalog.engine.search(10, filters={}, ordering=["id"]) == [row.id for row in by_id]
+    assert catalog.engine.search(10, filters={"activity": False}) == [rows[3].id]
+    assert catalog.engine.search(10, filters={"category_active": False}) == [rows[3].id]
+    assert set(catalog.engine.search(10, filters={"category": str(catalog.root)})) == {row.id for row in rows[:3]}
+    assert set(catalog.engine.search(10, filters={"category": catalog.child})) == {rows[1].id, rows[2].id}
+    assert catalog.engine.search(10, filters={"popular": 4.0}, ordering=["id"]) == [
+        row.id for row in by_id if row in (rows[0], rows[3])
+    ]
+    assert catalog.engine.search(10, filters={"discount": 5.0}) == [rows[0].id]
+    assert len(catalog.engine.search(10, filters={"discount": 0.0})) == 4
+
+
+def test_catalog_engine_ordering(catalog):
+    rows = catalog.rows
+    # NULLs go last on ascending and first on descending orderings, as in Postgres
+    assert catalog.engine.search(10, ordering=["price"]) == [rows[0].id, rows[2].id, rows[1].id, rows[3].id]
+    assert catalog.engine.search(10, ordering=["-price"]) == [rows[3].id, rows[1].id, rows[2].id, rows[0].id]
+    assert catalog.engine.search(2, offset=1, ordering=["-new"])[0] == rows[1].id
+    assert catalog.engine.search(2, filters={"activity": True}, ordering=["-popular"]) == [rows[2].id, rows[0].id]
+    assert catalog.engine.search(1, ordering=["-discount", "price"]) == [rows[1].id]
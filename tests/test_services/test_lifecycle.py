@@ -0,0 +1,95 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+
+import config
+from routers import health
+from services.lifecycle import Lifecycle, InFlightMiddleware
+
+
+def test_drain_waits_for_in_flight_requests():
+    async def scenario():
+        lifecycle = Lifecycle()
+        lifecycle.ready = True
+        lifecycle.request_started()
+
+        drain = asyncio.create_task(lifecycle.drain(timeout=1))
+        await asyncio.sleep(0.01)
+        assert not drain.done()
+        assert not lifecycle.ready and lifecycle.draining
+
+        lifecycle.request_finished()
+        assert await drain is True
+
+    asyncio.run(scenario())
+
+
+def test_drain_gives_up_after_the_timeout():
+    lifecycle = Lifecycle()
+    lifecycle.request_started()
+
+    assert asyncio.run(lifecycle.drain(timeout=0.01)) is False
+    assert lifecycle.in_flight == 1
+
+
+def test_in_flight_middleware_counts_until_the_body_is_sent():
+    lifecycle = Lifecycle()
+    seen = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        seen.append(lifecycle.in_flight)
+        await send({"type": "http.response.body", "body": b"done"})
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=InFlightMiddleware(app, lifecycle))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            assert (await client.get("/")).text == "done"
+
+    asyncio.run(scenario())
+    assert seen == [1]
+    assert lifecycle.in_flight == 0
+
+
+def test_stop_draining_restores_readiness_until_shutdown():
+    lifecycle = Lifecycle()
+    lifecycle.ready = True
+    lifecycle.start_draining()
+    lifecycle.start_draining()
+
+    assert lifecycle.stop_draining() is True
+    assert lifecycle.ready and not lifecycle.draining
+
+    assert asyncio.run(lifecycle.drain(timeout=0.01)) is True
+    assert lifecycle.stop_draining() is False
+    assert not lifecycle.ready and lifecycle.draining
+
+
+def test_readyz_reports_starting_and_draining(monkeypatch):
+    lifecycle = Lifecycle()
+    monkeypatch.setattr(health, "lifecycle", lifecycle)
+    monkeypatch.setattr(config, "OPS_TOKEN", "secret")
+    app = FastAPI()
+    app.include_router(health.router)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            assert (await client.get("/healthz")).status_code == 200
+
+            response = await client.get("/readyz")
+            assert response.status_code == 503 and response.json()["status"] == "starting"
+
+            # the drain endpoints don't exist for callers without the token
+            assert (await client.post("/drain")).status_code == 404
+            assert (await client.post("/drain", headers={"X-Ops-Token": "guess"})).status_code == 404
+
+            assert (await client.post("/drain", headers={"X-Ops-Token": "secret"})).status_code == 202
+            response = await client.get("/readyz")
+            assert response.status_code == 503 and response.json()["status"] == "draining"
+
+            assert (await client.post("/undrain", headers={"X-Ops-Token": "secret"})).status_code == 200
+            response = await client.get("/readyz")
+            assert response.status_code == 503 and response.json()["status"] == "starting"
+
+    asyncio.run(scenario())
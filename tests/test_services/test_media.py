@@ -0,0 +1,59 @@
+import io
+from uuid import uuid4
+
+import pytest
+from PIL import Image
+
+from config import MEDIA_VARIANTS
+from services import media
+
+
+def _png(size=(2000, 1000), color=(200, 30, 30)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_variant_url_of_uploaded_image():
+    digest = "ab" + "c" * 62
+
+    assert media.variant_url(media.media_key(digest), "thumbnail") == "/media/thumbnail/ab/cc/%s.webp" % digest
+
+
+def test_variant_url_keeps_legacy_paths():
+    assert media.variant_url("images/product.jpg", "detail") == "images/product.jpg"
+    assert media.variant_url("", "detail") == ""
+
+
+def test_render_variants_stores_original_and_bounded_variants(tmp_path):
+    content = _png()
+    digest = media.digest_of(content)
+
+    width, height, content_type = media.render_variants(content, digest, tmp_path)
+
+    assert (width, height, content_type) == (2000, 1000, "image/png")
+    assert media.original_path(digest, tmp_path).read_bytes() == content
+    for variant, (max_width, max_height) in MEDIA_VARIANTS.items():
+        with Image.open(media.variant_path(digest, variant, tmp_path)) as rendered:
+            assert rendered.format == "WEBP"
+            assert rendered.width <= max_width and rendered.height <= max_height
+            assert rendered.width == 2 * rendered.height
+
+
+def test_render_variants_rejects_non_images(tmp_path):
+    with pytest.raises(ValueError):
+        media.render_variants(b"not an image", "0" * 64, tmp_path)
+    assert not list(tmp_path.iterdir())
+
+
+def test_product_schemas_serve_variants():
+    from schemas import ShortProductSchema, ProductDetailSchema, sparse_schema
+
+    key = media.media_key("ab" + "c" * 62)
+    short = sparse_schema(ShortProductSchema, frozenset({"id", "image"}))(id=uuid4(), image=key)
+    detail = sparse_schema(ProductDetailSchema, frozenset({"id", "images"}))(
+        id=uuid4(), images=[key, "images/legacy.jpg"]
+    )
+
+    assert short.image == media.variant_url(key, "thumbnail")
+    assert detail.images == [media.variant_url(key, "detail"), "images/legacy.jpg"]
@@ -0,0 +1,20 @@
+import asyncio
+
+from crud.pagination import paginate
+
+
+def test_paginate_has_more():
+    page = asyncio.run(paginate(None, None, rows=[1, 2, 3], limit=2))
+
+    assert page == {"rows": [1, 2], "has_more": True, "total": None, "total_estimated": False}
+
+
+def test_paginate_total_of_the_last_page_needs_no_count():
+    # async_db and query are never touched: the rows of the last page already tell the total
+    page = asyncio.run(paginate(None, None, rows=[1, 2], limit=5, offset=10, total="exact"))
+
+    assert page["has_more"] is False
+    assert (page["total"], page["total_estimated"]) == (12, False)
+
+    page = asyncio.run(paginate(None, None, rows=[], limit=5, offset=0, total="auto"))
+    assert (page["total"], page["total_estimated"]) == (0, False)
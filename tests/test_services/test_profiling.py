@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+
+import httpx
+from fastapi import APIRouter, FastAPI
+
+from services.profiling import (
+    RequestProfile, ProfilingMiddleware, ProfiledRoute, StackSampler, current_profile, stage
+)
+
+
+def profiled_app(tmp_path, **kwargs) -> FastAPI:
+    router = APIRouter(route_class=ProfiledRoute)
+
+    @router.get("/items")
+    async def items():
+        with stage("build"):
+            time.sleep(0.005)
+        with stage("fetch"):
+            await asyncio.sleep(0.005)
+        return [{"id": i} for i in range(3)]
+
+    app = FastAPI()
+    app.include_router(router)
+    app.add_middleware(ProfilingMiddleware, output_dir=tmp_path, interval=0.001, **kwargs)
+    return app
+
+
+def get(app: FastAPI, headers: dict = None) -> httpx.Response:
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/items", headers=headers)
+
+    return asyncio.run(scenario())
+
+
+def test_request_profile_counts_every_moment_once():
+    profile = RequestProfile()
+    with profile.stage("fetch"):
+        time.sleep(0.01)
+        with profile.stage("execute"):
+            time.sleep(0.02)
+
+    milliseconds = profile.milliseconds()
+    assert 10 <= milliseconds["fetch"] < 20
+    assert milliseconds["execute"] >= 20
+    assert profile.current() == "other"
+
+    # a stage left by an error also closes what was opened inside it
+    depth = profile.enter("fetch")
+    profile.enter("compile")
+    profile.leave(depth)
+    assert profile.current() == "other"
+
+
+def test_stage_is_a_no_op_outside_a_profiled_request():
+    assert current_profile.get() is None
+    with stage("build"), stage("fetch"):
+        pass
+
+
+def test_profiling_requires_the_token(tmp_path):
+    app = profiled_app(tmp_path, token="secret", sample_rate=0)
+
+    assert "server-timing" not in get(app).headers
+    assert "server-timing" not in get(app, {"X-Profile": "guess"}).headers
+
+    response = get(app, {"X-Profile": "secret"})
+    assert response.json() == [{"id": 0}, {"id": 1}, {"id": 2}]
+    stages = {part.split(";")[0] for part in response.headers["server-timing"].split(", ")}
+    assert {"build", "fetch", "endpoint", "validate", "serialize"} <= stages
+
+    folded = (tmp_path / ("%s.folded" % response.headers["x-profile-id"])).read_text()
+    for line in folded.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert stack and int(count) > 0
+
+
+def test_sampled_requests_get_stages_without_a_stack_profile(tmp_path):
+    app = profiled_app(tmp_path, token=None, sample_rate=1.0)
+
+    response = get(app, {"X-Profile": "anything"})
+    assert "fetch;dur=" in response.headers["server-timing"]
+    assert "x-profile-id" not in response.headers
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_stack_sampler_folds_the_stacks_of_a_thread():
+    def busy():
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+
+    sampler = StackSampler(threading.get_ident(), interval=0.001)
+    sampler.start()
+    busy()
+    sampler.stop()
+
+    assert any(stack.endswith("busy") for stack in sampler.stacks)
+    assert sampler.folded().splitlines()[0].rsplit(" ", 1)[1].isdigit()
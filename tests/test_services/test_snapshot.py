@@ -0,0 +1,90 @@
+import asyncio
+from types import SimpleNamespace
+from uuid import uuid4
+
+import numpy as np
+import pytest
+from sqlalchemy_utils import Ltree
+
+from services.catalog import CatalogEngine
+from services import snapshot as snapshot_service
+from services.snapshot import attach_catalog_snapshot, read_catalog_snapshot, write_catalog_snapshot
+
+
+def make_catalog(size: int):
+    category_id = uuid4()
+    rows = [
+        SimpleNamespace(
+            id=uuid4(), category_id=category_id, is_active=True, category_active=True, price=float(i),
+            discount_total=None, rating=None, created_at=None
+        )
+        for i in range(size)
+    ]
+    return rows, [(category_id, Ltree(category_id.hex))]
+
+
+def test_catalog_snapshot_roundtrip(tmp_path):
+    rows, categories = make_catalog(100)
+    columns, category_hierarchies = CatalogEngine.build_columns(rows, categories)
+    path = tmp_path / "catalog.snapshot"
+
+    version = write_catalog_snapshot(path, columns, category_hierarchies)
+    snapshot = read_catalog_snapshot(path)
+
+    assert snapshot.version == version
+    assert snapshot.category_hierarchies == category_hierarchies
+    assert snapshot.columns.keys() == columns.keys()
+    for name, array in columns.items():
+        np.testing.assert_array_equal(snapshot.columns[name], array)
+        assert snapshot.columns[name].flags.writeable is False
+
+    engine = CatalogEngine()
+    engine.attach(snapshot.columns, snapshot.category_hierarchies)
+    assert engine.search(3, filters={"category": categories[0][0]}, ordering=["-price"]) == [
+        row.id for row in rows[:-4:-1]
+    ]
+
+
+def test_catalog_snapshot_replace(tmp_path):
+    path = tmp_path / "catalog.snapshot"
+    write_catalog_snapshot(path, *CatalogEngine.build_columns(*make_catalog(10)), version=1)
+    old_snapshot = read_catalog_snapshot(path)
+
+    write_catalog_snapshot(path, *CatalogEngine.build_columns(*make_catalog(0)), version=2)
+    new_snapshot = read_catalog_snapshot(path)
+
+    assert new_snapshot.version == 2
+    assert new_snapshot.inode != old_snapshot.inode
+    assert len(new_snapshot.columns["ids"]) == 0
+    # the replaced file stays mapped for readers still holding the old columns
+    assert len(old_snapshot.columns["ids"]) == 10
+
+
+def test_catalog_snapshot_invalid_file(tmp_path):
+    path = tmp_path / "catalog.snapshot"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        read_catalog_snapshot(path)
+
+
+def test_attach_rebuilds_a_fresh_snapshot_it_cannot_serve(tmp_path, monkeypatch):
+    rows, categories = make_catalog(5)
+
+    async def fetch_catalog(session_manager):
+        return rows, categories
+
+    monkeypatch.setattr(snapshot_service, "fetch_catalog", fetch_catalog)
+    path = tmp_path / "catalog.snapshot"
+    columns, category_hierarchies = CatalogEngine.build_columns(rows, categories)
+    # a file of an older release, without the category_active column
+    columns.pop("category_active")
+    write_catalog_snapshot(path, columns, category_hierarchies, version=1)
+
+    engine = CatalogEngine()
+    asyncio.run(attach_catalog_snapshot(None, path, engine))
+    assert read_catalog_snapshot(path).version != 1
+    assert len(engine.search(10, filters={"category_active": True})) == 5
+
+    path.write_bytes(b"\0" * 64)
+    asyncio.run(attach_catalog_snapshot(None, path, engine))
+    assert read_catalog_snapshot(path).columns.keys() == snapshot_service.SNAPSHOT_COLUMNS
@@ -0,0 +1,45 @@
+import json
+from types import SimpleNamespace
+from uuid import uuid4
+
+from sqlalchemy import create_engine, literal, select
+
+from schemas import ShortProductSchema, ProductDetailSchema, sparse_schema, sparse_response
+
+
+def test_sparse_response_only_serializes_requested_fields():
+    row = SimpleNamespace(id=uuid4(), name="product", price=10.5)
+
+    response = sparse_response(ShortProductSchema, frozenset({"name", "price"}), [row], many=True)
+
+    assert json.loads(response.body) == [{"id": str(row.id), "name": "product", "price": 10.5}]
+
+
+def test_sparse_response_serializes_result_rows():
+    product_id = uuid4()
+    engine = create_engine("sqlite://")
+    with engine.connect() as connection:
+        rows = connection.execute(
+            select(literal(str(product_id)).label("id"), literal("product").label("name"), literal(3).label("price"))
+        ).all()
+
+    response = sparse_response(ShortProductSchema, frozenset({"name"}), rows, many=True)
+
+    assert json.loads(response.body) == [{"id": str(product_id), "name": "product"}]
+
+
+def test_sparse_response_single_object_with_nested_fields():
+    row = SimpleNamespace(
+        id=uuid4(),
+        inventories=[{"id": str(uuid4()), "availability": True, "unit_price": 1.0, "discount": None, "meta": None}]
+    )
+
+    body = json.loads(sparse_response(ProductDetailSchema, frozenset({"inventories"}), row).body)
+
+    assert set(body) == {"id", "inventories"}
+    assert body["inventories"][0]["availability"] is True
+
+
+def test_sparse_schema_is_cached():
+    assert sparse_schema(ShortProductSchema, frozenset({"id", "name"})) is \
+        sparse_schema(ShortProductSchema, frozenset({"name", "id"}))
@@ -0,0 +1,52 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy.engine.interfaces import CacheStats
+
+import config
+from routers import health
+from services.statement_metrics import StatementMetrics
+
+
+def _execute(metrics: StatementMetrics, statement: str, prepared: dict, cache_hit: CacheStats) -> None:
+    connection = SimpleNamespace(connection=SimpleNamespace(
+        dbapi_connection=SimpleNamespace(_prepared_statement_cache=prepared)
+    ))
+    context = SimpleNamespace(cache_hit=cache_hit)
+    metrics._before_cursor_execute(connection, None, statement, (), context, False)
+    prepared[statement] = object()
+    metrics._after_cursor_execute(connection, None, statement, (), context, False)
+
+
+def test_statement_metrics_count_cache_hits():
+    metrics = StatementMetrics()
+    prepared = {}
+
+    _execute(metrics, "SELECT p.id FROM product AS p WHERE p.id = $1", prepared, CacheStats.CACHE_MISS)
+    _execute(metrics, "SELECT p.id FROM product AS p WHERE p.id = $1", prepared, CacheStats.CACHE_HIT)
+    _execute(metrics, "SELECT p.id FROM product AS p WHERE p.id = $1", prepared, CacheStats.CACHE_HIT)
+    _execute(metrics, "SELECT 1", prepared, CacheStats.NO_CACHE_KEY)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["compiled_cache"] == {"hit": 2, "miss": 1, "hit_rate": 2 / 3}
+    assert snapshot["prepared_cache"] == {"hit": 2, "miss": 2, "hit_rate": 0.5}
+    assert snapshot["mean_execute_ms"]["hit"] is not None
+
+
+def test_statements_endpoint_needs_the_token_and_a_bounded_limit(monkeypatch):
+    monkeypatch.setattr(config, "OPS_TOKEN", "secret")
+    app = FastAPI()
+    app.include_router(health.router)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            assert (await client.get("/metrics/statements")).status_code == 404
+            for limit in (0, 10_000):
+                response = await client.get(
+                    "/metrics/statements", params={"limit": limit}, headers={"X-Ops-Token": "secret"}
+                )
+                assert response.status_code == 422
+
+    asyncio.run(scenario())
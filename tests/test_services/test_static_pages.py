@@ -0,0 +1,44 @@
+from collections import namedtuple
+from decimal import Decimal
+from uuid import uuid4
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import schemas
+from services.static_pages import (
+    SnapshotWriter, category_page_url, detail_url, load_manifest, render, _detail_adapter
+)
+
+DetailRow = namedtuple("DetailRow", "id name category_id made_in description images inventories")
+
+
+def test_render_matches_the_api_response():
+    row = DetailRow(
+        uuid4(), "Café table", uuid4(), None, None, ["table.jpg"],
+        [{"id": str(uuid4()), "meta": {"color": "oak"}, "availability": True, "unit_price": Decimal("9.900"),
+          "discount": None}]
+    )
+    expected = JSONResponse(jsonable_encoder(schemas.ProductDetailSchema.model_validate(row, from_attributes=True)))
+    assert render(_detail_adapter, row) == expected.body
+
+
+def test_snapshot_writer_only_writes_changes(tmp_path):
+    product_id, category_id = uuid4(), uuid4()
+
+    writer = SnapshotWriter(tmp_path, load_manifest(tmp_path))
+    writer.write(detail_url(product_id), b'{"name":"a"}', version="1")
+    writer.write(category_page_url(category_id), b"[]")
+    assert writer.changed == [detail_url(product_id), category_page_url(category_id)]
+    assert (tmp_path / "products" / str(product_id) / "detail.json").read_bytes() == b'{"name":"a"}'
+    assert (tmp_path / "products" / "category" / ("%s.json" % category_id)).read_bytes() == b"[]"
+
+    writer = SnapshotWriter(tmp_path, {"files": writer.files})
+    assert writer.is_current(detail_url(product_id), "1")
+    assert not writer.is_current(detail_url(product_id), "2")
+    writer.write(category_page_url(category_id), b"[]")
+    assert writer.changed == []
+
+    # the product is gone from the snapshot
+    assert writer.remove_stale() == [detail_url(product_id)]
+    assert not (tmp_path / "products" / str(product_id) / "detail.json").exists()
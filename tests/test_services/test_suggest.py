@@ -0,0 +1,68 @@
+from uuid import uuid4
+
+from services.suggest import PrefixIndex, Suggestion
+
+
+def make_suggestion(name: str, weight: int = 0, kind: str = "product"):
+    return Suggestion(id=uuid4(), name=name, kind=kind, weight=weight)
+
+
+def test_prefix_index_search():
+    index = PrefixIndex(max_results=3)
+    red_sneakers = make_suggestion("Red Sneakers", weight=5)
+    sneakers = make_suggestion("sneakers", weight=10)
+    shoes = make_suggestion("Shoes", weight=1, kind="category")
+    index.build([red_sneakers, sneakers, shoes])
+
+    assert len(index) == 3
+    assert index.search("sne") == [sneakers, red_sneakers]
+    assert index.search("  RED  sn") == [red_sneakers]
+    assert index.search("s") == [sneakers, red_sneakers, shoes]
+    assert index.search("s", limit=1) == [sneakers]
+    assert index.search("boots") == []
+    assert index.search("") == []
+
+
+def test_prefix_index_add_and_remove():
+    index = PrefixIndex(max_results=5, scan_limit=0)
+    product = make_suggestion("Blue jacket", weight=1)
+    index.build([product])
+    assert index.search("j") == [product]
+
+    new_product = make_suggestion("Jeans", weight=2)
+    index.add(new_product)
+    assert index.search("j") == [new_product, product]
+
+    renamed = new_product._replace(name="Shorts")
+    index.add(renamed)
+    assert index.search("j") == [product]
+    assert index.search("sh") == [renamed]
+    assert len(index) == 2
+
+    index.remove("product", product.id)
+    assert index.search("j") == []
+    assert index.search("blue") == []
+    index.remove("product", product.id)
+
+
+
+def test_prefix_index_ranked_prefixes_survive_refreshes():
+    index = PrefixIndex(max_results=2, scan_limit=2)
+    products = [make_suggestion("sneakers %s" % i, weight=i) for i in range(5)]
+    shoes = make_suggestion("Red shoes", weight=3, kind="category")
+    index.build([*products, shoes])
+    # every prefix matching more than two keys is ranked by build, from the prefixes under it
+    assert set(index._top) == {"s", "sn", "sne", "snea", "sneak", "sneake", "sneaker", "sneakers", "sneakers "}
+    for prefix in ("s", "sn", "sh", "r", "re", "sneakers "):
+        assert index.search(prefix) == index._best(index._entries[slice(*index._range(prefix))])
+
+    heavy = make_suggestion("Sandals", weight=10)
+    index.add(heavy)
+    # merged into the ranked results rather than dropped, nothing has to be scanned again
+    assert index._top["s"] == [heavy, products[4]]
+    assert index.search("sa") == [heavy]
+
+    index.remove("product", heavy.id)
+    # ties go by name
+    assert index.search("s") == [products[4], shoes]
+    assert index.search("sa") == []
@@ -6,7 +6,8 @@ from sqlalchemy.orm import aliased
 
 from db.models import Category
 from db.strategies.categories import CategorySelectStrategy, CategoryDeactivatedFilteringStrategy, \
-    CategoryLevelFilteringStrategy, CategoryHierarchyFilteringStrategy
+    CategoryLevelFilteringStrategy, CategoryHierarchyFilteringStrategy, CategorySuggestSelectStrategy, \
+    CategoryEffectivelyActiveFilteringStrategy, CategoryWithCountsSelectStrategy
 from tests.test_strategies.utils import normalize_sql
 
 
@@ -14,15 +15,44 @@ def test_category_select_strategy():
     strategy = CategorySelectStrategy(aliased(Category, name="c"))
     query = strategy.select()
 
+    expected_sql = "SELECT c.id, c.name, c.parent_id AS parent, c.depth AS level FROM category AS c"
+    assert normalize_sql(str(query)) == expected_sql
+
+
+def test_category_with_counts_select_strategy():
+    strategy = CategoryWithCountsSelectStrategy(aliased(Category, name="c"))
+    query = strategy.select()
+
+    expected_sql = normalize_sql(
+        """
+        SELECT 
+            c.id, 
+            c.name, 
+            c.parent_id AS parent, 
+            c.depth AS level, 
+            category_product_count.direct_count AS product_count, 
+            category_product_count.subtree_count AS subtree_product_count 
+        FROM category AS c 
+        LEFT OUTER JOIN category_product_count ON category_product_count.category_id = c.id
+        """
+    )
+    assert normalize_sql(str(query)) == expected_sql
+
+
+def test_category_suggest_select_strategy():
+    strategy = CategorySuggestSelectStrategy(aliased(Category, name="c"))
+    query = strategy.select()
+
     expected_sql = normalize_sql(
         """
         SELECT 
             c.id, 
             c.name, 
-            category.id AS parent, 
-            nlevel(c.hierarchy) AS level 
+            count(product.id) FILTER (WHERE product.is_active IS true) AS weight 
         FROM category AS c 
-        LEFT OUTER JOIN category ON category.hierarchy = subpath(c.hierarchy, :subpath_1, :subpath_2)
+        LEFT OUTER JOIN product ON c.id = product.category_id 
+        GROUP BY 
+            c.id
         """
     )
     assert normalize_sql(str(query)) == expected_sql
@@ -49,13 +79,28 @@ def test_category_deactivated_filtering_strategy():
         strategy.filter("1")
 
 
+def test_category_effectively_active_filtering_strategy():
+    strategy = CategoryEffectivelyActiveFilteringStrategy(
+        query=select(Category.id),
+        alias=aliased(Category, name="c")
+    )
+
+    query = strategy.filter(True)
+    expected_sql = "SELECT category.id FROM category, category AS c WHERE c.effectively_active IS true"
+    assert normalize_sql(str(query)) == expected_sql
+
+    with pytest.raises(AssertionError):
+        strategy.filter(None)
+        strategy.filter(1)
+
+
 def test_category_level_filtering_strategy():
     strategy = CategoryLevelFilteringStrategy(
         query=select(Category.id),
         alias=aliased(Category, name="c")
     )
     query = strategy.filter(1)
-    expected_sql = "SELECT category.id FROM category, category AS c WHERE nlevel(c.hierarchy) = :nlevel_1"
+    expected_sql = "SELECT category.id FROM category, category AS c WHERE c.depth = :depth_1"
     assert normalize_sql(str(query)) == expected_sql
 
     with pytest.raises(AssertionError):
@@ -71,27 +116,19 @@ def test_category_hierarchy_filtering_strategy():
         query=select(category_alias.id),
         alias=category_alias
     )
-    query = strategy.filter({"descendants": True, "category_id": "some-category-id"})
-    expected_sql = normalize_sql(
-        """
-        SELECT 
-            c.id 
-        FROM category AS c 
-        WHERE 
-            (c.hierarchy <@ (SELECT category.hierarchy FROM category WHERE category.id = :id_1 LIMIT :param_1)) 
-            AND c.id != :id_2
-        """
-    )
+    query = strategy.filter({"descendants": True, "category_id": str(uuid4())})
+    expected_sql = "SELECT c.id FROM category AS c WHERE c.hierarchy ~ CAST(:param_1 AS LQUERY)"
     assert normalize_sql(str(query)) == expected_sql
 
-    query = strategy.filter({"descendants": False, "category_id": "some-category-id"})
+    query = strategy.filter({"descendants": False, "category_id": str(uuid4())})
     expected_sql = normalize_sql(
         """
         SELECT 
             c.id 
         FROM category AS c 
         WHERE 
-            (c.hierarchy @> (SELECT category.hierarchy FROM category WHERE category.id = :id_1 LIMIT :param_1)) 
+            c.id = any((SELECT CAST(string_to_array(ltree2text(category.hierarchy), :string_to_array_2) AS ARRAY) 
+                        AS string_to_array_1 FROM category WHERE category.id = :id_1)) 
             AND c.id != :id_2
         """
     )
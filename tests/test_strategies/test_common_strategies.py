@@ -1,10 +1,14 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
 import pytest
 from sqlalchemy import select
 from sqlalchemy.orm import aliased
 
 from db.models import Product
 from db.strategies.common import (
-    NameSearchFilteringStrategy, IDFilteringStrategy, IDOrderingStrategy, CreatedOrderingStrategy
+    NameSearchFilteringStrategy, IDFilteringStrategy, IDOrderingStrategy, CreatedOrderingStrategy,
+    CreatedAfterFilteringStrategy, IDInFilteringStrategy, CreatedWithinFilteringStrategy
 )
 from tests.test_strategies.utils import normalize_sql
 
@@ -52,6 +56,22 @@ def test_id_filtering_strategy():
     assert normalize_sql(str(query)) == expected_sql
 
 
+def test_id_in_filtering_strategy():
+    product_alias = aliased(Product, name="p")
+
+    strategy = IDInFilteringStrategy(
+        query=select(product_alias.id),
+        alias=product_alias
+    )
+    query = strategy.filter([uuid4(), uuid4()])
+
+    expected_sql = "SELECT p.id FROM product AS p WHERE p.id = ANY (:ids)"
+    assert normalize_sql(str(query)) == expected_sql
+
+    with pytest.raises(AssertionError):
+        strategy.filter("some string id")
+
+
 def test_id_ordering_strategy():
     product_alias = aliased(Product, name="p")
 
@@ -100,3 +120,40 @@ def test_created_ordering_strategy():
         strategy.sort(None)
         strategy.sort(False)
         strategy.sort("some random value")
+
+
+def test_created_after_filtering_strategy():
+    product_alias = aliased(Product, name="p")
+
+    strategy = CreatedAfterFilteringStrategy(
+        query=select(product_alias.id),
+        alias=product_alias
+    )
+    query = strategy.filter(datetime.utcnow())
+
+    expected_sql = "SELECT p.id FROM product AS p WHERE p.created_at > :created_at_1"
+    assert normalize_sql(str(query)) == expected_sql
+
+    with pytest.raises(AssertionError):
+        strategy.filter(None)
+        strategy.filter("2024-01-01")
+        strategy.filter(1)
+
+
+def test_created_within_filtering_strategy():
+    product_alias = aliased(Product, name="p")
+
+    strategy = CreatedWithinFilteringStrategy(
+        query=select(product_alias.id),
+        alias=product_alias
+    )
+    query = strategy.filter(timedelta(days=7))
+
+    expected_sql = "SELECT p.id FROM product AS p WHERE p.created_at >= now() - :created_within"
+    assert normalize_sql(str(query)) == expected_sql
+    assert query.compile().params == {"created_within": timedelta(days=7)}
+
+    with pytest.raises(AssertionError):
+        strategy.filter(None)
+    with pytest.raises(AssertionError):
+        strategy.filter(7)
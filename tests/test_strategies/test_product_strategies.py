@@ -10,7 +10,9 @@ from db.strategies.products import (
     ProductActivityFilteringStrategy, ProductCategoryFilteringStrategy,
     ProductPopularFilteringStrategy, ProductDiscountFilteringStrategy,
     ProductPopularOrderingStrategy, ProductDiscountOrderingStrategy,
-    ProductPriceOrderingStrategy
+    ProductPriceOrderingStrategy, ProductSuggestSelectStrategy, ProductCatalogSelectStrategy,
+    ProductCategoryActiveFilteringStrategy, ProductAttributesFilteringStrategy, ProductSearchFilteringStrategy,
+    ProductArrivedBeforeFilteringStrategy, inventory_totals, review_totals
 )
 from tests.test_strategies.utils import normalize_sql
 
@@ -26,17 +28,107 @@ def test_product_list_select_strategy():
             p.name, 
             p.category_id, 
             p.made_in, 
-            max(product_image.image) AS image, 
-            max(product_inventory.unit_price) AS price, 
-            max(product_inventory.discount) AS discount, 
-            coalesce(avg(product_reviews.rating), :coalesce_1) AS avg_rating, 
-            count(product_reviews.id) AS reviews_count 
+            p.primary_image AS image, 
+            inv.price, 
+            inv.discount, 
+            coalesce(rv.rating_sum / CAST(nullif(rv.reviews_count, :nullif_1) AS FLOAT), :coalesce_1) AS avg_rating, 
+            coalesce(rv.reviews_count, :coalesce_2) AS reviews_count 
         FROM product AS p 
-        LEFT OUTER JOIN product_image ON p.id = product_image.product_id 
-        LEFT OUTER JOIN product_inventory ON p.id = product_inventory.product_id 
-        LEFT OUTER JOIN product_reviews ON p.id = product_reviews.product_id 
-        GROUP BY 
-            p.id
+        LEFT OUTER JOIN (
+            SELECT 
+                product_inventory.product_id AS product_id, 
+                max(product_inventory.unit_price) AS price, 
+                max(product_inventory.discount) AS discount, 
+                sum(product_inventory.discount) AS discount_total 
+            FROM product_inventory 
+            GROUP BY product_inventory.product_id
+        ) AS inv ON inv.product_id = p.id 
+        LEFT OUTER JOIN product_rating AS rv ON rv.product_id = p.id
+        """
+    )
+    assert normalize_sql(str(query)) == expected_sql
+
+    # nothing to join
+    strategy = ProductListSelectStrategy(alias=aliased(Product, name="p"), fields=["name"])
+    query = strategy.select()
+
+    expected_sql = "SELECT p.id, p.name FROM product AS p"
+    assert normalize_sql(str(query)) == expected_sql
+
+
+def test_product_list_select_strategy_fields():
+    strategy = ProductListSelectStrategy(alias=aliased(Product, name="p"), fields=["name", "image", "price"])
+    query = strategy.select()
+
+    expected_sql = normalize_sql(
+        """
+        SELECT 
+            p.id, 
+            p.name, 
+            p.primary_image AS image, 
+            inv.price 
+        FROM product AS p 
+        LEFT OUTER JOIN (
+            SELECT 
+                product_inventory.product_id AS product_id, 
+                max(product_inventory.unit_price) AS price, 
+                max(product_inventory.discount) AS discount, 
+                sum(product_inventory.discount) AS discount_total 
+            FROM product_inventory 
+            GROUP BY product_inventory.product_id
+        ) AS inv ON inv.product_id = p.id
+        """
+    )
+    assert normalize_sql(str(query)) == expected_sql
+
+    # a join an ordering relies on stays even when none of its columns are selected
+    strategy = ProductListSelectStrategy(alias=aliased(Product, name="p"), fields=["name"], joins=["reviews"])
+    query = strategy.select()
+
+    expected_sql = normalize_sql(
+        """
+        SELECT 
+            p.id, 
+            p.name 
+        FROM product AS p 
+        LEFT OUTER JOIN product_rating AS rv ON rv.product_id = p.id
+        """
+    )
+    assert normalize_sql(str(query)) == expected_sql
+
+
+def test_product_catalog_select_strategy():
+    strategy = ProductCatalogSelectStrategy(alias=aliased(Product, name="p"))
+    query = strategy.select()
+
+    expected_sql = normalize_sql(
+        """
+        SELECT 
+            p.id, 
+            p.name, 
+            p.category_id, 
+            p.made_in, 
+            p.primary_image AS image, 
+            inv.price, 
+            inv.discount, 
+            coalesce(rv.rating_sum / CAST(nullif(rv.reviews_count, :nullif_1) AS FLOAT), :coalesce_1) AS avg_rating, 
+            coalesce(rv.reviews_count, :coalesce_2) AS reviews_count, 
+            p.is_active, 
+            p.category_active, 
+            p.created_at, 
+            inv.discount_total, 
+            rv.rating_sum / CAST(nullif(rv.reviews_count, :nullif_1) AS FLOAT) AS rating 
+        FROM product AS p 
+        LEFT OUTER JOIN (
+            SELECT 
+                product_inventory.product_id AS product_id, 
+                max(product_inventory.unit_price) AS price, 
+                max(product_inventory.discount) AS discount, 
+                sum(product_inventory.discount) AS discount_total 
+            FROM product_inventory 
+            GROUP BY product_inventory.product_id
+        ) AS inv ON inv.product_id = p.id 
+        LEFT OUTER JOIN product_rating AS rv ON rv.product_id = p.id
         """
     )
     assert normalize_sql(str(query)) == expected_sql
@@ -54,26 +146,64 @@ def test_product_detail_select_strategy():
             p.category_id, 
             p.made_in, 
             p.description, 
-            coalesce(array_agg(distinct(product_image.image)), :coalesce_1) AS images, 
             coalesce(
-                array_agg(
-                    distinct(
+                (
+                    SELECT array_agg(product_image.image ORDER BY product_image.position, product_image.id) AS array_agg_1 
+                    FROM product_image 
+                    WHERE product_image.product_id = p.id
+                ), :coalesce_1
+            ) AS images, 
+            coalesce(
+                (
+                    SELECT jsonb_agg(
                         jsonb_build_object(
-                            :jsonb_build_object_1, product_inventory.id, 
-                            :jsonb_build_object_2, product_inventory.meta, 
-                            :jsonb_build_object_3, CASE WHEN (product_inventory.quantity > :quantity_1) 
-                                                        THEN :param_1 
-                                                        ELSE :param_2  
-                                                   END, 
-                            :jsonb_build_object_4, product_inventory.unit_price, 
-                            :jsonb_build_object_5, product_inventory.discount
-                        )
-                    )
-                ), :coalesce_2
+                            %(jsonb_build_object_1)s, product_inventory.id, 
+                            %(jsonb_build_object_2)s, product_inventory.meta, 
+                            %(jsonb_build_object_3)s, 
+                            CASE WHEN (product_inventory.quantity > %(quantity_1)s) THEN %(param_1)s ELSE %(param_2)s END, 
+                            %(jsonb_build_object_4)s, product_inventory.unit_price, 
+                            %(jsonb_build_object_5)s, product_inventory.discount
+                        ) ORDER BY product_inventory.id
+                    ) AS jsonb_agg_1 
+                    FROM product_inventory 
+                    WHERE product_inventory.product_id = p.id
+                ), CAST(:param_3 AS JSONB)
             ) AS inventories 
+        FROM product AS p
+        """
+    )
+    assert normalize_sql(str(query)) == expected_sql
+
+
+def test_product_detail_select_strategy_fields():
+    strategy = ProductDetailSelectStrategy(alias=aliased(Product, name="p"), fields=["name", "description"])
+    query = strategy.select()
+
+    expected_sql = normalize_sql(
+        """
+        SELECT 
+            p.id, 
+            p.name, 
+            p.description 
+        FROM product AS p
+        """
+    )
+    assert normalize_sql(str(query)) == expected_sql
+
+
+def test_product_suggest_select_strategy():
+    strategy = ProductSuggestSelectStrategy(alias=aliased(Product, name="p"))
+    query = strategy.select()
+
+    expected_sql = normalize_sql(
+        """
+        SELECT 
+            p.id, 
+            p.name, 
+            coalesce(rv.reviews_count, :coalesce_1) AS weight, 
+            p.created_at 
         FROM product AS p 
-        LEFT OUTER JOIN product_image ON p.id = product_image.product_id 
-        LEFT OUTER JOIN product_inventory ON p.id = product_inventory.product_id GROUP BY p.id
+        LEFT OUTER JOIN product_rating AS rv ON rv.product_id = p.id
         """
     )
     assert normalize_sql(str(query)) == expected_sql
@@ -100,6 +230,24 @@ def test_product_activity_filtering_strategy():
         strategy.filter([True, False])
 
 
+def test_product_category_active_filtering_strategy():
+    product_alias = aliased(Product, name="p")
+
+    strategy = ProductCategoryActiveFilteringStrategy(
+        query=select(product_alias.id),
+        alias=product_alias
+    )
+    query = strategy.filter(True)
+
+    expected_sql = "SELECT p.id FROM product AS p WHERE p.category_active IS true"
+    assert normalize_sql(str(query)) == expected_sql
+
+    with pytest.raises(AssertionError):
+        strategy.filter(None)
+        strategy.filter(1)
+        strategy.filter("1")
+
+
 def test_product_category_filtering_strategy():
     product_alias = aliased(Product, name="p")
 
@@ -131,6 +279,35 @@ def test_product_category_filtering_strategy():
         strategy.filter("1")
 
 
+def test_product_attributes_filtering_strategy():
+    product_alias = aliased(Product, name="p")
+
+    strategy = ProductAttributesFilteringStrategy(
+        query=select(product_alias.id),
+        alias=product_alias
+    )
+    query = strategy.filter({"color": "Blue", "size": "M"})
+
+    expected_sql = normalize_sql(
+        """
+        SELECT 
+            p.id 
+        FROM product AS p 
+        WHERE EXISTS (
+            SELECT variant.id 
+            FROM product_inventory AS variant 
+            WHERE variant.product_id = p.id AND variant.meta @> :meta_1
+        )
+        """
+    )
+    assert normalize_sql(str(query)) == expected_sql
+    assert normalize_sql(str(strategy.filter({}))) == "SELECT p.id FROM product AS p"
+
+    with pytest.raises(AssertionError):
+        strategy.filter(None)
+        strategy.filter("color=Blue")
+
+
 def test_product_popular_filtering():
     product_alias = aliased(Product, name="p")
 
@@ -138,8 +315,7 @@ def test_product_popular_filtering():
         query=(
             select(product_alias.id)
             .select_from(product_alias)
-            .outerjoin(product_alias.reviews)
-            .group_by(product_alias.id)
+            .outerjoin(review_totals, review_totals.c.product_id == product_alias.id)
         ),
         alias=product_alias
     )
@@ -150,11 +326,9 @@ def test_product_popular_filtering():
         SELECT 
             p.id 
         FROM product AS p 
-        LEFT OUTER JOIN product_reviews ON p.id = product_reviews.product_id 
-        GROUP BY 
-            p.id 
-        HAVING 
-            avg(product_reviews.rating) >= :avg_1
+        LEFT OUTER JOIN product_rating AS rv ON rv.product_id = p.id 
+        WHERE 
+            rv.rating_sum / CAST(nullif(rv.reviews_count, :nullif_1) AS FLOAT) >= :param_1
         """
     )
     assert normalize_sql(str(query)) == expected_sql
@@ -173,8 +347,7 @@ def test_product_discount_filtering():
         query=(
             select(product_alias.id)
             .select_from(product_alias)
-            .outerjoin(product_alias.inventories)
-            .group_by(product_alias.id)
+            .outerjoin(inventory_totals, inventory_totals.c.product_id == product_alias.id)
         ),
         alias=product_alias
     )
@@ -185,11 +358,17 @@ def test_product_discount_filtering():
         SELECT 
             p.id 
         FROM product AS p 
-        LEFT OUTER JOIN product_inventory ON p.id = product_inventory.product_id 
-        GROUP BY 
-            p.id 
-        HAVING 
-            sum(product_inventory.discount) > :sum_1
+        LEFT OUTER JOIN (
+            SELECT 
+                product_inventory.product_id AS product_id, 
+                max(product_inventory.unit_price) AS price, 
+                max(product_inventory.discount) AS discount, 
+                sum(product_inventory.discount) AS discount_total 
+            FROM product_inventory 
+            GROUP BY product_inventory.product_id
+        ) AS inv ON inv.product_id = p.id 
+        WHERE 
+            inv.discount_total > :discount_total_1
         """
     )
     assert normalize_sql(str(query)) == expected_sql
@@ -208,8 +387,7 @@ def test_product_popular_ordering():
         query=(
             select(product_alias.id)
             .select_from(product_alias)
-            .outerjoin(product_alias.reviews)
-            .group_by(product_alias.id)
+            .outerjoin(review_totals, review_totals.c.product_id == product_alias.id)
         ),
         alias=product_alias
     )
@@ -220,11 +398,9 @@ def test_product_popular_ordering():
         SELECT 
             p.id 
         FROM product AS p 
-        LEFT OUTER JOIN product_reviews ON p.id = product_reviews.product_id 
-        GROUP BY 
-            p.id 
+        LEFT OUTER JOIN product_rating AS rv ON rv.product_id = p.id 
         ORDER BY 
-            avg(product_reviews.rating) ASC
+            rv.rating_sum / CAST(nullif(rv.reviews_count, :nullif_1) AS FLOAT) ASC
         """
     )
     assert normalize_sql(str(query)) == expected_sql
@@ -243,8 +419,7 @@ def test_product_discount_ordering():
         query=(
             select(product_alias.id)
             .select_from(product_alias)
-            .outerjoin(product_alias.inventories)
-            .group_by(product_alias.id)
+            .outerjoin(inventory_totals, inventory_totals.c.product_id == product_alias.id)
         ),
         alias=product_alias
     )
@@ -255,11 +430,17 @@ def test_product_discount_ordering():
         SELECT 
             p.id 
         FROM product AS p 
-        LEFT OUTER JOIN product_inventory ON p.id = product_inventory.product_id 
-        GROUP BY 
-            p.id 
+        LEFT OUTER JOIN (
+            SELECT 
+                product_inventory.product_id AS product_id, 
+                max(product_inventory.unit_price) AS price, 
+                max(product_inventory.discount) AS discount, 
+                sum(product_inventory.discount) AS discount_total 
+            FROM product_inventory 
+            GROUP BY product_inventory.product_id
+        ) AS inv ON inv.product_id = p.id 
         ORDER BY 
-            sum(product_inventory.discount) ASC
+            inv.discount_total ASC
         """
     )
     assert normalize_sql(str(query)) == expected_sql
@@ -278,8 +459,7 @@ def test_product_price_ordering():
         query=(
             select(product_alias.id)
             .select_from(product_alias)
-            .outerjoin(product_alias.inventories)
-            .group_by(product_alias.id)
+            .outerjoin(inventory_totals, inventory_totals.c.product_id == product_alias.id)
         ),
         alias=product_alias
     )
@@ -290,11 +470,17 @@ def test_product_price_ordering():
         SELECT 
             p.id 
         FROM product AS p 
-        LEFT OUTER JOIN product_inventory ON p.id = product_inventory.product_id 
-        GROUP BY 
-            p.id 
+        LEFT OUTER JOIN (
+            SELECT 
+                product_inventory.product_id AS product_id, 
+                max(product_inventory.unit_price) AS price, 
+                max(product_inventory.discount) AS discount, 
+                sum(product_inventory.discount) AS discount_total 
+            FROM product_inventory 
+            GROUP BY product_inventory.product_id
+        ) AS inv ON inv.product_id = p.id 
         ORDER BY 
-            max(product_inventory.unit_price) ASC
+            inv.price ASC
         """
     )
     assert normalize_sql(str(query)) == expected_sql
@@ -304,3 +490,51 @@ def test_product_price_ordering():
         strategy.sort(1)
         strategy.sort(False)
         strategy.sort("1")
+
+
+def test_product_search_filtering():
+    product_alias = aliased(Product, name="p")
+
+    strategy = ProductSearchFilteringStrategy(
+        query=select(product_alias.id),
+        alias=product_alias
+    )
+    query = strategy.filter("red sneakers")
+
+    expected_sql = normalize_sql(
+        """
+        SELECT p.id 
+        FROM product AS p 
+        WHERE p.search_document @@ websearch_to_tsquery(:param_1, :websearch_to_tsquery_1)
+        """
+    )
+    assert normalize_sql(str(query)) == expected_sql
+
+    with pytest.raises(AssertionError):
+        strategy.filter(["red"])
+
+
+def test_product_arrived_before_filtering():
+    product_alias = aliased(Product, name="p")
+
+    strategy = ProductArrivedBeforeFilteringStrategy(
+        query=select(product_alias.id),
+        alias=product_alias
+    )
+    query = strategy.filter(str(uuid4()))
+
+    expected_sql = normalize_sql(
+        """
+        SELECT p.id 
+        FROM product AS p 
+        WHERE (p.created_at, p.id) < ((
+            SELECT previous.created_at FROM product AS previous WHERE previous.id = :arrived_before
+        ), :arrived_before)
+        """
+    )
+    assert normalize_sql(str(query)) == expected_sql
+
+    with pytest.raises(AssertionError):
+        strategy.filter(None)
+    with pytest.raises(ValueError):
+        strategy.filter("not an id")
@@ -0,0 +1,45 @@
+from uuid import uuid4
+
+import pytest
+from sqlalchemy.orm import aliased
+
+from db.models import Product
+from db.strategies import common, products
+from db.strategies.context import QueryContext
+
+
+def _query_context() -> QueryContext:
+    return QueryContext(
+        select_strategy=products.ProductListSelectStrategy(alias=aliased(Product, name="p")),
+        filtering_strategies={
+            "activity": products.ProductActivityFilteringStrategy,
+            "category": products.ProductCategoryFilteringStrategy,
+            "search": common.NameSearchFilteringStrategy,
+        },
+        ordering_strategies={"id": common.IDOrderingStrategy, "new": common.CreatedOrderingStrategy}
+    )
+
+
+def test_filters_apply_in_strategy_order():
+    first, second = _query_context(), _query_context()
+
+    first.filtering(search="chair", activity=True, category=uuid4())
+    second.filtering(category=uuid4(), activity=True, search="table")
+
+    assert str(first.query) == str(second.query)
+    assert str(first.query).index("p.is_active") < str(first.query).index("lower(p.name)")
+
+
+def test_repeated_ordering_fields_are_dropped():
+    first, second = _query_context(), _query_context()
+
+    first.ordering(["-new", "id", "new", "-id"])
+    second.ordering(["-new", "id"])
+
+    assert str(first.query) == str(second.query)
+    assert str(first.query).endswith("ORDER BY p.created_at DESC, p.id ASC")
+
+
+def test_unknown_filter():
+    with pytest.raises(ValueError):
+        _query_context().filtering(unknown=True)
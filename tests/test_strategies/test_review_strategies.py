@@ -0,0 +1,23 @@
+from sqlalchemy.orm import aliased
+
+from db.models import ProductReview
+from db.strategies.reviews import ReviewListSelectStrategy
+from tests.test_strategies.utils import normalize_sql
+
+
+def test_review_list_select_strategy():
+    strategy = ReviewListSelectStrategy(alias=aliased(ProductReview, name="pr"))
+    query = strategy.select()
+
+    expected_sql = normalize_sql(
+        """
+        SELECT 
+            pr.id, 
+            pr.author_name AS fullname, 
+            pr.rating, 
+            pr.comment, 
+            pr.created_at 
+        FROM product_reviews AS pr
+        """
+    )
+    assert normalize_sql(str(query)) == expected_sql